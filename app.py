@@ -1,30 +1,48 @@
 """
 Central bootstrap – nothing but wiring.
-Run with:  python app.py
+Run with:  python app.py            (dev server)
+      or:  gunicorn wsgi:app        (production, see README)
+
+Nothing happens at import time: the spawn process pools (tbag.program,
+tbag.exports) re-import the main module in every worker, and a worker
+must not open the DB, start background threads or claim GPIO lines.
+Build the app through `create_app()` and start it under the
+``__main__`` guard.
 """
 
 from flask import Flask
-from tbag import config, db
-from tbag.blueprints import kiosk, admin, components, projects, logs   # ← added *components*
-
-# ── ensure database schema exists ───────────────────────────────────
-db.init()
-
-# ── Flask app ───────────────────────────────────────────────────────
-app = Flask(
-    __name__,
-    template_folder="templates",
-    static_folder="static"
-)
-app.secret_key = config.SECRET
-
-# ── register blueprints ─────────────────────────────────────────────
-app.register_blueprint(kiosk.bp)
-app.register_blueprint(admin.bp,       url_prefix="/admin")
-app.register_blueprint(components.bp)                    # ← NEW
-app.register_blueprint(projects.bp)
-app.register_blueprint(logs.bp)
+
+
+def create_app() -> Flask:
+    from tbag import config, db
+    from tbag.blueprints import kiosk, admin, components, projects, logs   # ← added *components*
+
+    # ── ensure database schema exists ───────────────────────────────
+    db.init()
+    db.start_maintenance()        # idle-time log archive + incremental VACUUM
+
+    # ── Flask app ───────────────────────────────────────────────────
+    app = Flask(
+        __name__,
+        template_folder="templates",
+        static_folder="static"
+    )
+    app.secret_key = config.SECRET
+
+    # ── register blueprints ─────────────────────────────────────────
+    app.register_blueprint(kiosk.bp)
+    app.register_blueprint(admin.bp,       url_prefix="/admin")
+    app.register_blueprint(components.bp)                    # ← NEW
+    app.register_blueprint(projects.bp)
+    app.register_blueprint(logs.bp)
+    return app
+
 
 # ── dev server (prod → gunicorn) ────────────────────────────────────
 if __name__ == "__main__":
+    from tbag import db
+
+    app = create_app()
+    # werkzeug serves each request on a fresh thread → return its connection
+    app.teardown_appcontext(lambda exc: db.release())
     app.run(host="0.0.0.0", port=8000, debug=False)
@@ -15,13 +15,9 @@ const alarmSound = document.getElementById('alarmSound');
 
 // Session state
 let session = null;
-let seq = [];
+let plan = [];   // server-compiled steps: { comp, name, image, label, manual, … }
 let idx = -1;
 
-// Component data maps
-let compImgMap = {};  // { id: 'image.png' }
-let compNameMap = {}; // { id: 'Component Name' }
-
 // Foot pedal / space bar listener
 document.addEventListener('DOMContentLoaded', () => {
   let spacePressStart = null;
@@ -55,32 +51,44 @@ const jFetch = (url, data) =>
   });
 
 /* ---------- Primary Application Flow ---------------------------------- */
+// Long-poll: the server holds the request until the run queue changes
+// (204 = nothing new within its window → simply ask again).
 async function waitForJob() {
+  let version = -1;
   while (true) {
-    const queue = await fetch('/api/pending').then(r => r.json());
-    if (queue.length) {
-      const sid = queue[0].session_id;
-      const resp = await jFetch('/api/claim', { session_id: sid });
-      if (resp.ok) return resp.json();
+    let resp;
+    try {
+      resp = await fetch(`/api/pending/wait?since=${version}`);
+    } catch (e) {
+      await sleep(2000);              // server restarting / network blip
+      continue;
+    }
+    if (resp.status === 204) continue;
+    if (!resp.ok) { await sleep(2000); continue; }
+
+    const data = await resp.json();
+    version = data.version;
+    if (data.queue.length) {
+      const sid = data.queue[0].session_id;
+      const claim = await jFetch('/api/claim', { session_id: sid });
+      if (claim.ok) return claim.json();
     }
-    await sleep(2000);
   }
 }
 
 function showStep(i) {
-  const step = seq[i] ?? {};
+  const step = plan[i] ?? {};
 
   // Update component name, instruction label, and step counter
-  compNameEl.textContent = compNameMap[step.comp] || '-';
+  compNameEl.textContent = step.name || '-';
   labelEl.textContent = step.label ?? '';
-  statusEl.textContent = `Step ${i + 1} / ${seq.length}`;
+  statusEl.textContent = `Step ${i + 1} / ${plan.length}`;
 
   // Update image
-  const imgFile = compImgMap[step.comp];
-  imgEl.src = imgFile ? `/comp_assets/${step.comp}/${imgFile}` : '';
-  imgEl.hidden = !imgFile;
+  imgEl.src = step.image || '';
+  imgEl.hidden = !step.image;
 
-  nextBtn.textContent = (i === seq.length - 1) ? 'Review' : 'Next Step';
+  nextBtn.textContent = (i === plan.length - 1) ? 'Review' : 'Next Step';
 
   // Handle manual steps
   if (step.manual) {
@@ -102,41 +110,55 @@ function send(action, extra = {}) {
   return jFetch('/api/progress', { action, session_id: session.session_id, ...extra });
 }
 
-async function advance() {
-  idx++;
-  if (idx < seq.length) {
-    showStep(idx);
-    await send('next', { component: seq[idx].comp, position: seq[idx].teachpoint });
-  } else {
-    // Ensure modal/sound are turned off at the end
-    if (manualModal) manualModal.classList.remove('active');
-    if (alarmSound) {
-      alarmSound.pause();
-      alarmSound.currentTime = 0;
-    }
+// finish / abort the server has not confirmed yet – Next retries it
+let ending = null;
 
-    nextBtn.disabled = stopBtn.disabled = true;
-    labelEl.textContent = 'Preparing summary…';
-    await send('finish');
-    await sleep(200);
-    location.href = `/session/${session.session_id}`;
+async function end() {
+  nextBtn.disabled = stopBtn.disabled = true;
+  labelEl.textContent = ending.busy;
+  let ok = false;
+  try {
+    ok = (await send(ending.action, ending.extra)).ok;
+  } catch (e) { /* server restarting / network blip */ }
+  if (!ok) {
+    labelEl.textContent = `Not saved – press Retry to ${ending.action} again`;
+    nextBtn.textContent = 'Retry';
+    nextBtn.disabled = false;
+    return;
   }
+  await sleep(200);
+  ending.then();
 }
 
-async function abort() {
-  if (!confirm('Interrupt this assembly?')) return;
-  // Ensure modal/sound are turned off on abort
+function quiet() {
   if (manualModal) manualModal.classList.remove('active');
   if (alarmSound) {
     alarmSound.pause();
     alarmSound.currentTime = 0;
   }
+}
 
-  nextBtn.disabled = stopBtn.disabled = true;
-  labelEl.textContent = 'Aborting…';
-  await send('abort', { step: idx });
-  await sleep(300);
-  location.reload();
+async function advance() {
+  if (ending) return end();
+  idx++;
+  if (idx < plan.length) {
+    showStep(idx);
+    await send('next', { step: idx });
+  } else {
+    quiet();                  // modal/sound off at the end
+    ending = { action: 'finish', extra: {}, busy: 'Preparing summary…',
+               then: () => { location.href = `/session/${session.session_id}`; } };
+    await end();
+  }
+}
+
+async function abort() {
+  if (ending) return;
+  if (!confirm('Interrupt this assembly?')) return;
+  quiet();                    // modal/sound off on abort
+  ending = { action: 'abort', extra: { step: idx }, busy: 'Aborting…',
+             then: () => location.reload() };
+  await end();
 }
 
 /* ---------- WebSocket Client ------------------------------------------ */
@@ -183,15 +205,10 @@ function connectWebSocket() {
 
 /* ---------- Bootstrap on Page Load ------------------------------------ */
 (async () => {
-  // 1. Fetch component data first to build our lookup maps
-  const components = await fetch('/components/json').then(r => r.json());
-  compImgMap = Object.fromEntries(components.filter(c => c.image).map(c => [c.id, c.image]));
-  compNameMap = Object.fromEntries(components.map(c => [c.id, c.name]));
-
-  // 2. Wait for a session to be assigned
+  // 1–2. Wait for a session to be assigned (the claim carries the plan)
   const data = await waitForJob();
   session = data.session;
-  seq = data.sequence;
+  plan = data.plan;
 
   // 3. Populate the structured header with session details
   document.getElementById('metaProject').textContent = session.project;
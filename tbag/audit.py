@@ -0,0 +1,199 @@
+"""
+tbag.audit
+──────────
+Integrity checks for the hash-chained `events` table (see `tbag.db`,
+"audit chain").
+
+The chain is cut into segments of `CHECKPOINT_EVERY` rows, each closed by
+a row in `audit_checkpoints`.  A segment is verified by re-hashing only
+its own rows from the previous checkpoint's hash and comparing every
+stored hash plus the closing checkpoint; gaps in `seq` (deleted rows)
+fail too.  So:
+
+• `verify_session()` re-hashes just the segments that hold the session
+• `verify_dates()`   re-hashes the segments whose time span overlaps
+• `verify_all()`     is incremental – segments already verified (stamped
+  ``ts_verified``) are only re-checked with ``full=True``
+• `head()`           is the latest checkpoint; write it down (report,
+  ticket) and any later rewrite of the history before it shows
+
+The open tail after the last checkpoint (< `CHECKPOINT_EVERY` rows) is
+re-hashed whenever a check touches it.  Segments some of whose rows were
+moved out by `tbag.db.archive_old()` (checkpoint flagged ``archived``) are
+re-hashed from the monthly archives listed in `audit_archived` plus the
+live rows – counted in ``archived``; a missing archive is a problem.
+"""
+from __future__ import annotations
+
+import datetime
+import hmac
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .db import (CHECKPOINT_EVERY, GENESIS, _ts_us, archive_months,
+                 archive_reader, chain_hash, connect, flush)
+
+
+def _segment(seq: int) -> int:
+    """First seq of the segment holding *seq*."""
+    return (seq - 1) // CHECKPOINT_EVERY * CHECKPOINT_EVERY + 1
+
+
+_ROWS = """SELECT seq, ts_us, ts, kind, session_id, payload, seq_no, hash
+             FROM events WHERE seq BETWEEN ? AND ? ORDER BY seq"""
+
+
+def _rows(c, first: int, last: int) -> Tuple[Iterable[tuple], Optional[Dict]]:
+    """
+    Rows *first*…*last* by seq – live ones, plus those moved to an archive
+    if the segment is flagged ``archived`` → (rows, None | problem).
+    """
+    if not c.execute("SELECT 1 FROM audit_checkpoints WHERE seq_last=? AND archived",
+                     (last,)).fetchone():
+        return c.execute(_ROWS, (first, last)), None
+    months = [r[0] for r in c.execute(
+        "SELECT month FROM audit_archived WHERE seq_last=?", (last,))]
+    rows = {r[0]: tuple(r) for r in c.execute(_ROWS, (first, last))}
+    for month in months or archive_months():     # archived before the list existed
+        try:
+            with archive_reader(month) as a:
+                rows.update((r[0], tuple(r)) for r in a.execute(_ROWS, (first, last)))
+        except FileNotFoundError:
+            return (), {"seq": first, "error": f"archive {month} missing"}
+    return [rows[s] for s in sorted(rows)], None
+
+
+def _check_segment(c, first: int) -> Tuple[int, Optional[Dict]]:
+    """Re-hash the segment starting at *first* → (rows, None | problem)."""
+    last = first + CHECKPOINT_EVERY - 1
+    rows, problem = _rows(c, first, last)
+    if problem:
+        return 0, problem
+    if first == 1:
+        prev = GENESIS
+    else:
+        row = c.execute("SELECT hash FROM audit_checkpoints WHERE seq_last=?",
+                        (first - 1,)).fetchone()
+        if row is None:
+            return 0, {"seq": first - 1, "error": "checkpoint missing"}
+        prev = row[0]
+
+    expect = first
+    for seq, ts_us, ts, kind, sid, payload, seq_no, h in rows:
+        if seq != expect:
+            return seq - first, {"seq": expect, "error": "row missing"}
+        prev = chain_hash(prev, seq, ts_us, ts, kind, sid, payload, seq_no)
+        if not hmac.compare_digest(prev, h or b""):
+            return seq - first + 1, {"seq": seq, "error": "hash mismatch"}
+        expect += 1
+    n = expect - first
+
+    cp = c.execute("SELECT hash FROM audit_checkpoints WHERE seq_last=?",
+                   (last,)).fetchone()
+    if cp is None:
+        if c.execute("SELECT 1 FROM events WHERE seq > ? LIMIT 1", (last,)).fetchone():
+            return n, {"seq": last, "error": "checkpoint missing"}
+        return n, None                            # open tail
+    if expect != last + 1:
+        return n, {"seq": expect, "error": "row missing"}
+    if not hmac.compare_digest(cp[0], prev):
+        return n, {"seq": last, "error": "checkpoint mismatch"}
+    return n, None
+
+
+def _verify(segments: Iterable[int]) -> Dict:
+    flush()                                       # include still-queued events
+    c = connect()
+    segments = sorted(set(segments))
+    result: Dict = {"ok": True, "segments": len(segments), "rows": 0,
+                    "archived": 0, "problems": []}
+    verified: List[int] = []
+    archived = {r[0] for r in c.execute(
+        "SELECT seq_last FROM audit_checkpoints WHERE archived")}
+    for first in segments:
+        n, problem = _check_segment(c, first)
+        result["archived"] += first + CHECKPOINT_EVERY - 1 in archived
+        result["rows"] += n
+        if problem:
+            result["ok"] = False
+            result["problems"].append(problem)
+        else:
+            verified.append(first + CHECKPOINT_EVERY - 1)
+    if verified:
+        now = datetime.datetime.now().isoformat(timespec="seconds")
+        with c:
+            c.executemany("UPDATE audit_checkpoints SET ts_verified=? WHERE seq_last=?",
+                          [(now, s) for s in verified])
+    return result
+
+
+def verify_segments(firsts: Iterable[int]) -> Dict:
+    """Check the segments starting at the given seqs (see `_segment`)."""
+    return _verify(firsts)
+
+
+def _tail(c) -> Optional[int]:
+    row = c.execute("SELECT max(seq) FROM events").fetchone()
+    return _segment(row[0]) if row and row[0] else None
+
+
+def verify_session(sid: str) -> Dict:
+    """Check every segment that holds an event of *sid*."""
+    flush()
+    seqs = [r[0] for r in connect().execute(
+        "SELECT seq FROM events WHERE session_id=? AND seq IS NOT NULL", (sid,))]
+    result = _verify({_segment(s) for s in seqs})
+    result["events"] = len(seqs)
+    return result
+
+
+def verify_dates(date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict:
+    """
+    Check the segments with events between *date_from* and *date_to*
+    (ISO days, inclusive; either may be omitted).
+    """
+    lo = _ts_us(date.fromisoformat(date_from).isoformat()) if date_from else None
+    hi = (_ts_us((date.fromisoformat(date_to) + timedelta(days=1)).isoformat())
+          if date_to else None)
+    flush()
+    c = connect()
+    segments = {r[0] - CHECKPOINT_EVERY + 1 for r in c.execute(
+        """SELECT seq_last FROM audit_checkpoints
+            WHERE (? IS NULL OR ts_us_max >= ?) AND (? IS NULL OR ts_us_min < ?)""",
+        (lo, lo, hi, hi))}
+    tail = _tail(c)
+    if tail is not None and tail not in segments:
+        span = c.execute("SELECT min(ts_us), max(ts_us) FROM events WHERE seq >= ?",
+                         (tail,)).fetchone()
+        if span[0] is not None and (lo is None or span[1] >= lo) \
+                and (hi is None or span[0] < hi):
+            segments.add(tail)
+    return _verify(segments)
+
+
+def verify_all(full: bool = False) -> Dict:
+    """Check segments not verified yet (all of them with *full*) + the tail."""
+    flush()
+    c = connect()
+    sql = "SELECT seq_last FROM audit_checkpoints"
+    if not full:
+        sql += " WHERE ts_verified IS NULL"
+    segments = {r[0] - CHECKPOINT_EVERY + 1 for r in c.execute(sql)}
+    tail = _tail(c)
+    if tail is not None:
+        segments.add(tail)
+    return _verify(segments)
+
+
+def head() -> Dict:
+    """Latest checkpoint (``seq``, hex ``hash``) – the value to anchor externally."""
+    row = connect().execute(
+        "SELECT seq_last, hash FROM audit_checkpoints ORDER BY seq_last DESC LIMIT 1"
+    ).fetchone()
+    if row is None:
+        return {"seq": 0, "hash": GENESIS.hex()}
+    return {"seq": row[0], "hash": row[1].hex()}
+
+
+__all__ = ["verify_session", "verify_dates", "verify_all", "verify_segments",
+           "head"]
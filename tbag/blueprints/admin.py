@@ -1,15 +1,15 @@
 """
-Admin views – dashboard, session queue, device list (fixed).
+Admin views – dashboard, session queue, fleet devices.
 """
 from __future__ import annotations
 
 import datetime
-import sqlite3
 import uuid
 
 from flask import Blueprint, abort, jsonify, redirect, render_template, request
 
-from ..config import DB_FILE
+from .. import fleet
+from ..db import connect, notify_runs_changed, runs_version, tombstones_floor
 from ..helpers.projects import load_config, projects_list
 from ..helpers.settings import load_settings, save_settings
 from ..helpers.components import ALLOWED_GPIO_PINS, GPIO_LABELS
@@ -65,12 +65,61 @@ def dashboard():
 def sessions():
     return render_template("admin_sessions.html")
 
+_PAGE_SIZE = 50
+
 @bp.get("/sessions/json")
 def sessions_json():
-    with sqlite3.connect(DB_FILE) as c:
-        c.row_factory = sqlite3.Row
-        rows = c.execute("SELECT * FROM runs ORDER BY ts_created DESC").fetchall()
-    return jsonify([dict(r) for r in rows])
+    """
+    Versioned run feed (``version`` = `counters.runs`, also sent as ETag).
+
+    * ``?since=<v>``             – rows changed / deleted after *v*;
+                                   ``304`` when nothing changed; first
+                                   page + ``reset`` when *v* is older
+                                   than the pruned tombstones
+    * ``?before=<ts>|<sid>``     – next page of history (newest first)
+    * no arguments               – first page
+    """
+    since = request.args.get("since", type=int)
+    version = runs_version()        # read first: rows may only be *newer*
+    etag = f"runs-{version}"
+
+    if since is not None and (since == version
+                              or request.if_none_match.contains(etag)):
+        return "", 304, {"ETag": f'"{etag}"'}
+
+    reset = since is not None and since < tombstones_floor()
+    if reset:                       # deletions since *v* are forgotten
+        since = None
+
+    limit = max(1, min(request.args.get("limit", _PAGE_SIZE, type=int), 500))
+    deleted: list[str] = []
+    with connect() as c:
+        if since is not None:
+            rows = c.execute(
+                "SELECT * FROM runs WHERE version > ? ORDER BY ts_created DESC",
+                (since,),
+            ).fetchall()
+            deleted = [r[0] for r in c.execute(
+                "SELECT session_id FROM runs_deleted WHERE version > ?", (since,)
+            )]
+        else:
+            ts, _, sid = request.args.get("before", "").partition("|")
+            rows = c.execute(
+                """SELECT * FROM runs
+                    WHERE ? = '' OR ts_created < ?
+                       OR (ts_created = ? AND session_id < ?)
+                    ORDER BY ts_created DESC, session_id DESC
+                    LIMIT ?""",
+                (ts, ts, ts, sid, limit),
+            ).fetchall()
+
+    nxt = None
+    if since is None and len(rows) == limit:
+        nxt = f"{rows[-1]['ts_created']}|{rows[-1]['session_id']}"
+    resp = jsonify(version=version, rows=[dict(r) for r in rows],
+                   deleted=deleted, next=nxt, reset=reset)
+    resp.set_etag(etag)
+    return resp
 
 @bp.post("/sessions/new")
 def sessions_new():
@@ -83,7 +132,9 @@ def sessions_new():
         status="pending",
         device=request.form.get("device") or None,
     )
-    with sqlite3.connect(DB_FILE) as c:
+    if payload["device"] == "any":        # unassigned: first free station
+        payload["device"] = None
+    with connect() as c:
         c.execute(
             """INSERT INTO runs(session_id, project, stack_id, operator,
                                 ts_created, status, device)
@@ -91,20 +142,56 @@ def sessions_new():
                       :ts_created, :status, :device)""",
             payload,
         )
+    notify_runs_changed()              # wake the kiosk's /api/pending/wait
     return redirect("/admin/sessions")
 
 @bp.post("/sessions/<sid>/delete")
 def sessions_delete(sid: str):
-    with sqlite3.connect(DB_FILE) as c:
+    with connect() as c:
         deleted = c.execute(
             "DELETE FROM runs WHERE session_id=? AND status='pending'", (sid,)
         ).rowcount
     if not deleted:
         abort(400, "Cannot delete — session already active or finished.")
+    notify_runs_changed()
     return redirect("/admin/sessions")
 
-# ───────── fixed device list ───────
+# ───────── devices (fleet stations) ───────
+def _devices_page(new_token: str | None = None, device_id: str | None = None):
+    return render_template("admin_devices.html", devices=fleet.devices(),
+                           waiting=fleet.dispatcher.waiting(),
+                           new_token=new_token, token_device=device_id)
+
+@bp.get("/devices")
+def devices():
+    return _devices_page()
+
+@bp.post("/devices/new")
+def devices_new():
+    device_id = request.form.get("device_id", "").strip()
+    if not device_id or device_id in ("any", "local-pi"):
+        abort(400, "invalid device id")
+    try:
+        token = fleet.register(device_id, request.form.get("description", "").strip())
+    except ValueError as exc:
+        abort(409, str(exc))
+    return _devices_page(token, device_id)        # token is shown only once
+
+@bp.post("/devices/<device_id>/token")
+def devices_token(device_id: str):
+    try:
+        token = fleet.issue_token(device_id)
+    except KeyError:
+        abort(404, "device not found")
+    return _devices_page(token, device_id)
+
+@bp.post("/devices/<device_id>/delete")
+def devices_delete(device_id: str):
+    fleet.remove(device_id)
+    return redirect("/admin/devices")
+
 @bp.get("/devices/json")
 def devices_json():
-    """Return the two hard-coded device choices."""
-    return jsonify(["any", "local-pi"])
+    """Target choices for new runs: any station, the local Pi, then the stations."""
+    ids = [d["device_id"] for d in fleet.devices()]
+    return jsonify(["any", "local-pi"] + [d for d in ids if d != "local-pi"])
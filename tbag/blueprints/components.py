@@ -20,7 +20,7 @@ from ..helpers.components import (
     COMPONENTS,
     ALLOWED_GPIO_PINS,
     GPIO_LABELS,          # ← labels “L1…L23”
-    components_list,
+    catalog,
     load_component,
     save_component,
     new_component_slug,
@@ -32,12 +32,9 @@ bp = Blueprint("componentsBP", __name__)
 @bp.get("/components")
 def list_components_route():
     comps = []
-    for p in components_list():
-        cfg = load_component(p.name)
-        if not cfg:
-            continue
+    for cid, cfg in catalog.items():
         comps.append({
-            "id": p.name,
+            "id": cid,
             "name": cfg["name"],
             "image": cfg.get("image"),
             "default_thickness": cfg.get("default_thickness", 0.0),
@@ -52,13 +49,12 @@ def components_json():
     return jsonify(
         [
             {
-                "id": p.name,
+                "id": cid,
                 "name": cfg["name"],
                 "image": cfg.get("image"),  # may be None
                 "default_thickness": cfg.get("default_thickness", 0.0),
             }
-            for p in components_list()
-            if (cfg := load_component(p.name))              # cfg is not None here
+            for cid, cfg in catalog.items()
         ]
     )
 
@@ -72,9 +68,8 @@ def new_component():
 
         # duplicate-name check (case-insensitive, None-safe)
         duplicate = any(
-            (cfg := load_component(p.name))
-            and cfg.get("name", "").lower() == name.lower()
-            for p in components_list()
+            cfg.get("name", "").lower() == name.lower()
+            for _, cfg in catalog.items()
         )
         if duplicate:
             return render_template(
@@ -150,6 +145,7 @@ def delete_component(cid):
     import shutil
 
     shutil.rmtree(COMPONENTS / cid, ignore_errors=True)
+    catalog.invalidate(cid)
     return redirect("/components")
 
 
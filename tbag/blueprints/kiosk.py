@@ -5,73 +5,117 @@ Shop-floor runtime for the Raspberry Pi.
 """
 
 from __future__ import annotations
-import datetime, sqlite3, time
-from typing import Dict, Optional
+import datetime, sqlite3, threading
+from typing import Dict, NamedTuple, Optional, Tuple
 from flask import Blueprint, abort, jsonify, render_template, request
 
-from ..config import DEVICE_ID
-from ..db     import DB_FILE, log
-from ..gpio   import LED, Button
-from ..helpers.components import ALLOWED_GPIO_PINS, load_component
+from ..config import CENTRAL_URL, DEVICE_ID
+from ..db     import (append_events, connect, durable, event_row, flush, log,
+                      notify_runs_changed, touch_presence, wait_runs_changed)
+from ..fleet  import authenticate, claim_next, ingest
+from ..       import sync
+from ..gpio   import Button, output_bank
+from ..logbook import session_metrics
+from ..helpers.components import ALLOWED_GPIO_PINS, catalog as components
 from ..helpers.projects    import load_config
-from ..helpers.settings    import load_settings
-
-# gpiod reset (unchanged) ------------------------------------------------
-try:
-    import gpiod                         # type: ignore
-    _HAS_GPIOD = True
-except ImportError:
-    _HAS_GPIOD = False
-
-# LED helpers (unchanged) ------------------------------------------------
-_led_cache: Dict[int, LED] = {}
-_current_pin: Optional[int] = None
-def _led(pin:int)->LED:
-    if pin not in _led_cache:
-        _led_cache[pin]=LED(pin)
-    return _led_cache[pin]
+from ..helpers.settings    import led_pin
+
+# LED helpers -------------------------------------------------------------
+# One long-lived driver for all outputs (tbag.gpio.output_bank): switching
+# an LED is a state change, never a pin setup / teardown.
+_PEDAL_PIN = 20                     # BCM 20 doubles as L17 – the pedal wins
+pedal = Button(_PEDAL_PIN) if hasattr(Button,"__call__") else Button()
+_leds = output_bank(p for p in ALLOWED_GPIO_PINS if p != _PEDAL_PIN)
+
+# A broken LED must never fail a step that is already logged: warn and go on.
 def _activate_led(pin:Optional[int])->None:
-    global _current_pin
-    if pin==_current_pin: return
-    if _current_pin is not None:
-        try:_led(_current_pin).off()
-        finally:_led(_current_pin).close();_led_cache.pop(_current_pin,None)
-    _current_pin=None
-    if pin is not None:
-        try:_led(pin).on();_current_pin=pin
-        except Exception as exc:
-            print(f"[WARN] cannot switch LED on GPIO {pin}: {exc}",flush=True)
-            try:_led(pin).close()
-            finally:_led_cache.pop(pin,None)
+    try:
+        _leds.only(pin)
+    except Exception as exc:
+        print(f"[WARN] cannot switch LED on GPIO {pin}: {exc}",flush=True)
+
 def _reset_all_leds()->None:
-    for pin in ALLOWED_GPIO_PINS:
-        if _HAS_GPIOD:
-            try:
-                chip=gpiod.Chip("gpiochip0");line=chip.get_line(pin)
-                line.request(consumer="tbag-force-reset",
-                             type=gpiod.LINE_REQ_DIR_OUT,default_vals=[0])
-                time.sleep(0.005)
-            except Exception: pass
-            finally:
-                try: line.release(), chip.close()
-                except Exception: pass
-        try: led=LED(pin);led.off();led.close()
-        except Exception: pass
-        _led_cache.pop(pin,None)
-    global _current_pin; _current_pin=None
+    try:
+        _leds.all_off()
+    except Exception as exc:
+        print(f"[WARN] cannot reset LEDs: {exc}",flush=True)
+
+# Execution plans ---------------------------------------------------------
+# Built once per session at claim time: everything the kiosk shows and the
+# GPIO pin each step lights, so /api/progress is an index into a tuple.
+class PlanStep(NamedTuple):
+    comp:       str
+    name:       str
+    image:      Optional[str]          # ready-to-use URL
+    label:      str
+    teachpoint: str
+    pin:        Optional[int]
+    thickness:  float
+    manual:     bool
+
+Plan = Tuple[PlanStep, ...]
+
+_plans: Dict[str, Plan] = {}
+_remote_plans: Dict[str, Plan] = {}   # station: plans sent by the server
+_plans_lock = threading.Lock()
+
+def _compile_plan(sequence: list) -> Plan:
+    steps = []
+    for step in sequence:
+        cid  = step.get("comp", "")
+        comp = components.get(cid) or {}
+        img  = comp.get("image")
+        tp   = (step.get("teachpoint") or "").strip().upper()
+        steps.append(PlanStep(
+            comp       = cid,
+            name       = comp.get("name", "-"),
+            image      = f"/comp_assets/{cid}/{img}" if img else None,
+            label      = step.get("label", ""),
+            teachpoint = tp,
+            pin        = led_pin(tp) if tp else None,
+            thickness  = float(step.get("thickness") or 0.0),
+            manual     = bool(step.get("manual", False)),
+        ))
+    return tuple(steps)
+
+def _plan_for(sid: str, project: Optional[str] = None) -> Plan:
+    """Cached plan for *sid*; rebuilt from `runs` if another worker claimed."""
+    plan = _plans.get(sid) or _remote_plans.get(sid)
+    if plan is None:
+        if project is None:
+            row = connect().execute(
+                "SELECT project FROM runs WHERE session_id=?", (sid,)
+            ).fetchone()
+            if row is None:
+                return ()
+            project = row["project"]
+        cfg = load_config(project) or {"sequence": []}
+        plan = _compile_plan(cfg["sequence"])
+        with _plans_lock:
+            _plans[sid] = plan
+    return plan
+
+def _drop_plan(sid: str) -> None:
+    with _plans_lock:
+        _plans.pop(sid, None)
+
+def _remote_plan(steps: list) -> Plan:
+    """Server plan → local one: our own LED mapping, images from the server."""
+    return tuple(PlanStep(**{
+        **st,
+        "pin":   led_pin(st["teachpoint"]) if st["teachpoint"] else None,
+        "image": f"{CENTRAL_URL}{st['image']}" if st["image"] else None,
+    }) for st in steps)
 
 # Flask blueprint -------------------------------------------------------
 bp = Blueprint("kiosk", __name__)
-pedal = Button(20) if hasattr(Button,"__call__") else Button()
 
 @bp.route("/")
 def index():                       # inject fixed id for the Pi kiosk
     return render_template("index.html", device_id="local-pi")
 
-@bp.get("/api/pending")
-def pending():
-    with sqlite3.connect(DB_FILE) as c:
-        c.row_factory=sqlite3.Row
+def _pending_rows() -> list[dict]:
+    with connect() as c:
         rows=c.execute(
             """
             SELECT session_id,project,stack_id,operator,ts_created
@@ -80,7 +124,60 @@ def pending():
               AND (device IS NULL OR device = '' OR device='local-pi')
             ORDER BY ts_created
             """).fetchall()
-    return jsonify([dict(r) for r in rows])
+    return [dict(r) for r in rows]
+
+@bp.get("/api/pending")
+def pending():
+    return jsonify(_pending_rows())
+
+# ── long-poll: answer as soon as the run queue changes ─────────────────
+_WAIT_MAX_SEC = 25                 # stay well under proxy / gunicorn timeouts
+_RETRY_SEC    = 5                  # station: pause before asking the server again
+
+@bp.get("/api/pending/wait")
+def pending_wait():
+    """
+    ``?since=<version>`` – hold the request until the `runs` table changes
+    (or `_WAIT_MAX_SEC` passes → 204).  Only then is the queue queried.
+    """
+    since = request.args.get("since", -1, type=int)
+    wait = _WAIT_MAX_SEC
+    if sync.enabled and not _pending_rows():
+        wait = _fetch_remote_run()       # the server did the long wait
+    version = wait_runs_changed(since, wait)
+    if version == since:
+        return "", 204
+    return jsonify(version=version, queue=_pending_rows())
+
+def _fetch_remote_run() -> float:
+    """
+    Station: pull the next run from the server into the local queue;
+    → seconds to wait locally before asking again.
+    """
+    sync.uploader.kick()                 # flush any journal left from offline
+    try:
+        got, retry = sync.fetch_run(_WAIT_MAX_SEC)
+    except (OSError, ValueError) as exc:
+        print(f"[WARN] central server unreachable: {exc}", flush=True)
+        return _RETRY_SEC
+    if got is None:
+        return retry
+    run = got["session"]
+    with _plans_lock:
+        _remote_plans[run["session_id"]] = _remote_plan(got["plan"])
+    with connect() as c:                 # re-queued as well if we lost it
+        queued = c.execute(
+            """INSERT INTO runs(session_id, project, stack_id, operator,
+                                ts_created, status, device)
+               VALUES(?,?,?,?,?, 'pending', 'local-pi')
+               ON CONFLICT(session_id) DO UPDATE SET status = 'pending'
+               WHERE status = 'active'""",
+            (run["session_id"], run["project"], run["stack_id"],
+             run["operator"], run["ts_created"])).rowcount
+    if not queued:                       # done here, end event not uploaded yet
+        return _RETRY_SEC
+    notify_runs_changed()
+    return 0
 
 # ── ONLY LOCALHOST MAY CLAIM ───────────────────────────────────────────
 @bp.post("/api/claim")
@@ -96,8 +193,7 @@ def claim():
     if not sid:
         abort(400, "session_id missing")
 
-    with sqlite3.connect(DB_FILE) as c:
-        c.row_factory = sqlite3.Row
+    with connect() as c:
         run = c.execute(
             """
             UPDATE runs
@@ -116,70 +212,140 @@ def claim():
         abort(409, "session already claimed or not found")
 
     _reset_all_leds()
-    cfg = load_config(run["project"]) or {"sequence": []}
+    _drop_plan(sid)                      # recipe may have changed since
+    plan = _plan_for(sid, run["project"])
     return jsonify(status="claimed",
                    session=dict(run),
-                   sequence=cfg["sequence"])
+                   plan=[st._asdict() for st in plan])
 
 
 # -------- progress / finish / abort (unchanged) -------------------------
 @bp.post("/api/progress")
 def progress():
     data = request.get_json(force=True)
-    sid  = data["session_id"]
-    act  = data["action"]
+    return _apply_progress(data, leds=True)
+
+def _apply_progress(data: dict, leds: bool, device: Optional[str] = None):
+    """Record one progress action; *device* (fleet) must own the run."""
+    try:
+        sid, act = str(data["session_id"]), data["action"]
+    except (KeyError, TypeError):
+        abort(400, "session_id and action required")
+    if act not in ("next", "finish", "abort"):
+        abort(400, f"unknown action {act!r}")
     now  = datetime.datetime.now().isoformat(timespec="seconds")
 
+    if device is not None:               # closed runs too: finish retries
+        row = connect().execute(
+            "SELECT device, status FROM runs WHERE session_id=?",
+            (sid,)).fetchone()
+        if (row is None or row["device"] != device
+                or act == "next" and row["status"] != "active"):
+            abort(409, "session is not active on this device")
+
     if act == "next":
-        comp_id = data.get("component")
-        position = data.get("position")  # Teachpoint like 'P1'
-        
-        pin = None
-        if position:
-            settings = load_settings()
-            led_map = settings.get("led_mapping", {})
-            pin = led_map.get(position.upper())
-
-        if pin is not None:
-            try:
-                _activate_led(int(pin))
-            except (ValueError, TypeError):
-                print(f"[WARN] invalid LED pin for position {position}: {pin}", flush=True)
-
-        log("next_pressed", {"session_id": sid, "component": comp_id, "position": position})
+        plan = _plan_for(sid)
+        try:
+            step = plan[int(data["step"])]
+        except (KeyError, IndexError, TypeError, ValueError):
+            abort(400, "step index missing or out of range")
+
+        if leds and step.pin is not None:
+            _activate_led(step.pin)
+
+        log("next_pressed", {"session_id": sid, "component": step.comp,
+                             "position": step.teachpoint or None})
+        sync.uploader.kick()
         return jsonify(status="ok")
 
-    with sqlite3.connect(DB_FILE) as conn:
-        cur = conn.cursor()
-        if act == "finish":
-            cur.execute(
-                "UPDATE runs SET status='finished', ts_finished=? "
-                "WHERE session_id=? AND status='active'",
-                (now, sid),
-            )
-        elif act == "abort":
-            cur.execute(
-                "UPDATE runs SET status='aborted', ts_finished=?, interrupted_at=? "
-                "WHERE session_id=? AND status='active'",
-                (now, data.get("step"), sid),
-            )
-        conn.commit()
+    # The end event goes in with the status change (one fsynced
+    # transaction), so a retry or a late second finish finds the run
+    # closed and is answered from the stored state – no second event,
+    # no second duration in session_metrics.
+    status = "finished" if act == "finish" else "aborted"
+    flush()                              # the session's steps come first
+    try:
+        with durable(connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(
+                    "UPDATE runs SET status=?, ts_finished=?, interrupted_at=? "
+                    "WHERE session_id=? AND status='active'",
+                    (status, now, data.get("step") if act == "abort" else None,
+                     sid)).rowcount:
+                append_events(conn, [event_row(
+                    "session_end" if act == "finish" else "session_abort",
+                    {"session_id": sid, "step": data.get("step")}
+                    if act == "abort" else {"session_id": sid})])
+            else:
+                row = conn.execute("SELECT status FROM runs WHERE session_id=?",
+                                   (sid,)).fetchone()
+                if row is None or row["status"] != status:
+                    abort(409, "session is not active")
+    except sqlite3.Error as exc:         # nothing written – the client retries
+        print(f"[WARN] cannot {act} {sid}: {exc}", flush=True)
+        return jsonify(status="error",
+                       error=f"{act} not saved – retry"), 503
 
-    _reset_all_leds()
-    log("session_end" if act == "finish" else "session_abort",
-        {"session_id": sid, "step": data.get("step")} if act == "abort" else {"session_id": sid})
+    if leds:
+        _reset_all_leds()
+    _drop_plan(sid)
+    with _plans_lock:
+        _remote_plans.pop(sid, None)
+    sync.uploader.kick()                 # on the server soon after
     return jsonify(status=act)
 
+# -------- fleet stations (bearer token, see tbag.fleet) ------------------
+# Remote kiosks drive their own LEDs from the plan's `pin`s; here we only
+# hand out runs and record progress.
+def _station() -> str:
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    device = authenticate(token.strip()) if scheme.lower() == "bearer" else None
+    if device is None:
+        abort(401, "unknown or missing device token")
+    touch_presence(device)               # heartbeat: memory only
+    return device
+
+@bp.post("/api/fleet/claim")
+def fleet_claim():
+    """
+    Long-poll: ``?wait=<s>`` (≤ 25) – answers with the claimed run as soon
+    as the dispatcher hands one to this station, or ``204`` on timeout.
+    While `CLAIM_PARK_MAX` stations are parked the claim is not held; its
+    204 carries ``Retry-After``.
+    """
+    device = _station()
+    run, retry = claim_next(device, request.args.get("wait", 25, type=float))
+    if run is None:
+        return "", 204, {"Retry-After": f"{retry:g}"}
+    plan = _plan_for(run["session_id"], run["project"])
+    return jsonify(status="claimed", session=run,
+                   plan=[st._asdict() for st in plan])
+
+@bp.post("/api/fleet/progress")
+def fleet_progress():
+    device = _station()
+    return _apply_progress(request.get_json(force=True), leds=False, device=device)
+
+@bp.post("/api/fleet/sync")
+def fleet_sync():
+    """Station journal batch: ``{"entries": [{session_id, seq_no, ts, kind, payload}]}``."""
+    device = _station()
+    entries = (request.get_json(force=True) or {}).get("entries") or []
+    try:
+        return jsonify(ingest(device, entries))
+    except (KeyError, TypeError, ValueError):
+        abort(400, "malformed journal entries")
+
 # -------- summary page --------------------------------------------------
 @bp.route("/session/<sid>")
 def session_overview(sid: str):
-    with sqlite3.connect(DB_FILE) as c:
-        c.row_factory = sqlite3.Row
+    with connect() as c:
         run = c.execute("SELECT * FROM runs WHERE session_id=?", (sid,)).fetchone()
     if run is None:
         abort(404, "session not found")
     cfg = load_config(run["project"]) or {"sequence": []}
-    return render_template("summary.html", run=run, total_steps=len(cfg["sequence"]))
+    return render_template("summary.html", run=run, total_steps=len(cfg["sequence"]),
+                           metrics=session_metrics(sid))
 
 # -------- pedal helper (unchanged) -------------------------------------
 @bp.get("/pedal")
@@ -1,42 +1,156 @@
 """
 Logs / XLS export endpoints
 ───────────────────────────
-• /logs              – session overview table
+• /logs              – session overview table; ?project= ?operator= ?status=
+                       ?date_from= ?date_to= filter, ?before= pages
 • /logs/<sid>        – timeline of a single session
-• /logs/export       – overview → Excel
+• /logs/export       – overview → Excel (same filters)
 • /logs/<sid>/export – timeline  → Excel
+• /logs/bulk/<table>.<fmt> – raw runs / events as csv or parquet
+                       (tbag.bulk), same filters as the overview
+• /logs/jobs         – background exports (tbag.exports): POST to start,
+                       GET to list, /logs/jobs/<id>/file when done
+• /logs/verify       – audit chain check (tbag.audit): ?date_from=
+                       ?date_to= range, else everything not yet verified
+                       (?full=1 re-checks all); /logs/<sid>/verify per session
+
+?archive=YYYY-MM on the overview, a timeline or its export reads that
+month's archive (tbag.db.archive_reader) instead of the live database.
 """
-from flask import Blueprint, render_template, send_file, abort
-from ..logbook import overview_rows, timeline, export_overview, export_detail
+import contextlib
+from flask import (Blueprint, Response, render_template, abort, request,
+                   jsonify, send_file)
+from .. import audit, bulk, exports
+from ..helpers import parquet
+from ..db import archive_months, archive_path, archive_reader
+from ..logbook import (CSV_MIME, XLSX_MIME, OVERVIEW_FILTERS, overview_page,
+                       overview_projects, timeline,
+                       export_overview, export_detail)
 
 bp = Blueprint("logsBP", __name__)
 
-# ── overview – one row per session ────────────────────────────────────────
+def _filters() -> dict:
+    """Active overview filters from the query string (blank ones dropped)."""
+    return {k: v for k in OVERVIEW_FILTERS
+            if (v := request.args.get(k, "").strip())}
+
+def _archive() -> str:
+    """``?archive=`` month ('' = live database); 404 if there is no such archive."""
+    month = request.args.get("archive", "").strip()
+    if month:
+        try:
+            found = archive_path(month).exists()
+        except ValueError:
+            found = False
+        if not found:
+            abort(404, f"no log archive for {month}")
+    return month
+
+def _reading(month: str):
+    return archive_reader(month) if month else contextlib.nullcontext()
+
+def _streamed(month: str, chunks):
+    """Run the export generator *chunks* () against *month*'s archive."""
+    with _reading(month):
+        yield from chunks()
+
+# ── overview – one row per session, filtered + paged in SQL ──────────────
 @bp.get("/logs")
 def overview():
-    return render_template("logs_overview.html", rows=overview_rows())
+    filters = _filters()
+    before  = request.args.get("before", "")
+    month   = _archive()
+    with _reading(month):
+        rows, nxt = overview_page(filters, before)
+        projects = overview_projects()
+    return render_template("logs_overview.html", rows=rows, next=nxt,
+                           filters=filters, paged=bool(before),
+                           projects=projects, archive=month,
+                           archives=archive_months())
 
 # ── per-session timeline ──────────────────────────────────────────────────
 @bp.get("/logs/<sid>")
 def detail(sid):
-    evs = timeline(sid)
+    month = _archive()
+    with _reading(month):
+        evs = timeline(sid)
     if not evs:
         abort(404, f"no events for session {sid}")
-    return render_template("log_detail.html", events=evs, sid=sid)
+    return render_template("log_detail.html", events=evs, sid=sid, archive=month)
+
+# ── export helpers (streamed while the rows are read) ──────────────────
+def _xlsx_response(chunks, filename):
+    return Response(chunks, mimetype=XLSX_MIME, headers={
+        "Content-Disposition": f"attachment; filename={filename}"})
 
-# ── export helpers ────────────────────────────────────────────────────────
 @bp.get("/logs/export")
 def xl_overview():
-    return send_file(export_overview(), as_attachment=True,
-                     download_name="sessions.xlsx",
-                     mimetype=("application/"
-                               "vnd.openxmlformats-officedocument."
-                               "spreadsheetml.sheet"))
+    return _xlsx_response(export_overview(_filters()), "sessions.xlsx")
 
 @bp.get("/logs/<sid>/export")
 def xl_detail(sid):
-    return send_file(export_detail(sid), as_attachment=True,
-                     download_name=f"{sid}.xlsx",
-                     mimetype=("application/"
-                               "vnd.openxmlformats-officedocument."
-                               "spreadsheetml.sheet"))
+    month = _archive()
+    return _xlsx_response(_streamed(month, lambda: export_detail(sid)), f"{sid}.xlsx")
+
+# ── bulk analytics dumps (streamed) ───────────────────────────────────────
+@bp.get("/logs/bulk/<table>.<fmt>")
+def bulk_dump(table, fmt):
+    try:
+        chunks = bulk.dump(table, fmt, _filters())
+    except KeyError:
+        abort(404, "use /logs/bulk/{runs,events}.{csv,parquet}")
+    except ImportError:
+        abort(501, "parquet dumps need pyarrow installed – use .csv")
+    return Response(chunks, mimetype=CSV_MIME if fmt == "csv" else parquet.MIME,
+                    headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"})
+
+# ── background export jobs ───────────────────────────────────────────────
+@bp.post("/logs/jobs")
+def job_start():
+    """``fmt`` (xlsx | csv) + the overview filters, as form or JSON."""
+    data = request.get_json(silent=True) or request.form
+    try:
+        job = exports.submit({k: str(data.get(k) or "").strip()
+                              for k in OVERVIEW_FILTERS},
+                             data.get("fmt", "xlsx"))
+    except ValueError as exc:
+        abort(400, str(exc))
+    return jsonify(job), 202
+
+@bp.get("/logs/jobs")
+def job_list():
+    return jsonify(exports.recent())
+
+@bp.get("/logs/jobs/<job_id>")
+def job_status(job_id):
+    job = exports.get(job_id)
+    if job is None:
+        abort(404, "no such export")
+    return jsonify(job)
+
+@bp.get("/logs/jobs/<job_id>/file")
+def job_file(job_id):
+    job = exports.get(job_id)
+    if job is None:
+        abort(404, "no such export")
+    path = exports.job_path(job)
+    if job["status"] != "done" or not path.exists():
+        abort(409, f"export is {job['status']}")
+    return send_file(path, as_attachment=True,
+                     download_name=f"sessions_{job['ts_created'][:10]}.{job['fmt']}",
+                     mimetype=CSV_MIME if job["fmt"] == "csv" else XLSX_MIME)
+
+# ── audit chain verification ──────────────────────────────────────────────
+@bp.get("/logs/verify")
+def verify():
+    lo, hi = request.args.get("date_from"), request.args.get("date_to")
+    try:
+        result = (audit.verify_dates(lo, hi) if lo or hi
+                  else audit.verify_all(full=request.args.get("full") == "1"))
+    except ValueError:
+        abort(400, "date_from / date_to must be YYYY-MM-DD")
+    return jsonify(dict(result, head=audit.head()))
+
+@bp.get("/logs/<sid>/verify")
+def verify_session(sid):
+    return jsonify(dict(audit.verify_session(sid), head=audit.head()))
@@ -10,19 +10,24 @@ Project-library (process-recipe) management UI
 from __future__ import annotations
 from flask import (
     Blueprint, render_template, request, redirect,
-    send_from_directory, jsonify, abort, Response
+    send_file, send_from_directory, jsonify, abort, Response
 )
 import werkzeug.datastructures as wz
-import uuid, pathlib
+import uuid, pathlib, re, tempfile, zipfile
 
 # ─── Canonical helper layer ──────────────────────────────────────────────
 #   ☞ THIS replaces the old “projects_helpers” import everywhere.
 from ..helpers.projects import (
-    projects_list, load_config, save_config, new_project_slug, PROJECTS
+    load_config, save_config, new_project_slug, PROJECTS,
+    catalog as project_catalog,
 )
 
-from ..helpers.components import load_component
-from ..components_helpers import list_components          # component library
+from ..helpers.components import catalog as component_catalog
+from ..db import connect
+from ..program import (
+    compile_many, compile_program, encode_chunks,
+    program_archive, program_cache, program_key,
+)
 
 bp = Blueprint("projects", __name__)                      # /projects…
 
@@ -32,8 +37,8 @@ bp = Blueprint("projects", __name__)                      # /projects…
 @bp.get("/projects/json")
 def projects_json():
     data = [
-        {"id": p.name, "name": load_config(p.name)["name"], "default_thickness": load_component(p.name).get("default_thickness", 0.0) if load_component(p.name) else 0.0}
-        for p in projects_list() if load_config(p.name)
+        {"id": pid, "name": cfg["name"]}
+        for pid, cfg in project_catalog.items()
     ]
     return jsonify(data)
 
@@ -42,8 +47,8 @@ def projects_json():
 @bp.get("/projects")
 def list_projects():
     projs = [
-        {"id": p.name, "name": load_config(p.name)["name"]}
-        for p in projects_list() if load_config(p.name)
+        {"id": pid, "name": cfg["name"]}
+        for pid, cfg in project_catalog.items()
     ]
     return render_template("project_list.html", projects=projs)
 
@@ -54,9 +59,8 @@ def new():
     if request.method == "POST":
         name = request.form["proj_name"].strip()
         # uniqueness check (case-insensitive)
-        for p in projects_list():
-            cfg = load_config(p.name)
-            if cfg and cfg["name"].lower() == name.lower():
+        for _, cfg in project_catalog.items():
+            if cfg["name"].lower() == name.lower():
                 return render_template(
                     "project_new.html",
                     error=f'Project “{name}” already exists.'
@@ -110,11 +114,12 @@ def edit(pid: str):
         return redirect("/projects")
 
     # GET – render editor
-    components = list_components()             # dropdown options
-    # Enrich components with default_thickness for the frontend
-    for c in components:
-        c_cfg = load_component(c['id'])
-        c['default_thickness'] = c_cfg.get('default_thickness', 0.0) if c_cfg else 0.0
+    # dropdown options, enriched with default_thickness for the frontend
+    components = [
+        {**c_cfg, "id": cid,
+         "default_thickness": c_cfg.get("default_thickness", 0.0)}
+        for cid, c_cfg in component_catalog.items()
+    ]
 
     return render_template(
         "project_edit.html",
@@ -133,186 +138,82 @@ def download_program(pid: str):
     if not cfg:
         abort(404, f"Project {pid!r} not found")
 
-    settings = load_settings()
-    tps = settings.get("teachpoints", {})
-
-    sequence   = cfg.get("sequence", [])
-
-    # Global clearance height is taken from P22 Z
-    clearance_z = float(tps.get("P22", {}).get("z", 39.0))
-    home_tp_name = "P22"
-    dest_tp_name = "P21"
-
-    # Pre-calculate pick offsets for each source teachpoint
-    # A step's pick offset is the sum of thicknesses of all subsequent items picked from the SAME teachpoint.
-    pick_offsets = []
-    for i in range(len(sequence)):
-        step = sequence[i]
-        src_tp = step.get("teachpoint", "P1").strip().upper()
-        if not src_tp:
-            src_tp = "P1"
-        offset = 0.0
-        for j in range(i + 1, len(sequence)):
-            next_tp = sequence[j].get("teachpoint", "P1").strip().upper()
-            if not next_tp:
-                next_tp = "P1"
-            if next_tp == src_tp:
-                offset += float(sequence[j].get("thickness", 0.0))
-        pick_offsets.append((src_tp, offset))
-
-    # ── Program header ───────────────────────────────────────────────────────
-    lines = [
-        "Process Main",
-        "",
-        "int speed = 40",
-        "int acc = 40",
-        "int dec = 40",
-        "int cp = 0",
-        "",
-        "User(0)",
-        "Tool(0)",
-        "",
-        "",
-        "// --------------------------------------------------",
-        "// MOVE TO HOME POSITION (Pn22)",
-        "// --------------------------------------------------",
-        "MOVJ(Pn(22), speed, acc, dec, cp)",
-        "",
-        ""
-    ]
+    sequence = cfg.get("sequence", [])
+    tps = load_settings().get("teachpoints", {})
+
+    # content-addressed: any recipe / teachpoint edit yields a new key
+    key = program_key(sequence, tps)
+    if request.if_none_match.contains(key):
+        return Response(status=304, headers={"ETag": f'"{key}"'})
+
+    # cached → replay; otherwise compile lazily, streaming + caching chunks
+    chunks = program_cache.open(key)
+    if chunks is None:
+        chunks = program_cache.stream(
+            key, encode_chunks(compile_program(sequence, tps)))
 
-    dest_z_offset = 0.0   # accumulates target Z height per stacked layer
-    
-    for step_idx, (step, (src_tp, src_z_offset)) in enumerate(zip(sequence, pick_offsets), 1):
-        thick_val = float(step.get("thickness", 0.0))
-        label     = step.get("label", f"Component {step_idx}").strip() or f"Component {step_idx}"
-        is_manual = step.get("manual", False)
-
-        if is_manual:
-            lines.append("// ==================================================")
-            lines.append(f"// MANUAL COMPONENT {step_idx}: {label}")
-            lines.append("// Go to Home and Wait 10 seconds for human placement")
-            lines.append("// ==================================================")
-            lines.append("")
-            lines.append("MOVJ(Pn(22), speed, acc, dec, cp)")
-            lines.append("Delay(10000)")
-            lines.append("Open(2)")
-            lines.append("")
-            lines.append("")
-            dest_z_offset += thick_val
-            continue
-
-        # Resolve source TP coordinates
-        src_t_data = tps.get(src_tp, tps.get("P1", {"x": 0.0, "y": 0.0, "z": 0.0, "r": 0.0}))
-        src_x = float(src_t_data.get("x", 0.0))
-        src_y = float(src_t_data.get("y", 0.0))
-        src_base_z = float(src_t_data.get("z", 0.0))
-        src_r = float(src_t_data.get("r", 0.0))
-        
-        pick_z = src_base_z + src_z_offset
-
-        # Resolve dest TP coordinates
-        dest_t_data = tps.get(dest_tp_name, {"x": 0.0, "y": 0.0, "z": 0.0, "r": 0.0})
-        dest_x = float(dest_t_data.get("x", 0.0))
-        dest_y = float(dest_t_data.get("y", 0.0))
-        dest_base_z = float(dest_t_data.get("z", 0.0))
-        dest_r = float(dest_t_data.get("r", 0.0))
-        
-        place_z = dest_base_z + dest_z_offset
-
-        cx = f"{clearance_z:g}"
-        sx = f"{src_x:g}"; sy = f"{src_y:g}"; sr = f"{src_r:g}"
-        dx = f"{dest_x:g}"; dy = f"{dest_y:g}"; dr = f"{dest_r:g}"
-        pz = f"{pick_z:g}"
-        plz = f"{place_z:g}"
-        sbz = f"{src_base_z:g}"
-        dbz = f"{dest_base_z:g}"
-
-        lines.append("// ==================================================")
-        if step_idx == 1:
-            lines.append(f"// PICK {step_idx}  (Top component at {src_tp})")
-            lines.append(f"// Base Z = {sbz}")
-            total_comps = sum(1 for tp, _ in pick_offsets if tp == src_tp)
-            if total_comps > 1:
-                lines.append(f"// {total_comps} components \u00d7 {thick_val:g}mm")
-            lines.append(f"// Top Z = {pz}")
-        elif step_idx == len(sequence):
-            lines.append(f"// PICK {step_idx}  (Last component, base Z = {sbz})")
-        else:
-            lines.append(f"// PICK {step_idx}  (Z = {pz})")
-        lines.append("// ==================================================")
-        lines.append("")
-
-        if step_idx == 1:
-            lines.append(f"// Move above {src_tp} at global clearance height")
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{cx},{sr},1), speed, acc, dec, cp)")
-            lines.append("")
-            lines.append(f"// Descend to top component ({pz})")
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{pz},{sr},1), speed, acc, dec, cp)")
-            lines.append("Open(0)")
-            lines.append("Open(2)")
-            lines.append("Delay(1000)")
-            lines.append("")
-            lines.append("// Retract vertically to clearance")
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{cx},{sr},1), speed, acc, dec, cp)")
-            lines.append("")
-            lines.append("")
-        else:
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{cx},{sr},1), speed, acc, dec, cp)")
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{pz},{sr},1), speed, acc, dec, cp)")
-            lines.append("Open(0)")
-            lines.append("Open(2)")
-            lines.append("Delay(1000)")
-            lines.append(f"MOVL(BuildPoint({sx},{sy},{cx},{sr},1), speed, acc, dec, cp)")
-            lines.append("")
-            lines.append("")
-
-        if step_idx == 1:
-            lines.append(f"// Place at {dest_tp_name} level 1 (stack base = {dbz})")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{cx},{dr},1), speed, acc, dec, cp)")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{plz},{dr},1), speed, acc, dec, cp)")
-            lines.append("Close(0)")
-            lines.append("Close(2)")
-            lines.append("Delay(1000)")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{cx},{dr},1), speed, acc, dec, cp)")
-            lines.append("")
-            lines.append("")
-        else:
-            lines.append(f"// Place level {step_idx} ({plz})")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{cx},{dr},1), speed, acc, dec, cp)")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{plz},{dr},1), speed, acc, dec, cp)")
-            lines.append("Close(0)")
-            lines.append("Close(2)")
-            lines.append("Delay(1000)")
-            lines.append(f"MOVL(BuildPoint({dx},{dy},{cx},{dr},1), speed, acc, dec, cp)")
-            lines.append("")
-            lines.append("")
-
-        dest_z_offset += thick_val
-
-    # ── Return to home P22 ───────────────────────────────────────────────────
-    lines.append("// --------------------------------------------------")
-    lines.append("// RETURN TO HOME")
-    lines.append("// --------------------------------------------------")
-    lines.append("MOVJ(Pn(22), speed, acc, dec, cp)")
-    lines.append("")
-    lines.append("ProcessEnd")
-
-    content = "\r\n".join(lines)
-
-    # Debug: save a local copy for inspection
-    try:
-        with open("d:/projects/ags/debug_output.pg", "w") as f:
-            f.write(content)
-    except Exception as e:
-        print(f"Failed to save debug file: {e}")
-
-    return Response(
-        content,
+    if program_archive is not None:
+        chunks = program_archive.tee(pid, key, chunks)
+
+    resp = Response(
+        chunks,
         mimetype="text/plain",
         headers={"Content-Disposition": f"attachment;filename={pid}_program.pg"}
     )
-    
+    resp.set_etag(key)
+    return resp
+
+
+# 5b) Batch: one .pg per queued run, zipped ------------------------------
+@bp.post("/projects/programs")
+def download_programs():
+    """
+    ``session_id`` (form, repeatable) or ``{"session_ids": [...]}`` of
+    *pending* runs → ZIP with one program per run.  Each distinct recipe
+    is compiled once (see `tbag.program.compile_many`).
+    """
+    from ..helpers.settings import load_settings
+
+    body = request.get_json(silent=True) or {}
+    sids = list(dict.fromkeys(body.get("session_ids")
+                              or request.form.getlist("session_id")))
+    if not sids:
+        abort(400, "session_ids missing")
+
+    with connect() as c:
+        runs = c.execute(
+            f"""SELECT session_id, project, stack_id FROM runs
+                 WHERE status='pending'
+                   AND session_id IN ({",".join("?" * len(sids))})
+                 ORDER BY ts_created""",
+            sids,
+        ).fetchall()
+    if not runs:
+        abort(404, "no pending runs among the given session ids")
+
+    recipes = {}
+    for project in dict.fromkeys(r["project"] for r in runs):
+        cfg = load_config(project)
+        if not cfg:
+            abort(404, f"Project {project!r} not found")
+        recipes[project] = cfg.get("sequence", [])
+
+    tps = load_settings().get("teachpoints", {})
+    programs = compile_many(recipes, tps)
+    if program_archive is not None:
+        for project, (key, data) in programs.items():
+            program_archive.submit(project, key, [data])
+
+    buf = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for r in runs:
+            stem = re.sub(r"[^A-Za-z0-9._-]+", "_",
+                          f"{r['project']}_{r['stack_id']}_{r['session_id']}")
+            zf.writestr(f"{stem}.pg", programs[r["project"]][1])
+    buf.seek(0)
+    return send_file(buf, as_attachment=True, download_name="programs.zip",
+                     mimetype="application/zip")
+
 
 # 6) Serve project images --------------------------------------------------
 @bp.get("/proj_assets/<pid>/<path:fname>")
@@ -0,0 +1,117 @@
+"""
+tbag.bulk
+─────────
+Bulk `runs` / `events` dumps for analytics (cycle-time studies etc.).
+
+Unlike the formatted XLSX exports in `tbag.logbook`, nothing here is
+touched per row in Python beyond handing it to a writer:
+
+• timestamps are turned into epoch seconds by SQLite – the stored
+  local wall-clock time converted to UTC (``strftime('%s', ts, 'utc')``)
+• step number (``next_pressed`` rows only – other events have none),
+  seconds since the session start and the delta to the previous event
+  come from window functions over the ``events_session_ts`` index, for
+  the whole range in one pass
+• rows stream from a live cursor into CSV (`tbag.logbook.csv_stream`) or
+  Parquet (`tbag.helpers.parquet`, needs the optional *pyarrow*); there
+  the ``*_s`` epoch columns are ``timestamp[s, tz=UTC]``
+
+Ranges use the `/logs` overview filters (``date_from`` / ``date_to`` on
+`runs.ts_created`, plus project / operator / status).
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .db import connect, flush
+from .helpers import parquet
+from .logbook import overview_where, csv_stream
+
+FORMATS = ("csv", "parquet")
+
+# (column, Parquet type – see tbag.helpers.parquet) in SELECT order below
+RUNS_SCHEMA: List[Tuple[str, str]] = [
+    ("session_id", "str"), ("project", "str"), ("stack_id", "str"),
+    ("operator", "str"), ("status", "str"), ("device", "str"),
+    ("created_s", "ts"), ("started_s", "ts"), ("finished_s", "ts"),
+    ("duration_s", "i64"), ("interrupted_at", "i64"),
+]
+
+EVENTS_SCHEMA: List[Tuple[str, str]] = [
+    ("session_id", "str"), ("project", "str"), ("stack_id", "str"),
+    ("step", "i64"), ("ts_s", "ts"), ("since_start_s", "i64"),
+    ("delta_s", "i64"), ("kind", "str"), ("component", "str"),
+    ("position", "str"),
+]
+
+# stored timestamps are naive local time (datetime.now()) → UTC epoch
+_EPOCH = "CAST(strftime('%s', {}, 'utc') AS INTEGER)"
+
+_RUNS_SQL = f"""
+    SELECT session_id, project, stack_id, operator, status, device,
+           {_EPOCH.format("ts_created")}  AS created_s,
+           {_EPOCH.format("ts_started")}  AS started_s,
+           {_EPOCH.format("ts_finished")} AS finished_s,
+           {_EPOCH.format("ts_finished")} - {_EPOCH.format("ts_started")} AS duration_s,
+           CAST(interrupted_at AS INTEGER) AS interrupted_at
+      FROM runs {{where}}
+     ORDER BY ts_created, session_id
+"""
+
+_EVENTS_SQL = f"""
+    WITH sel AS (SELECT session_id, project, stack_id FROM runs {{where}}),
+         ev  AS (
+      SELECT e.session_id, sel.project, sel.stack_id, e.ts, e.rowid AS rid,
+             {_EPOCH.format("e.ts")} AS ts_s, e.kind, e.payload
+        FROM sel JOIN events e ON e.session_id = sel.session_id)
+    SELECT session_id, project, stack_id,
+           CASE WHEN kind = 'next_pressed'      -- steps only, not end events
+                THEN SUM(kind = 'next_pressed') OVER w END AS step,
+           ts_s,
+           ts_s - FIRST_VALUE(ts_s) OVER w      AS since_start_s,
+           ts_s - LAG(ts_s) OVER w              AS delta_s,
+           kind,
+           json_extract(payload, '$.component') AS component,
+           json_extract(payload, '$.position')  AS position
+      FROM ev
+    WINDOW w AS (PARTITION BY session_id ORDER BY ts, rid)
+     ORDER BY session_id, ts, rid
+"""
+
+
+def _cursor(sql: str, filters: Optional[Dict[str, str]]):
+    where, args = overview_where(filters or {})
+    return connect().execute(
+        sql.format(where=("WHERE " + " AND ".join(where)) if where else ""), args)
+
+
+def runs_rows(filters: Optional[Dict[str, str]] = None) -> Iterator[tuple]:
+    """Matching runs in `RUNS_SCHEMA` order, oldest first."""
+    return map(tuple, _cursor(_RUNS_SQL, filters))
+
+
+def events_rows(filters: Optional[Dict[str, str]] = None) -> Iterator[tuple]:
+    """Events of the matching runs in `EVENTS_SCHEMA` order."""
+    flush()                                   # include still-queued events
+    return map(tuple, _cursor(_EVENTS_SQL, filters))
+
+
+_TABLES = {"runs": (RUNS_SCHEMA, runs_rows), "events": (EVENTS_SCHEMA, events_rows)}
+
+
+def dump(table: str, fmt: str,
+         filters: Optional[Dict[str, str]] = None) -> Iterator[bytes]:
+    """
+    *table* (runs | events) as ``csv`` or ``parquet`` chunks; KeyError if
+    unknown, ImportError for parquet without pyarrow.
+    """
+    schema, rows = _TABLES[table]
+    if fmt == "csv":
+        return csv_stream([name for name, _ in schema], rows(filters), bom=False)
+    if fmt == "parquet":
+        return parquet.write(schema, rows(filters))
+    raise KeyError(fmt)
+
+
+__all__ = ["FORMATS", "RUNS_SCHEMA", "EVENTS_SCHEMA",
+           "runs_rows", "events_rows", "dump"]
@@ -30,9 +30,39 @@ DEVICE_ID = os.getenv("TBAG_DEVICE",  "glovebox-pi")
 DATA_DIR = ROOT_DIR / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
+# ─────────────────────────────────────────── program archive (opt-in)
+# TBAG_PROGRAM_ARCHIVE=<sub-folder of data/> keeps a copy of every program
+# handed out; unset → disabled.  Only the newest …_KEEP files are kept.
+_archive = os.getenv("TBAG_PROGRAM_ARCHIVE", "").strip().strip("/\\")
+PROGRAM_ARCHIVE      = DATA_DIR / _archive if _archive else None
+PROGRAM_ARCHIVE_KEEP = int(os.getenv("TBAG_PROGRAM_ARCHIVE_KEEP", "200"))
+
+# ─────────────────────────────────────────── fleet station (opt-in)
+# Set both on a station Pi: runs are claimed from the central server and
+# the local event journal is replicated to it (tbag.sync).
+CENTRAL_URL  = os.getenv("TBAG_CENTRAL_URL", "").strip().rstrip("/") or None
+DEVICE_TOKEN = os.getenv("TBAG_DEVICE_TOKEN", "").strip()
+
+# Server: station claims parked at once (each holds a gunicorn thread);
+# keep it below --threads so the kiosk and admin pages always get one.
+CLAIM_PARK_MAX = int(os.getenv("TBAG_CLAIM_PARK_MAX", "4"))
+
+# ─────────────────────────────────────────── log retention (opt-in)
+# Finished runs older than TBAG_RETENTION_DAYS move into compressed
+# monthly archives under data/log_archive/ (0 → keep everything live).
+RETENTION_DAYS = int(os.getenv("TBAG_RETENTION_DAYS", "0"))
+LOG_ARCHIVE    = DATA_DIR / "log_archive"
+
 __all__ = [
     "PROJECTS",
     "DATA_DIR",
+    "PROGRAM_ARCHIVE",
+    "PROGRAM_ARCHIVE_KEEP",
+    "CENTRAL_URL",
+    "DEVICE_TOKEN",
+    "CLAIM_PARK_MAX",
+    "RETENTION_DAYS",
+    "LOG_ARCHIVE",
     "DB_FILE",
     "SECRET",
     "DEVICE_ID",
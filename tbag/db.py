@@ -1,21 +1,106 @@
 """DB initialisation & small helpers."""
 from __future__ import annotations
 
+import atexit
+import contextlib
 import datetime
+import gzip
+import hashlib
 import json
+import os
+import queue
+import re
+import shutil
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 
-from tbag.config import DB_FILE, DEVICE_ID
+from tbag.config import (CENTRAL_URL, DATA_DIR, DB_FILE, DEVICE_ID, LOG_ARCHIVE,
+                         RETENTION_DAYS)
+
+# ───────────────────────── connection pool ──────────────────────────────
+# One long-lived connection per thread (and per gunicorn worker – the pid
+# check drops anything inherited across fork).  Connections of threads that
+# have exited are closed when the next one is opened, and the dev server,
+# which starts a thread per request, hands its connection back with
+# `release()` at request teardown.  WAL lets the kiosk / admin pollers
+# read while a request writes; busy_timeout turns the occasional writer
+# collision into a short wait instead of “database is locked”.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",       # durable at checkpoints, no fsync/commit
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-4000",         # ≈4 MiB page cache per connection
+)
+
+_local = threading.local()
+_pool: dict[threading.Thread, sqlite3.Connection] = {}
+_pool_pid = os.getpid()
+_pool_lock = threading.Lock()
+
+
+def _open() -> sqlite3.Connection:
+    """Open + tune a fresh connection (rows come back as sqlite3.Row)."""
+    c = sqlite3.connect(DB_FILE, timeout=5.0, check_same_thread=False)
+    c.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        c.execute(pragma)
+    return c
+
+
+def close_all() -> None:
+    """Close every pooled connection opened by *this* process."""
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            return
+        while _pool:
+            try:
+                _pool.popitem()[1].close()
+            except sqlite3.Error:
+                pass
+
+
+def release() -> None:
+    """Close this thread's pooled connection (thread about to end)."""
+    c = getattr(_local, "conn", None)
+    if c is None or _local.pid != os.getpid():
+        return
+    _local.conn = None
+    with _pool_lock:
+        _pool.pop(threading.current_thread(), None)
+    c.close()
+
+
+atexit.register(close_all)
 
 # ───────────────────────── bootstrap ────────────────────────────────────
 def init() -> None:
-    with sqlite3.connect(DB_FILE) as c:
+    c = _open()                  # private – never leak a pooled conn to fork
+    try:
+        c.execute("PRAGMA auto_vacuum=INCREMENTAL")   # new DB: before any table
+        _init_schema(c)
+        if c.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            c.execute("VACUUM")  # older DB: one-time rebuild to switch modes
+    finally:
+        c.close()
+
+
+def _init_schema(c: sqlite3.Connection) -> None:
+    with c:
         c.executescript(
             """
-            /* event log */
+            /* event log – kind / session / JSON payload kept apart */
             CREATE TABLE IF NOT EXISTS events(
-              ts    TEXT,
-              event TEXT
+              ts         TEXT,
+              kind       TEXT,
+              session_id TEXT,
+              payload    TEXT,
+              seq_no     INTEGER,              -- per session; station journal only
+              seq        INTEGER,              -- audit chain: global, gap-free
+              ts_us      INTEGER,              -- epoch microseconds
+              hash       BLOB                  -- sha256(previous hash ‖ row)
             );
 
             /* run queue */
@@ -30,14 +115,22 @@ def init() -> None:
               status         TEXT CHECK(status IN
                             ('pending','active','finished','aborted')),
               interrupted_at INTEGER,
-              device         TEXT
+              device         TEXT,
+              version        INTEGER          -- `counters.runs` at last change
+            );
+
+            /* tombstones so delta readers learn about deleted runs */
+            CREATE TABLE IF NOT EXISTS runs_deleted(
+              session_id TEXT PRIMARY KEY,
+              version    INTEGER
             );
 
             /* manually registered, permanent devices */
             CREATE TABLE IF NOT EXISTS devices(
               device_id   TEXT PRIMARY KEY,
               description TEXT,
-              ts_added    TEXT
+              ts_added    TEXT,
+              token_hash  TEXT                 -- sha256 of the station token
             );
 
             /* presence-based devices: auto-add / auto-expire */
@@ -45,9 +138,65 @@ def init() -> None:
               device_id TEXT PRIMARY KEY,
               last_seen TEXT
             );
+
+            /* change counters – bumped by triggers, read by long-pollers */
+            CREATE TABLE IF NOT EXISTS counters(
+              name  TEXT PRIMARY KEY,
+              value INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO counters(name, value) VALUES('runs', 0);
+
+            /* per-session cycle times, kept current by `events_metrics` */
+            CREATE TABLE IF NOT EXISTS session_metrics(
+              session_id TEXT PRIMARY KEY,
+              ts_first   TEXT,                 -- first step event
+              ts_last    TEXT,                 -- latest step / end event
+              steps      INTEGER NOT NULL DEFAULT 0,    -- next_pressed count
+              durations  TEXT NOT NULL DEFAULT '[]',    -- JSON: s per step
+              total_s    INTEGER NOT NULL DEFAULT 0,
+              min_step_s INTEGER,
+              max_step_s INTEGER,
+              outcome    TEXT                  -- finished | aborted | NULL
+            );
+
+            /* audit chain checkpoints, one per `CHECKPOINT_EVERY` events */
+            CREATE TABLE IF NOT EXISTS audit_checkpoints(
+              seq_last    INTEGER PRIMARY KEY, -- last event of the segment
+              hash        BLOB NOT NULL,       -- chain hash at seq_last
+              ts_us_min   INTEGER,             -- event time span of the
+              ts_us_max   INTEGER,             -- segment (date lookups)
+              ts_verified TEXT,                -- last successful re-hash
+              archived    INTEGER NOT NULL DEFAULT 0   -- rows moved out
+            );
+
+            /* monthly archives holding rows of an `archived` segment */
+            CREATE TABLE IF NOT EXISTS audit_archived(
+              seq_last INTEGER NOT NULL,       -- the segment's checkpoint
+              month    TEXT NOT NULL,          -- archive_path(month)
+              PRIMARY KEY(seq_last, month)
+            );
+
+            /* background log exports (tbag.exports) */
+            CREATE TABLE IF NOT EXISTS export_jobs(
+              job_id      TEXT PRIMARY KEY,
+              cache_key   TEXT NOT NULL,       -- fmt + filters + runs version
+              fmt         TEXT NOT NULL,       -- xlsx | csv
+              params      TEXT,                -- JSON filters
+              status      TEXT NOT NULL CHECK(status IN
+                          ('queued','running','done','failed')),
+              rows_done   INTEGER NOT NULL DEFAULT 0,
+              rows_total  INTEGER,
+              size        INTEGER,
+              error       TEXT,
+              ts_created  TEXT,
+              ts_finished TEXT
+            );
             """
         )
 
+        _migrate(c)
+        c.executescript(_INDEXES_AND_TRIGGERS)
+
         # auto-insert this Pi as a *permanent* device (idempotent)
         c.execute(
             """INSERT OR IGNORE INTO devices(device_id, description, ts_added)
@@ -55,52 +204,1140 @@ def init() -> None:
             (DEVICE_ID, datetime.datetime.now().isoformat(timespec="seconds")),
         )
 
+# whole seconds from ISO timestamp {1} to {0}
+_SECS = "(CAST(strftime('%s', {0}) AS INTEGER) - CAST(strftime('%s', {1}) AS INTEGER))"
+_STEP_S = _SECS.format("NEW.ts", "ts_last")      # length of the step just closed
+
+# created after `_migrate()` so they may refer to freshly added columns
+_INDEXES_AND_TRIGGERS = f"""
+    CREATE INDEX IF NOT EXISTS events_session_ts ON events(session_id, ts);
+    /* station journal: replicated rows are keyed by (session_id, seq_no) */
+    CREATE UNIQUE INDEX IF NOT EXISTS events_seq
+        ON events(session_id, seq_no) WHERE seq_no IS NOT NULL;
+    CREATE UNIQUE INDEX IF NOT EXISTS events_chain ON events(seq);
+
+    /* audit chain: rows never change; only checkpointed history may go */
+    CREATE TRIGGER IF NOT EXISTS events_no_update BEFORE UPDATE ON events
+    BEGIN
+      SELECT RAISE(ABORT, 'events is append-only');
+    END;
+    CREATE TRIGGER IF NOT EXISTS events_no_delete BEFORE DELETE ON events
+    WHEN OLD.seq IS NULL
+      OR OLD.seq > (SELECT coalesce(max(seq_last), 0) FROM audit_checkpoints)
+    BEGIN
+      SELECT RAISE(ABORT, 'events is append-only');
+    END;
+    CREATE INDEX IF NOT EXISTS runs_version      ON runs(version);
+    CREATE INDEX IF NOT EXISTS runs_created      ON runs(ts_created, session_id);
+    /* /logs filters: equality column first, then the page order */
+    CREATE INDEX IF NOT EXISTS runs_project  ON runs(project, ts_created, session_id);
+    CREATE INDEX IF NOT EXISTS runs_status   ON runs(status, ts_created, session_id);
+    CREATE INDEX IF NOT EXISTS runs_operator
+        ON runs(operator COLLATE NOCASE, ts_created, session_id);
+    CREATE INDEX IF NOT EXISTS export_jobs_key ON export_jobs(cache_key);
+    CREATE INDEX IF NOT EXISTS devices_presence_seen ON devices_presence(last_seen);
+    CREATE UNIQUE INDEX IF NOT EXISTS devices_token ON devices(token_hash);
+
+    /* every runs change bumps counters.runs and stamps the row with it */
+    CREATE TRIGGER IF NOT EXISTS runs_bump_ins AFTER INSERT ON runs
+    BEGIN
+      UPDATE counters SET value = value + 1 WHERE name = 'runs';
+      UPDATE runs SET version = (SELECT value FROM counters WHERE name = 'runs')
+       WHERE rowid = NEW.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS runs_bump_upd AFTER UPDATE ON runs
+    WHEN NEW.version IS OLD.version            -- skip our own stamping UPDATE
+    BEGIN
+      UPDATE counters SET value = value + 1 WHERE name = 'runs';
+      UPDATE runs SET version = (SELECT value FROM counters WHERE name = 'runs')
+       WHERE rowid = NEW.rowid;
+    END;
+    CREATE TRIGGER IF NOT EXISTS runs_bump_del AFTER DELETE ON runs
+    BEGIN
+      UPDATE counters SET value = value + 1 WHERE name = 'runs';
+      INSERT OR REPLACE INTO runs_deleted(session_id, version)
+      VALUES(OLD.session_id, (SELECT value FROM counters WHERE name = 'runs'));
+    END;
+
+    /* each step / end event closes the previous step: append its length */
+    CREATE TRIGGER IF NOT EXISTS events_metrics AFTER INSERT ON events
+    WHEN NEW.session_id IS NOT NULL
+     AND NEW.kind IN ('next_pressed', 'session_end', 'session_abort')
+    BEGIN
+      INSERT INTO session_metrics(session_id, ts_first, ts_last, steps, outcome)
+      VALUES(NEW.session_id, NEW.ts, NEW.ts, NEW.kind = 'next_pressed',
+             CASE NEW.kind WHEN 'session_end'   THEN 'finished'
+                           WHEN 'session_abort' THEN 'aborted' END)
+      ON CONFLICT(session_id) DO UPDATE SET
+        durations  = json_insert(durations, '$[#]', {_STEP_S}),
+        min_step_s = min(coalesce(min_step_s, {_STEP_S}), {_STEP_S}),
+        max_step_s = max(coalesce(max_step_s, {_STEP_S}), {_STEP_S}),
+        total_s    = {_SECS.format("NEW.ts", "ts_first")},
+        steps      = steps + (NEW.kind = 'next_pressed'),
+        ts_last    = NEW.ts,
+        outcome    = coalesce(excluded.outcome, outcome);
+    END;
+"""
+
+# ───────────────────────── audit chain ──────────────────────────────────
+# Every event gets the next `seq`, a µs timestamp and
+#   hash = sha256(hash of seq-1 ‖ JSON [seq, ts_us, ts, kind, session_id,
+#                                       payload, seq_no])
+# Every `CHECKPOINT_EVERY` rows the chain hash is copied into
+# `audit_checkpoints`, so `tbag.audit` can re-hash single segments.
+CHECKPOINT_EVERY = 4096
+GENESIS = bytes(32)                               # "hash" of seq 0
+
+_INSERT_CHAINED = (
+    "INSERT {or_ignore} INTO events(ts, kind, session_id, payload, seq_no,"
+    "                               ts_us, seq, hash) VALUES(?,?,?,?,?,?,?,?)")
+
+
+_ROW_JSON = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def chain_hash(prev: bytes, seq: int, ts_us, ts, kind, sid, payload, seq_no) -> bytes:
+    """Hash of one event row given the hash of the row before it."""
+    body = _ROW_JSON((seq, ts_us, ts, kind, sid, payload, seq_no))
+    return hashlib.sha256(prev + body.encode()).digest()
+
+
+def _chain_head(c: sqlite3.Connection) -> tuple[int, bytes]:
+    # the newest checkpoint stands in for rows archived since, so `seq`
+    # is never handed out twice
+    heads = [tuple(r) for r in (
+        c.execute("SELECT seq, hash FROM events WHERE seq IS NOT NULL "
+                  "ORDER BY seq DESC LIMIT 1").fetchone(),
+        c.execute("SELECT seq_last, hash FROM audit_checkpoints "
+                  "ORDER BY seq_last DESC LIMIT 1").fetchone()) if r]
+    return max(heads) if heads else (0, GENESIS)
+
+
+def _checkpoint(c: sqlite3.Connection, seq: int, h: bytes) -> None:
+    c.execute(
+        """INSERT OR REPLACE INTO audit_checkpoints(seq_last, hash, ts_us_min, ts_us_max)
+           SELECT ?, ?, min(ts_us), max(ts_us) FROM events
+            WHERE seq > ? AND seq <= ?""",
+        (seq, h, seq - CHECKPOINT_EVERY, seq))
+
+
+SEQ_AUTO = 0             # `seq_no` placeholder: numbered by `append_events`
+
+
+def _number(c: sqlite3.Connection, rows) -> list:
+    """Replace `SEQ_AUTO` seq_nos by the session's max(seq_no) + 1, + 2, …"""
+    last: dict[str, int] = {}
+    out = []
+    for ts, kind, sid, payload, seq_no, ts_us in rows:
+        if seq_no == SEQ_AUTO:
+            if sid not in last:
+                last[sid] = c.execute(
+                    """SELECT coalesce(max(seq_no), 0) FROM events
+                        WHERE session_id = ? AND seq_no IS NOT NULL""",
+                    (sid,)).fetchone()[0]
+            last[sid] += 1
+            seq_no = last[sid]
+        out.append((ts, kind, sid, payload, seq_no, ts_us))
+    return out
+
+
+def append_events(c: sqlite3.Connection, rows, *, ignore: bool = False) -> int:
+    """
+    Chain and insert *rows* ``(ts, kind, session_id, payload, seq_no,
+    ts_us)`` in one IMMEDIATE transaction of *c* (commit is the caller's
+    ``with``).  A `SEQ_AUTO` seq_no gets the session's next number under
+    the same write lock, so every process numbers from the DB, not from a
+    private counter.  ``ignore=True`` skips rows whose (session_id,
+    seq_no) is already stored.  → rows inserted.
+    """
+    if not c.in_transaction:
+        c.execute("BEGIN IMMEDIATE")              # the chain head is ours
+    rows = _number(c, rows)
+    seq, prev = _chain_head(c)
+    if not ignore:                                # every row goes in
+        chained = []
+        for ts, kind, sid, payload, seq_no, ts_us in rows:
+            seq += 1
+            prev = chain_hash(prev, seq, ts_us, ts, kind, sid, payload, seq_no)
+            chained.append((ts, kind, sid, payload, seq_no, ts_us, seq, prev))
+            if seq % CHECKPOINT_EVERY == 0:
+                c.executemany(_INSERT_CHAINED.format(or_ignore=""), chained)
+                chained = []
+                _checkpoint(c, seq, prev)
+        c.executemany(_INSERT_CHAINED.format(or_ignore=""), chained)
+        return len(rows)
+    sql = _INSERT_CHAINED.format(or_ignore="OR IGNORE")
+    n = 0
+    for ts, kind, sid, payload, seq_no, ts_us in rows:
+        h = chain_hash(prev, seq + 1, ts_us, ts, kind, sid, payload, seq_no)
+        if c.execute(sql, (ts, kind, sid, payload, seq_no, ts_us,
+                           seq + 1, h)).rowcount:
+            seq, prev, n = seq + 1, h, n + 1
+            if seq % CHECKPOINT_EVERY == 0:
+                _checkpoint(c, seq, h)
+    return n
+
+
+def _ts_us(ts: str | None) -> int | None:
+    try:
+        return int(datetime.datetime.fromisoformat(ts).timestamp() * 1_000_000)
+    except (TypeError, ValueError):
+        return None
+
+
+def _chain_legacy(c: sqlite3.Connection) -> None:
+    """Chain rows written before v7, oldest first (one-time)."""
+    seq, prev = _chain_head(c)
+    rows = c.execute(
+        """SELECT rowid, ts, kind, session_id, payload, seq_no FROM events
+            WHERE seq IS NULL ORDER BY ts, rowid""").fetchall()
+    updates = []
+    for rowid, ts, kind, sid, payload, seq_no in rows:
+        seq += 1
+        ts_us = _ts_us(ts)
+        prev = chain_hash(prev, seq, ts_us, ts, kind, sid, payload, seq_no)
+        updates.append((seq, ts_us, prev, rowid))
+        if seq % CHECKPOINT_EVERY == 0:
+            c.executemany("UPDATE events SET seq=?, ts_us=?, hash=? WHERE rowid=?",
+                          updates)
+            updates = []
+            _checkpoint(c, seq, prev)
+    c.executemany("UPDATE events SET seq=?, ts_us=?, hash=? WHERE rowid=?", updates)
+
+
+# ───────────────────────── migrations ───────────────────────────────────
+_SCHEMA_VERSION = 10     # bump + add a step below whenever the schema moves
+
+
+def _split_legacy_event(raw: str) -> tuple[str, str | None, str | None]:
+    """Old rows stored ``kind::json`` in one column → (kind, session, payload)."""
+    if "::" not in raw:
+        return raw, None, None
+    kind, blob = raw.split("::", 1)
+    try:
+        payload = json.loads(blob)
+    except ValueError:
+        return kind, None, None
+    sid = payload.get("session_id") if isinstance(payload, dict) else None
+    return kind, sid, json.dumps(payload)
+
+
+_BACKFILL_METRICS = f"""
+    WITH ev AS (
+      SELECT session_id, ts, kind,
+             {_SECS.format("ts", "LAG(ts) OVER w")} AS d,
+             ROW_NUMBER() OVER w AS n
+        FROM events
+       WHERE session_id IS NOT NULL
+         AND kind IN ('next_pressed', 'session_end', 'session_abort')
+      WINDOW w AS (PARTITION BY session_id ORDER BY ts, rowid))
+    INSERT OR REPLACE INTO session_metrics(session_id, ts_first, ts_last, steps,
+                                           durations, total_s, min_step_s,
+                                           max_step_s, outcome)
+    SELECT session_id, MIN(ts), MAX(ts), SUM(kind = 'next_pressed'),
+           (SELECT json_group_array(d) FROM
+              (SELECT d FROM ev AS e2 WHERE e2.session_id = ev.session_id
+                 AND d IS NOT NULL ORDER BY n)),
+           {_SECS.format("MAX(ts)", "MIN(ts)")}, MIN(d), MAX(d),
+           MAX(CASE kind WHEN 'session_end'   THEN 'finished'
+                         WHEN 'session_abort' THEN 'aborted' END)
+      FROM ev GROUP BY session_id
+"""
+
+
+def _migrate(c: sqlite3.Connection) -> None:
+    """One-time, idempotent upgrades of DBs created by older releases."""
+    version = c.execute("PRAGMA user_version").fetchone()[0]
+
+    if version < 1:
+        # v1 – split the legacy `events.event` blob into real columns
+        cols = {r[1] for r in c.execute("PRAGMA table_info(events)")}
+        for col in ("kind", "session_id", "payload"):
+            if col not in cols:
+                c.execute(f"ALTER TABLE events ADD COLUMN {col} TEXT")
+        if "event" in cols:
+            rows = c.execute(
+                "SELECT rowid, event FROM events "
+                "WHERE kind IS NULL AND event IS NOT NULL"
+            ).fetchall()
+            c.executemany(
+                "UPDATE events SET kind=?, session_id=?, payload=? WHERE rowid=?",
+                [(*_split_legacy_event(raw), rowid) for rowid, raw in rows],
+            )
+            c.execute("UPDATE events SET event = NULL WHERE event IS NOT NULL")
+
+    if version < 2:
+        # v2 – per-row `runs.version`.  The `runs_bump_*` triggers were
+        # added without a version bump, so a v1 DB may carry the older
+        # ones that only bumped the counter – replace them unconditionally
+        cols = {r[1] for r in c.execute("PRAGMA table_info(runs)")}
+        if "version" not in cols:
+            c.execute("ALTER TABLE runs ADD COLUMN version INTEGER")
+        for t in ("ins", "upd", "del"):
+            c.execute(f"DROP TRIGGER IF EXISTS runs_bump_{t}")
+        c.execute("UPDATE runs SET version = 0 WHERE version IS NULL")
+
+    if version < 3:
+        # v3 – runs_created gains session_id (the page tie-breaker)
+        c.execute("DROP INDEX IF EXISTS runs_created")
+
+    if version < 4:
+        # v4 – backfill `session_metrics` (the trigger only sees new events)
+        c.execute(_BACKFILL_METRICS)
+
+    if version < 5:
+        # v5 – fleet stations authenticate with a per-device token
+        cols = {r[1] for r in c.execute("PRAGMA table_info(devices)")}
+        if "token_hash" not in cols:
+            c.execute("ALTER TABLE devices ADD COLUMN token_hash TEXT")
+
+    if version < 6:
+        # v6 – per-session sequence numbers for the station journal
+        cols = {r[1] for r in c.execute("PRAGMA table_info(events)")}
+        if "seq_no" not in cols:
+            c.execute("ALTER TABLE events ADD COLUMN seq_no INTEGER")
+
+    if version < 7:
+        # v7 – audit chain: number, timestamp (µs) and hash existing rows
+        cols = {r[1] for r in c.execute("PRAGMA table_info(events)")}
+        for col, kind in (("seq", "INTEGER"), ("ts_us", "INTEGER"), ("hash", "BLOB")):
+            if col not in cols:
+                c.execute(f"ALTER TABLE events ADD COLUMN {col} {kind}")
+        _chain_legacy(c)
+
+    if version < 8:
+        # v8 – checkpoints remember segments partly moved to an archive
+        cols = {r[1] for r in c.execute("PRAGMA table_info(audit_checkpoints)")}
+        if "archived" not in cols:
+            c.execute("ALTER TABLE audit_checkpoints "
+                      "ADD COLUMN archived INTEGER NOT NULL DEFAULT 0")
+
+    if version < 9:
+        # v9 – the station upload mark (`counters.sync`) counts audit `seq`,
+        # not rowid: rowids of deleted rows can be handed out again
+        c.execute(
+            """UPDATE counters SET value = (
+                   SELECT coalesce(max(seq), 0) FROM events
+                    WHERE rowid <= counters.value)
+                WHERE name = 'sync'""")
+
+    if version < 10:
+        # v10 – v1 left the split `event` blob behind (every row twice);
+        # the column stays (no DROP COLUMN before SQLite 3.35), its data goes.
+        # `events_no_update` is re-created right after `_migrate`
+        cols = {r[1] for r in c.execute("PRAGMA table_info(events)")}
+        if "event" in cols:
+            c.execute("DROP TRIGGER IF EXISTS events_no_update")
+            c.execute("UPDATE events SET event = NULL WHERE event IS NOT NULL")
+
+    if version < _SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
 # ──────────────────────── helpers / public API ──────────────────────────
 def connect() -> sqlite3.Connection:
-    """Return a *new* connection to the TBAG SQLite DB."""
-    return sqlite3.connect(DB_FILE)
+    """
+    Return this thread's pooled connection to the TBAG SQLite DB.
+
+    Use it as before (``with connect() as c:`` commits / rolls back) but
+    never ``close()`` it – the pool does that at process exit.  Inside
+    `archive_reader()` this thread gets the read-only archive instead.
+    """
+    global _pool_pid
+    reader = getattr(_local, "archive", None)
+    if reader is not None:                    # inside `archive_reader()`
+        return reader
+    c = getattr(_local, "conn", None)
+    if c is None or _local.pid != os.getpid():
+        c = _open()
+        _local.conn, _local.pid = c, os.getpid()
+        with _pool_lock:
+            if _pool_pid != os.getpid():      # forked: parent's conns aren't ours
+                _pool.clear()
+                _pool_pid = os.getpid()
+            for t in [t for t in _pool if not t.is_alive()]:
+                with contextlib.suppress(sqlite3.Error):
+                    _pool.pop(t).close()      # owner thread has exited
+            _pool[threading.current_thread()] = c
+    return c
+
+
+@contextlib.contextmanager
+def durable(c: sqlite3.Connection):
+    """
+    ``with durable(c):`` – one transaction of *c* whose commit is fsynced
+    (``synchronous=FULL``) instead of waiting for the next checkpoint.
+    For the few writes that must survive a power cut once answered.
+    """
+    c.execute("PRAGMA synchronous=FULL")
+    try:
+        with c:
+            yield c
+    finally:
+        c.execute("PRAGMA synchronous=NORMAL")
+
+
+# ───────────────────────── event writer ─────────────────────────────────
+# `log()` only enqueues; one daemon thread per process drains the queue in
+# batched transactions so SD-card latency never sits on a request thread.
+# On a fleet station (`CENTRAL_URL` set) `events` doubles as the local
+# journal: session events get a per-session `seq_no` and `tbag.sync`
+# replicates them to the central server.
+_LOG_BATCH    = 64       # commit once this many rows are waiting …
+_LOG_INTERVAL = 0.5      # … or after this many seconds, whichever first
+_DEAD_LETTER  = DATA_DIR / "events_rejected.jsonl"   # rows the DB refused
+
+
+def _transient(exc: sqlite3.Error) -> bool:
+    """Lock contention – worth retrying the same batch later."""
+    msg = str(exc).lower()
+    return isinstance(exc, sqlite3.OperationalError) and (
+        "locked" in msg or "busy" in msg)
+
+
+def _dead_letter(row: tuple, exc: sqlite3.Error) -> None:
+    line = json.dumps({"error": str(exc), "row": row}, default=str)
+    print(f"[ERROR] event rejected by the database, kept in {_DEAD_LETTER}: "
+          f"{line}", flush=True)
+    try:
+        with open(_DEAD_LETTER, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as err:                     # the console line is all we have
+        print(f"[ERROR] cannot write {_DEAD_LETTER}: {err}", flush=True)
+
+
+class _Marker(threading.Event):
+    """
+    Flush marker; ``ok`` turns False if a row before it was refused.  A
+    marker carrying a *row* (``log(sync=True)``) queues it atomically
+    with the wait, and its batch is committed `durable`.
+    """
+
+    def __init__(self, row: tuple | None = None) -> None:
+        super().__init__()
+        self.ok = True
+        self.row = row
+
+
+class _EventWriter:
+    """Background queue → batched INSERTs.  Markers are `_Marker`s."""
+
+    _STOP = object()
+
+    def __init__(self) -> None:
+        self._q: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._rejected = 0                     # rows dead-lettered so far
+
+    # ── producer side ───────────────────────────────────────────────
+    def put(self, row: tuple) -> None:
+        self._ensure_running()
+        self._q.put(row)
+
+    def flush(self, timeout: float | None = None,
+              row: tuple | None = None) -> bool:
+        """
+        Block until everything queued so far (and *row*) is committed →
+        False if that timed out or one of the rows was refused.
+        """
+        if row is not None:
+            self._ensure_running()
+        elif not self._alive():
+            return True
+        done = _Marker(row)
+        self._q.put(done)
+        return done.wait(timeout) and done.ok
+
+    def close(self) -> None:
+        """Final drain at shutdown; idempotent."""
+        if not self._alive():
+            return
+        self._q.put(self._STOP)
+        self._thread.join(timeout=10)          # type: ignore[union-attr]
+        self._thread = None
+
+    def _alive(self) -> bool:
+        return (self._thread is not None and self._pid == os.getpid()
+                and self._thread.is_alive())
+
+    def _ensure_running(self) -> None:
+        if self._alive():
+            return
+        with self._lock:
+            if self._alive():
+                return
+            if self._pid != os.getpid():       # forked: start with a clean queue
+                self._q = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="tbag-event-writer", daemon=True
+            )
+            self._thread.start()
+
+    # ── consumer side ───────────────────────────────────────────────
+    def _run(self) -> None:
+        rows: list[tuple] = []
+        waiters: list[_Marker] = []
+        stop = False
+        while not stop:
+            try:
+                item = self._q.get(timeout=None if not rows else _LOG_INTERVAL)
+            except queue.Empty:
+                item = None
+            deadline = time.monotonic() + _LOG_INTERVAL
+            while item is not None:
+                if item is self._STOP:
+                    stop = True
+                elif isinstance(item, _Marker):
+                    if item.row is not None:
+                        rows.append(item.row)
+                    waiters.append(item)
+                else:
+                    rows.append(item)
+                if stop or waiters or len(rows) >= _LOG_BATCH:
+                    break
+                try:
+                    item = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = None
+
+            if rows:
+                rejected = self._rejected
+                rows = self._write(rows, any(w.row is not None for w in waiters))
+                if self._rejected != rejected:
+                    for w in waiters:
+                        w.ok = False
+            if not rows or stop:
+                for w in waiters:
+                    w.set()
+                waiters = []
+
+    def _write(self, rows: list[tuple], sync: bool = False) -> list[tuple]:
+        """
+        Commit *rows* (fsynced if *sync*) → the rows still to retry.  Lock
+        contention keeps the batch for the next round; any other error
+        splits it until the offending row is found, which goes to
+        `_DEAD_LETTER` so it cannot block everything logged after it.
+        """
+        try:
+            with durable(connect()) if sync else connect() as c:
+                append_events(c, rows)
+            return []
+        except sqlite3.Error as exc:
+            if _transient(exc):                # keep rows, retry next round
+                print(f"[WARN] event log write failed ({len(rows)} rows): {exc}",
+                      flush=True)
+                time.sleep(_LOG_INTERVAL)
+                return rows
+            if len(rows) == 1:
+                _dead_letter(rows[0], exc)
+                self._rejected += 1
+                return []
+        mid = len(rows) // 2
+        left = self._write(rows[:mid], sync)
+        return left + rows[mid:] if left else self._write(rows[mid:], sync)
 
 
-def log(event: str, payload: dict | None = None) -> None:
-    """Append a row to `events`."""
-    blob = event if payload is None else f"{event}::{json.dumps(payload)}"
+_writer = _EventWriter()
+atexit.register(_writer.close)     # runs before close_all() (atexit is LIFO)
+
+
+def event_row(event: str, payload: dict | None = None) -> tuple:
+    """*event* as an `append_events` row, timestamped now."""
+    sid = payload.get("session_id") if payload else None
+    ts_us = time.time_ns() // 1000
+    return (
+        datetime.datetime.fromtimestamp(ts_us / 1e6).isoformat(timespec="seconds"),
+        event,
+        sid,
+        None if payload is None else json.dumps(payload),
+        SEQ_AUTO if CENTRAL_URL and sid else None,
+        ts_us,
+    )
+
+
+def log(event: str, payload: dict | None = None, *, sync: bool = False) -> bool:
+    """
+    Append a row to `events` (session id lifted out of *payload*).
+
+    The row is timestamped now but written by the background writer;
+    pass ``sync=True`` for audit-critical events that must be on disk
+    (fsynced, see `durable`) before the caller continues – then the
+    result is False if the row was not committed within `flush()`'s
+    timeout (or was refused).
+    """
+    if sync:
+        return _writer.flush(10.0, event_row(event, payload))
+    _writer.put(event_row(event, payload))
+    return True
+
+
+def flush(timeout: float | None = 10.0) -> bool:
+    """Wait until every queued event is committed (True unless timed out / refused)."""
+    return _writer.flush(timeout)
+
+
+# run-queue change signal
+_RUNS_RECHECK_SEC = 1.0   # other workers' writes are seen within this
+
+_runs_cv = threading.Condition()
+
+
+def runs_version() -> int:
+    """Current value of the `runs` change counter (primary-key lookup)."""
+    row = connect().execute(
+        "SELECT value FROM counters WHERE name='runs'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def tombstones_floor() -> int:
+    """
+    Newest version whose `runs_deleted` tombstones were pruned: a feed
+    reader still at an older version may have missed deletions.
+    """
+    row = connect().execute(
+        "SELECT value FROM counters WHERE name='runs_deleted_floor'"
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def prune_tombstones() -> int:
+    """
+    Drop tombstones older than the previous call (so they had a full
+    maintenance period to reach every polling page) → rows removed.
+    """
     with connect() as c:
-        c.execute(
-            "INSERT INTO events VALUES(?,?)",
-            (datetime.datetime.now().isoformat(timespec="seconds"), blob),
-        )
+        mark = c.execute(
+            "SELECT value FROM counters WHERE name='runs_prune_mark'").fetchone()
+        n = 0
+        if mark is not None:
+            n = c.execute("DELETE FROM runs_deleted WHERE version <= ?",
+                          (mark[0],)).rowcount
+            c.execute("""INSERT INTO counters(name, value) VALUES('runs_deleted_floor', ?)
+                         ON CONFLICT(name) DO UPDATE SET value = excluded.value""",
+                      (mark[0],))
+        c.execute("""INSERT INTO counters(name, value)
+                     SELECT 'runs_prune_mark', value FROM counters WHERE name='runs'
+                     ON CONFLICT(name) DO UPDATE SET value = excluded.value""")
+    return n
+
+
+def notify_runs_changed() -> None:
+    """Wake long-pollers in *this* process right after a `runs` write."""
+    with _runs_cv:
+        _runs_cv.notify_all()
+
+
+def wait_runs_changed(since: int, timeout: float) -> int:
+    """
+    Block until the `runs` counter differs from *since* or *timeout*
+    seconds pass; return the latest counter value either way.
+
+    Same-process writers wake us immediately via `notify_runs_changed()`;
+    writes from other gunicorn workers are caught by a cheap re-check of
+    the counter every `_RUNS_RECHECK_SEC`.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        version = runs_version()
+        left = deadline - time.monotonic()
+        if version != since or left <= 0:
+            return version
+        with _runs_cv:
+            _runs_cv.wait(min(left, _RUNS_RECHECK_SEC))
+
 
+# ───────────────────────── presence ─────────────────────────────────────
+# Heartbeats land in an in-process map (device → last seen, oldest first),
+# so a touch is a dict update and expiry pops from the front.  A daemon
+# thread checkpoints the map to `devices_presence` every
+# `_PRESENCE_CHECKPOINT_SEC`, deletes expired rows there (index
+# `devices_presence_seen`) and picks up heartbeats other processes wrote.
+_PRESENCE_TIMEOUT_SEC    = 120   # 2-minute grace
+_PRESENCE_CHECKPOINT_SEC = 30
+
+
+class _Presence:
+    """TTL map of device heartbeats, checkpointed to SQLite."""
+
+    def __init__(self) -> None:
+        self._seen: OrderedDict[str, float] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._gone: set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+
+    # ── request side (memory only) ──────────────────────────────────
+    def touch(self, device_id: str) -> None:
+        self._ensure_running()
+        with self._lock:
+            self._seen[device_id] = time.time()
+            self._seen.move_to_end(device_id)
+            self._dirty.add(device_id)
+            self._gone.discard(device_id)
+
+    def remove(self, device_id: str) -> None:
+        self._ensure_running()
+        with self._lock:
+            self._seen.pop(device_id, None)
+            self._dirty.discard(device_id)
+            self._gone.add(device_id)
+
+    def is_present(self, device_id: str) -> bool:
+        self._ensure_running()
+        with self._lock:
+            seen = self._seen.get(device_id)
+        return seen is not None and seen >= time.time() - _PRESENCE_TIMEOUT_SEC
+
+    def current(self) -> list[str]:
+        self._ensure_running()
+        with self._lock:
+            self._expire(time.time() - _PRESENCE_TIMEOUT_SEC)
+            return list(self._seen)
+
+    def close(self) -> None:
+        """Final checkpoint at shutdown; idempotent."""
+        if not self._alive():
+            return
+        self._pid = None                        # stop the loop …
+        self._wake.set()
+        self._thread.join(timeout=10)           # type: ignore[union-attr]
+        self._thread = None
+        self._checkpoint()                      # … and write what is left
+
+    def _expire(self, cutoff: float) -> None:
+        # caller holds the lock; entries are in last-seen order
+        while self._seen:
+            device_id, seen = next(iter(self._seen.items()))
+            if seen >= cutoff:
+                break
+            del self._seen[device_id]
+            self._dirty.discard(device_id)
+
+    def _alive(self) -> bool:
+        return (self._thread is not None and self._pid == os.getpid()
+                and self._thread.is_alive())
+
+    def _ensure_running(self) -> None:
+        if self._alive():
+            return
+        with self._lock:
+            if self._alive():
+                return
+            if self._pid != os.getpid():        # forked: rebuild from the DB
+                self._seen.clear()
+                self._dirty.clear()
+                self._gone.clear()
+            self._pid = os.getpid()
+            self._wake.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="tbag-presence", daemon=True
+            )
+            self._thread.start()
+        self._checkpoint()                      # seed from the table
+
+    # ── checkpoint / sweeper ────────────────────────────────────────
+    def _run(self) -> None:
+        me = os.getpid()
+        while not self._wake.wait(_PRESENCE_CHECKPOINT_SEC) and self._pid == me:
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        cutoff = time.time() - _PRESENCE_TIMEOUT_SEC
+        with self._lock:
+            self._expire(cutoff)
+            dirty = [(d, _iso(self._seen[d])) for d in self._dirty]
+            gone = [(d,) for d in self._gone]
+            self._dirty.clear()
+            self._gone.clear()
+        try:
+            with connect() as c:
+                c.executemany(
+                    """INSERT INTO devices_presence(device_id, last_seen)
+                       VALUES(?, ?)
+                       ON CONFLICT(device_id) DO UPDATE
+                       SET last_seen = max(last_seen, excluded.last_seen)""",
+                    dirty,
+                )
+                c.executemany(
+                    "DELETE FROM devices_presence WHERE device_id=?", gone)
+                c.execute("DELETE FROM devices_presence WHERE last_seen < ?",
+                          (_iso(cutoff),))
+                rows = c.execute(
+                    "SELECT device_id, last_seen FROM devices_presence "
+                    "ORDER BY last_seen").fetchall()
+        except sqlite3.Error as exc:            # keep the map, retry next round
+            print(f"[WARN] presence checkpoint failed: {exc}", flush=True)
+            with self._lock:
+                self._dirty.update(d for d, _ in dirty if d in self._seen)
+                self._gone.update(d for (d,) in gone)
+            return
+        # merge heartbeats written by other processes
+        with self._lock:
+            merged = False
+            for device_id, last_seen in rows:
+                seen = datetime.datetime.fromisoformat(last_seen).timestamp()
+                if (device_id not in self._gone
+                        and seen > self._seen.get(device_id, 0.0) + 1):
+                    self._seen[device_id] = seen
+                    merged = True
+            if merged:                          # restore last-seen order
+                self._seen = OrderedDict(
+                    sorted(self._seen.items(), key=lambda kv: kv[1]))
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts).isoformat(timespec="seconds")
+
+
+_presence = _Presence()
+atexit.register(_presence.close)   # runs before close_all() (atexit is LIFO)
 
-# presence helpers
-_PRESENCE_TIMEOUT_SEC = 120   # 2-minute grace
 
 def touch_presence(device_id: str) -> None:
-    """Insert/update a presence heartbeat."""
-    now = datetime.datetime.now().isoformat(timespec="seconds")
-    with connect() as c:
-        c.execute(
-            """INSERT INTO devices_presence(device_id, last_seen)
-               VALUES(?, ?)
-               ON CONFLICT(device_id) DO UPDATE SET last_seen=excluded.last_seen""",
-            (device_id, now),
-        )
+    """Record a presence heartbeat (memory only; checkpointed later)."""
+    _presence.touch(device_id)
 
 
 def remove_presence(device_id: str) -> None:
-    with connect() as c:
-        c.execute("DELETE FROM devices_presence WHERE device_id=?", (device_id,))
+    _presence.remove(device_id)
+
+
+def is_present(device_id: str) -> bool:
+    """True if *device_id* was seen in the last `_PRESENCE_TIMEOUT_SEC` seconds."""
+    return _presence.is_present(device_id)
 
 
 def current_presence() -> list[str]:
     """Return device_ids seen in the last `_PRESENCE_TIMEOUT_SEC` seconds."""
-    cutoff = (
-        datetime.datetime.now() - datetime.timedelta(seconds=_PRESENCE_TIMEOUT_SEC)
-    ).isoformat(timespec="seconds")
-    with connect() as c:
-        rows = c.execute(
-            "SELECT device_id FROM devices_presence WHERE last_seen >= ?", (cutoff,)
-        ).fetchall()
-    return [r[0] for r in rows]
+    return _presence.current()
+
+
+# ───────────────────────── retention / archive ──────────────────────────
+# Finished / aborted runs older than `RETENTION_DAYS` move – runs, events
+# and session_metrics rows – into one archive DB per month of `ts_created`,
+# stored gzip-compressed as ``<LOG_ARCHIVE>/events-YYYY-MM.db.gz``.
+# `archive_reader()` unpacks one into ``.open/`` (kept until the archive
+# changes) and points `connect()` at it read-only, so `/logs` can browse it.
+#
+# Only rows behind the last audit checkpoint may leave (`events_no_delete`);
+# their segments are re-verified first, then flagged `archived` and listed
+# with the month in `audit_archived` (`tbag.audit` re-hashes them from
+# the archives plus the live rows).  Rows
+# are deleted only after the archive is fsynced in place; a work file a
+# crash leaves behind is re-packed, never thrown away.
+# A maintenance thread (`start_maintenance()`) archives and runs
+# incremental VACUUM only while the line is idle.
+_ARCHIVE_TABLES = ("runs", "events", "session_metrics")
+_ARCHIVE_INDEXES = (
+    "events_session_ts ON events(session_id, ts)",
+    "runs_created ON runs(ts_created, session_id)",
+    "runs_project ON runs(project, ts_created, session_id)",
+    "runs_status ON runs(status, ts_created, session_id)",
+    "runs_operator ON runs(operator COLLATE NOCASE, ts_created, session_id)",
+    "session_metrics_sid ON session_metrics(session_id)",
+)
+_MONTH = re.compile(r"\d{4}-\d{2}")
+_MAINT_INTERVAL = 600    # seconds between idle checks
+_IDLE_SEC       = 300    # no event for this long (and no active run) = idle
+_VACUUM_PAGES   = 256    # pages freed per incremental_vacuum step
+
+_archive_lock = threading.Lock()
+
+
+def archive_path(month: str):
+    if not _MONTH.fullmatch(month):
+        raise ValueError(f"bad archive month {month!r}")
+    return LOG_ARCHIVE / f"events-{month}.db.gz"
+
+
+def archive_months() -> list[str]:
+    """Archived months, newest first."""
+    return sorted((p.name[7:14] for p in LOG_ARCHIVE.glob("events-*.db.gz")),
+                  reverse=True)
+
+
+def _unpack(month: str):
+    """Plain copy of *month*'s archive (refreshed when the .gz changed)."""
+    src = archive_path(month)
+    dst = LOG_ARCHIVE / ".open" / f"events-{month}.db"
+    with _archive_lock:
+        if not dst.exists() or dst.stat().st_mtime < src.stat().st_mtime:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dst.with_suffix(".tmp")
+            with gzip.open(src, "rb") as fin, open(tmp, "wb") as fout:
+                shutil.copyfileobj(fin, fout, 1 << 20)
+            os.replace(tmp, dst)
+    return dst
+
+
+@contextlib.contextmanager
+def archive_reader(month: str):
+    """
+    Within the block `connect()` (this thread only) reads *month*'s archive,
+    read-only.  FileNotFoundError if there is none, ValueError on a bad month.
+    """
+    path = _unpack(month)
+    c = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True,
+                        check_same_thread=False)
+    c.row_factory = sqlite3.Row
+    prev = getattr(_local, "archive", None)
+    _local.archive = c
+    try:
+        yield c
+    finally:
+        _local.archive = prev
+        c.close()
+
+
+def _columns(c: sqlite3.Connection, table: str) -> str:
+    """Make ``arc.<table>`` match ``main.<table>`` → the column list."""
+    cols = [r[1] for r in c.execute(f"PRAGMA main.table_info({table})")]
+    c.execute(f"CREATE TABLE IF NOT EXISTS arc.{table} AS "
+              f"SELECT * FROM main.{table} WHERE 0")
+    have = {r[1] for r in c.execute(f"PRAGMA arc.table_info({table})")}
+    for col in cols:
+        if col not in have:                    # live schema moved on
+            c.execute(f"ALTER TABLE arc.{table} ADD COLUMN {col}")
+    return ", ".join(cols)
+
+
+def _work_path(month: str):
+    return LOG_ARCHIVE / f".events-{month}.work.db"
+
+
+def _pack(month: str, work) -> None:
+    """gzip *work* over *month*'s archive – fsynced before it replaces it."""
+    check = sqlite3.connect(work)              # rolls back a crash's hot journal
+    try:
+        ok = check.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        check.close()
+    if ok != "ok":
+        raise sqlite3.DatabaseError(f"{work.name}: {ok}")
+    gz = archive_path(month)
+    tmp = gz.with_suffix(".tmp")
+    with open(work, "rb") as fin, open(tmp, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, gz)
+    with contextlib.suppress(OSError):         # make the rename itself durable
+        fd = os.open(LOG_ARCHIVE, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _recover_archives() -> None:
+    """
+    Re-pack work files left by a crash.  A work file always holds its whole
+    month (the archive it was unpacked from + rows copied since), so it
+    can simply replace the archive.
+    """
+    for work in LOG_ARCHIVE.glob(".events-*.work.db"):
+        month = work.name[len(".events-"):-len(".work.db")]
+        if not _MONTH.fullmatch(month):
+            continue
+        _pack(month, work)
+        work.unlink()
+
+
+def _archive_month(c: sqlite3.Connection, month: str, sids: list[str]) -> int:
+    """
+    Copy *sids* into *month*'s archive, write it out durably, and only then
+    delete them from the live DB (two steps – WAL mode gives no atomic
+    commit across attached DBs).  → runs removed from the live DB.
+    """
+    work = _work_path(month)
+    gz = archive_path(month)
+    if gz.exists():
+        tmp = work.with_suffix(".tmp")
+        with gzip.open(gz, "rb") as fin, open(tmp, "wb") as fout:
+            shutil.copyfileobj(fin, fout, 1 << 20)
+        os.replace(tmp, work)                  # a work file is always complete
+
+    c.execute("CREATE TEMP TABLE IF NOT EXISTS arc_sids(session_id TEXT PRIMARY KEY)")
+    c.execute("DELETE FROM arc_sids")
+    c.executemany("INSERT INTO arc_sids VALUES(?)", [(s,) for s in sids])
+    sel = "session_id IN (SELECT session_id FROM arc_sids)"
+
+    # ① copy (re-run safe: replace, not add)
+    c.execute("ATTACH DATABASE ? AS arc", (str(work),))
+    try:
+        cols = {t: _columns(c, t) for t in _ARCHIVE_TABLES}
+        for idx in _ARCHIVE_INDEXES:
+            c.execute(f"CREATE INDEX IF NOT EXISTS arc.{idx}")
+        with c:
+            for t in _ARCHIVE_TABLES:
+                c.execute(f"DELETE FROM arc.{t} WHERE {sel}")
+                c.execute(f"INSERT INTO arc.{t}({cols[t]}) "
+                          f"SELECT {cols[t]} FROM main.{t} WHERE {sel}")
+        copied = dict(c.execute(
+            f"SELECT session_id, count(*) FROM arc.events WHERE {sel} GROUP BY 1"))
+    finally:
+        c.execute("DETACH DATABASE arc")
+
+    # ② durable archive before anything leaves the live DB
+    _pack(month, work)
+
+    # ③ delete what was copied; a run that got events meanwhile stays live
+    with c:
+        c.execute("BEGIN IMMEDIATE")
+        live = dict(c.execute(
+            f"SELECT session_id, count(*) FROM main.events WHERE {sel} GROUP BY 1"))
+        c.executemany("DELETE FROM arc_sids WHERE session_id = ?",
+                      [(s,) for s, n in live.items() if copied.get(s) != n])
+        last = (f"(seq - 1) / {CHECKPOINT_EVERY} * {CHECKPOINT_EVERY}"
+                f" + {CHECKPOINT_EVERY}")
+        c.execute(
+            f"""INSERT OR IGNORE INTO main.audit_archived(seq_last, month)
+                SELECT DISTINCT {last}, ? FROM main.events WHERE {sel}""",
+            (month,))
+        c.execute(
+            f"""UPDATE main.audit_checkpoints SET archived = 1
+                 WHERE seq_last IN (SELECT DISTINCT {last}
+                                      FROM main.events WHERE {sel})""")
+        for t in reversed(_ARCHIVE_TABLES):
+            moved = c.execute(f"DELETE FROM main.{t} WHERE {sel}").rowcount
+    work.unlink()
+    return moved
+
+
+def archive_old(days: int = RETENTION_DAYS) -> dict[str, int]:
+    """
+    Move finished / aborted runs that ended more than *days* days ago
+    into their monthly archive → ``{month: runs moved}``.  Runs whose
+    events are not checkpointed yet stay until they are, and on a station
+    runs whose journal is not uploaded yet (past ``counters.sync``).
+    """
+    if days <= 0:
+        return {}
+    from .audit import verify_segments         # audit imports this module
+    flush()
+    cutoff = (datetime.datetime.now()
+              - datetime.timedelta(days=days)).isoformat(timespec="seconds")
+    c = _open()
+    try:
+        last_cp = c.execute("SELECT coalesce(max(seq_last), 0) "
+                            "FROM audit_checkpoints").fetchone()[0]
+        synced = last_cp                       # journal: only what was shipped
+        if CENTRAL_URL:
+            row = c.execute("SELECT value FROM counters WHERE name='sync'").fetchone()
+            synced = row[0] if row else 0
+        by_month: dict[str, list[str]] = {}
+        for sid, month in c.execute(
+                """SELECT session_id, substr(ts_created, 1, 7) FROM runs
+                    WHERE status IN ('finished', 'aborted') AND ts_finished < ?
+                      AND NOT EXISTS (
+                        SELECT 1 FROM events e
+                         WHERE e.session_id = runs.session_id
+                           AND (e.seq IS NULL OR e.seq > ?
+                                OR e.seq_no IS NOT NULL AND e.seq > ?))""",
+                (cutoff, last_cp, synced)).fetchall():
+            if _MONTH.fullmatch(month or ""):
+                by_month.setdefault(month, []).append(sid)
+        if not by_month:
+            return {}
+
+        firsts = {r[0] for r in c.execute(
+            f"""SELECT DISTINCT (seq - 1) / {CHECKPOINT_EVERY} * {CHECKPOINT_EVERY} + 1
+                  FROM events WHERE seq IS NOT NULL AND session_id IN (
+                    SELECT session_id FROM runs
+                     WHERE status IN ('finished', 'aborted') AND ts_finished < ?)""",
+            (cutoff,))}
+        check = verify_segments(firsts)
+        if not check["ok"]:                    # keep the evidence where it is
+            print(f"[WARN] archive skipped, audit chain broken: "
+                  f"{check['problems'][:3]}", flush=True)
+            return {}
+
+        LOG_ARCHIVE.mkdir(parents=True, exist_ok=True)
+        _recover_archives()
+        moved = {m: _archive_month(c, m, sids) for m, sids in sorted(by_month.items())}
+        notify_runs_changed()
+        return moved
+    finally:
+        c.close()
+
+
+def vacuum_step(pages: int = _VACUUM_PAGES) -> int:
+    """Hand up to *pages* free pages back to the file system → pages left."""
+    c = _open()
+    try:
+        c.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+        c.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        return c.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        c.close()
+
+
+def _idle() -> bool:
+    c = connect()
+    if c.execute("SELECT 1 FROM runs WHERE status='active' LIMIT 1").fetchone():
+        return False
+    row = c.execute("SELECT ts_us FROM events ORDER BY seq DESC LIMIT 1").fetchone()
+    return row is None or row[0] is None or \
+        time.time() - row[0] / 1e6 >= _IDLE_SEC
+
+
+class _Maintenance:
+    """
+    Daemon thread: archive and prune `runs_deleted` once a day, then
+    vacuum – only while idle.
+    """
+
+    def __init__(self) -> None:
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+        self._archived_on: datetime.date | None = None
+
+    def start(self) -> None:
+        with self._lock:
+            if (self._thread is not None and self._pid == os.getpid()
+                    and self._thread.is_alive()):
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="tbag-maintenance", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(_MAINT_INTERVAL)
+            try:
+                self.run_once()
+            except (sqlite3.Error, OSError) as exc:
+                print(f"[WARN] maintenance failed: {exc}", flush=True)
+
+    def run_once(self) -> None:
+        if not _idle():
+            return
+        today = datetime.date.today()
+        if self._archived_on != today:
+            if RETENTION_DAYS > 0:
+                moved = archive_old(RETENTION_DAYS)
+                if moved:
+                    print(f"[INFO] archived runs: {moved}", flush=True)
+            prune_tombstones()                 # incl. those of archived runs
+            self._archived_on = today
+        while vacuum_step() and _idle():
+            time.sleep(0.1)                    # let requests in between
+
+
+_maintenance = _Maintenance()
+
+
+def start_maintenance() -> None:
+    """Start the idle-time archive / VACUUM thread (web process only)."""
+    _maintenance.start()
 
 
 # bootstrap at import time
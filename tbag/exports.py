@@ -0,0 +1,208 @@
+"""
+tbag.exports
+────────────
+Background log exports – big `/logs` exports run in a worker process,
+not on a gunicorn request thread.
+
+• `submit()` records a job in `export_jobs` and hands it to a small
+  *spawn* process pool.  The worker streams
+  `tbag.logbook.export_overview()` into ``data/exports/<key>.<fmt>`` and
+  reports progress (`rows_done` / `rows_total`) in the same row.
+• The cache key covers format, filters and the `runs` change counter, so
+  asking for the same export again while nothing changed returns the
+  existing job – no new work.
+• Only the newest `KEEP` finished jobs (and their files) are kept.
+
+Jobs belong to the process that owns the pool (the service runs a single
+gunicorn worker); anything still queued / running from a previous
+process is marked failed the first time this one touches the table.
+"""
+from __future__ import annotations
+
+import datetime
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+import pathlib
+import sqlite3
+import tempfile
+import threading
+import uuid
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+from .config import DATA_DIR
+from .db import _open, connect, runs_version
+from .logbook import (EXPORT_FORMATS, OVERVIEW_FILTERS,
+                      export_overview, overview_count)
+
+EXPORT_DIR = DATA_DIR / "exports"
+KEEP = 20                     # finished jobs (and files) kept for download
+
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+_recovered = False
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _cache_key(fmt: str, filters: Dict[str, str], version: int) -> str:
+    blob = json.dumps([fmt, filters, version], sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+def job_path(job: Dict) -> pathlib.Path:
+    return EXPORT_DIR / f"{job['cache_key']}.{job['fmt']}"
+
+
+def _update(job_id: str, c: Optional[sqlite3.Connection] = None, **cols) -> None:
+    sets = ", ".join(f"{k} = ?" for k in cols)
+    with c or connect() as c:
+        c.execute(f"UPDATE export_jobs SET {sets} WHERE job_id = ?",
+                  (*cols.values(), job_id))
+
+
+# ─────────────────────────────────────────── worker side
+def _run(job_id: str, key: str, fmt: str, filters: Dict[str, str]) -> None:
+    """Pool entry point: write one export file, progress into SQLite."""
+    # progress goes through its own connection: the pooled one sits in
+    # the export's long read transaction and could not write past it
+    db = _open()
+    try:
+        _update(job_id, db, status="running",
+                rows_total=overview_count(filters))
+        EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=EXPORT_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in export_overview(
+                        filters, fmt,
+                        progress=lambda n: _update(job_id, db, rows_done=n)):
+                    f.write(chunk)
+            path = EXPORT_DIR / f"{key}.{fmt}"
+            os.replace(tmp, path)
+        except BaseException:
+            pathlib.Path(tmp).unlink(missing_ok=True)
+            raise
+        _update(job_id, db, status="done", size=path.stat().st_size,
+                ts_finished=_now())
+    finally:
+        db.close()
+
+
+# ─────────────────────────────────────────── web side
+def _executor() -> Executor:
+    # *spawn*, not fork: forking a threaded gunicorn worker can deadlock
+    # (workers re-import __main__ – app.py keeps its start-up behind a guard)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=2,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _drop_executor(pool: Executor) -> None:
+    """Forget *pool* after `BrokenProcessPool` (a worker died) – next call rebuilds."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _recover() -> None:
+    """Fail jobs orphaned by a restart (once per process)."""
+    global _recovered
+    if _recovered:
+        return
+    _recovered = True
+    with connect() as c:
+        c.execute("""UPDATE export_jobs
+                        SET status='failed', error='interrupted by restart',
+                            ts_finished=?
+                      WHERE status IN ('queued','running')""", (_now(),))
+
+
+def _finished(job_id: str, pool: Executor, fut: Future) -> None:
+    exc = fut.exception()
+    if isinstance(exc, BrokenProcessPool):
+        _drop_executor(pool)
+    if exc is not None:
+        print(f"[WARN] export {job_id} failed: {exc!r}", flush=True)
+        _update(job_id, status="failed", error=str(exc) or type(exc).__name__,
+                ts_finished=_now())
+    _prune()
+
+
+def _prune() -> None:
+    with connect() as c:
+        c.execute("""DELETE FROM export_jobs WHERE job_id IN (
+                       SELECT job_id FROM export_jobs
+                        WHERE status IN ('done','failed')
+                        ORDER BY ts_created DESC LIMIT -1 OFFSET ?)""", (KEEP,))
+        live = {r[0] for r in c.execute("SELECT cache_key FROM export_jobs")}
+    for p in EXPORT_DIR.glob("*.*"):
+        if p.suffix != ".tmp" and p.stem not in live:
+            p.unlink(missing_ok=True)
+
+
+def get(job_id: str) -> Optional[Dict]:
+    _recover()
+    row = connect().execute(
+        "SELECT * FROM export_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def recent(limit: int = 10) -> List[Dict]:
+    """Newest jobs first (for the /logs exports panel)."""
+    _recover()
+    return [dict(r) for r in connect().execute(
+        "SELECT * FROM export_jobs ORDER BY ts_created DESC, rowid DESC LIMIT ?",
+        (limit,))]
+
+
+def submit(filters: Dict[str, str], fmt: str = "xlsx") -> Dict:
+    """
+    Queue an overview export (or return the cached / in-flight job for
+    the same format + filters + data).  Raises ValueError on a bad *fmt*.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    _recover()
+    filters = {k: v for k, v in filters.items() if k in OVERVIEW_FILTERS and v}
+    key = _cache_key(fmt, filters, runs_version())
+
+    hit = connect().execute(
+        """SELECT * FROM export_jobs
+            WHERE cache_key = ? AND status != 'failed'
+            ORDER BY ts_created DESC LIMIT 1""", (key,)).fetchone()
+    if hit and (hit["status"] != "done" or job_path(hit).exists()):
+        return dict(hit)
+
+    job_id = uuid.uuid4().hex[:12]
+    with connect() as c:
+        c.execute(
+            """INSERT INTO export_jobs(job_id, cache_key, fmt, params,
+                                       status, ts_created)
+               VALUES(?,?,?,?, 'queued', ?)""",
+            (job_id, key, fmt, json.dumps(filters), _now()))
+    pool = _executor()
+    try:
+        fut = pool.submit(_run, job_id, key, fmt, filters)
+    except BrokenProcessPool:            # died since the last job: fresh pool
+        _drop_executor(pool)
+        pool = _executor()
+        fut = pool.submit(_run, job_id, key, fmt, filters)
+    fut.add_done_callback(functools.partial(_finished, job_id, pool))
+    return get(job_id)  # type: ignore[return-value]
+
+
+__all__ = ["EXPORT_DIR", "KEEP", "submit", "get", "recent", "job_path"]
@@ -0,0 +1,320 @@
+"""
+tbag.fleet
+──────────
+Fleet mode – one central TBAG instance queues `runs` for many glovebox
+stations registered in `devices`.
+
+• Every station holds a bearer token (`issue_token()`); only its sha256
+  is stored (`devices.token_hash`, unique index), so `authenticate()` is
+  one index lookup.
+• Stations do not poll the queue.  A claim request parks in the
+  `Dispatcher` until a run is handed to it (or the wait runs out), and a
+  single dispatcher thread – not every station – watches the `runs`
+  change counter.  One queue read serves all waiting stations.
+• A parked claim holds a server thread, so at most `CLAIM_PARK_MAX`
+  park at once; further claims get one dispatch attempt and, if nothing
+  is handed out, are told to retry after `CLAIM_RETRY_SEC`.
+• Dispatch is device-aware and fair: a run targeted at a station goes to
+  that station (targeted runs are matched before any others); unassigned
+  runs (device NULL / '' / 'any') go to the waiting station that was
+  served longest ago.  A station that asks again while it still owns an
+  active run gets that run back (lost response, kiosk reload).
+
+The local Pi kiosk keeps using `/api/pending/wait` + `/api/claim`; both
+paths claim with the same ``status = 'pending'`` guarded UPDATE, so a run
+is never handed out twice.
+
+Stations journal their events locally and upload them in batches
+(`tbag.sync`); `ingest()` stores each ``(session_id, seq_no)`` once, so a
+re-sent batch is harmless, and closes the run on its end / abort event.
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .config import CLAIM_PARK_MAX
+from .db import (_ts_us, append_events, connect, current_presence,
+                 notify_runs_changed, remove_presence, runs_version,
+                 wait_runs_changed)
+
+CLAIM_WAIT_MAX_SEC = 25   # stay well under proxy / gunicorn timeouts
+CLAIM_RETRY_SEC    = 5    # un-parked claim: ask again after this
+_UNASSIGNED = (None, "", "any")
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+# ─────────────────────────────────────────── registry / tokens
+def register(device_id: str, description: str = "") -> str:
+    """Add a station and return its token; ValueError if it exists."""
+    token = secrets.token_urlsafe(24)
+    try:
+        with connect() as c:
+            c.execute(
+                """INSERT INTO devices(device_id, description, ts_added, token_hash)
+                   VALUES(?, ?, ?, ?)""",
+                (device_id, description or None, _now(), _hash(token)),
+            )
+    except sqlite3.IntegrityError:
+        raise ValueError(f"device {device_id!r} already registered") from None
+    return token
+
+
+def issue_token(device_id: str) -> str:
+    """Replace the token of *device_id* (old one stops working); KeyError if unknown."""
+    token = secrets.token_urlsafe(24)
+    with connect() as c:
+        n = c.execute("UPDATE devices SET token_hash=? WHERE device_id=?",
+                      (_hash(token), device_id)).rowcount
+    if not n:
+        raise KeyError(device_id)
+    return token
+
+
+def remove(device_id: str) -> None:
+    with connect() as c:
+        c.execute("DELETE FROM devices WHERE device_id=?", (device_id,))
+    remove_presence(device_id)
+
+
+def authenticate(token: str) -> Optional[str]:
+    """device_id owning *token*, or None."""
+    if not token:
+        return None
+    row = connect().execute(
+        "SELECT device_id FROM devices WHERE token_hash=?", (_hash(token),)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def devices() -> List[Dict]:
+    """
+    Stations – registered devices holding a token – with ``online``
+    (presence).  The server's own tokenless `DEVICE_ID` row is no station.
+    """
+    online = set(current_presence())
+    return [dict(r, online=r["device_id"] in online)
+            for r in connect().execute(
+                """SELECT device_id, description, ts_added
+                     FROM devices WHERE token_hash IS NOT NULL
+                    ORDER BY device_id""")]
+
+
+# ─────────────────────────────────────────── journal uploads
+def ingest(device_id: str, entries: List[Dict]) -> Dict:
+    """
+    Store a station's journal batch.  Only sessions handed to *device_id*
+    are accepted; rows already stored (same session + seq_no) are skipped.
+    → ``{"stored": new rows, "rejected": rows of foreign sessions}``
+    """
+    sids = list({e["session_id"] for e in entries})
+    marks = ",".join("?" * len(sids))
+    with connect() as c:
+        owned = {r[0] for r in c.execute(
+            f"SELECT session_id FROM runs WHERE device = ? AND session_id IN ({marks})",
+            (device_id, *sids))}
+        rows = [(e["ts"], e["kind"], e["session_id"],
+                 None if e.get("payload") is None else json.dumps(e["payload"]),
+                 int(e["seq_no"]), e.get("ts_us") or _ts_us(e["ts"]))
+                for e in entries if e["session_id"] in owned]
+        stored = append_events(c, rows, ignore=True)
+
+        closed = 0
+        for e in entries:
+            if e["session_id"] not in owned:
+                continue
+            if e["kind"] == "session_end":
+                closed += c.execute(
+                    """UPDATE runs SET status='finished', ts_finished=?
+                        WHERE session_id=? AND status='active'""",
+                    (e["ts"], e["session_id"])).rowcount
+            elif e["kind"] == "session_abort":
+                closed += c.execute(
+                    """UPDATE runs SET status='aborted', ts_finished=?, interrupted_at=?
+                        WHERE session_id=? AND status='active'""",
+                    (e["ts"], (e.get("payload") or {}).get("step"),
+                     e["session_id"])).rowcount
+    if closed:
+        notify_runs_changed()
+    return {"stored": stored, "rejected": len(entries) - len(rows)}
+
+
+# ─────────────────────────────────────────── dispatch
+class _Waiter:
+    __slots__ = ("device", "done", "run")
+
+    def __init__(self, device: str) -> None:
+        self.device = device
+        self.done = threading.Event()
+        self.run: Optional[Dict] = None
+
+
+class Dispatcher:
+    """Hands pending runs to parked station requests (see module doc)."""
+
+    _TICK = 1.0           # counter re-check while stations are waiting
+
+    def __init__(self) -> None:
+        self._waiting: Dict[str, _Waiter] = {}      # one per device
+        self._served: Dict[str, float] = {}         # device → last hand-out
+        self._lock = threading.Lock()
+        self._round = threading.Lock()              # one dispatch at a time
+        self._kick = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def claim(self, device_id: str, timeout: float,
+              park_max: int = CLAIM_PARK_MAX) -> Tuple[Optional[Dict], bool]:
+        """
+        Block until a run is claimed for *device_id* or *timeout* seconds
+        pass → ``(runs row as a dict or None, parked)``.  With *park_max*
+        other stations already parked it only tries once (parked False).
+        """
+        w = _Waiter(device_id)
+        with self._lock:
+            old = self._waiting.get(device_id)
+            if old is not None:                     # superseded request
+                old.done.set()
+            elif len(self._waiting) >= park_max:
+                timeout = 0
+            self._waiting[device_id] = w
+        self._ensure_running()
+        self.dispatch()                             # work already queued?
+        self._kick.set()
+        if timeout > 0:
+            w.done.wait(timeout)
+        with self._lock:
+            if self._waiting.get(device_id) is w:
+                del self._waiting[device_id]
+        return w.run, timeout > 0
+
+    def waiting(self) -> List[str]:
+        with self._lock:
+            return list(self._waiting)
+
+    # ── one round: one queue read for every waiting station ─────────
+    def dispatch(self) -> None:
+        with self._round:
+            with self._lock:
+                waiters = sorted(self._waiting.values(),
+                                 key=lambda w: self._served.get(w.device, 0.0))
+            if not waiters:
+                return
+            devs = [w.device for w in waiters]
+            marks = ",".join("?" * len(devs))
+            c = connect()
+            pending = c.execute(
+                """SELECT session_id, device FROM runs
+                    WHERE status = 'pending'
+                    ORDER BY ts_created, session_id""").fetchall()
+            active = {r["device"]: r for r in c.execute(
+                f"""SELECT * FROM runs
+                     WHERE status = 'active' AND device IN ({marks})""", devs)}
+
+            taken: set = set()
+            handed: Dict[_Waiter, Dict] = {}
+            for w in waiters:
+                if w.device in active:              # resume its own run
+                    handed[w] = dict(active[w.device])
+            # targeted runs first, for every station, so nobody takes an
+            # unassigned run while its own one waits (and another gets none)
+            for targeted in (True, False):
+                for w in waiters:
+                    if w in handed:
+                        continue
+                    for r in pending:
+                        if r["session_id"] in taken or not (
+                                r["device"] == w.device if targeted
+                                else r["device"] in _UNASSIGNED):
+                            continue
+                        taken.add(r["session_id"])
+                        run = self._take(r["session_id"], w.device)
+                        if run is not None:
+                            handed[w] = run
+                            break
+
+            if any(w.device not in active for w in handed):
+                notify_runs_changed()
+            now = time.monotonic()
+            with self._lock:
+                for w, run in handed.items():
+                    w.run = run
+                    self._served[w.device] = now
+                    if self._waiting.get(w.device) is w:
+                        del self._waiting[w.device]
+                    w.done.set()
+
+    @staticmethod
+    def _take(sid: str, device_id: str) -> Optional[Dict]:
+        with connect() as c:
+            run = c.execute(
+                """UPDATE runs
+                      SET status = 'active', ts_started = ?, device = ?
+                    WHERE session_id = ? AND status = 'pending'
+                      AND (device IS NULL OR device IN ('', 'any', ?))
+                RETURNING *""",
+                (_now(), device_id, sid, device_id),
+            ).fetchone()
+        return dict(run) if run else None
+
+    # ── background: re-dispatch whenever `runs` changes ─────────────
+    def _ensure_running(self) -> None:
+        if (self._thread is not None and self._pid == os.getpid()
+                and self._thread.is_alive()):
+            return
+        with self._lock:
+            if (self._thread is not None and self._pid == os.getpid()
+                    and self._thread.is_alive()):
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="tbag-dispatch", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        version = runs_version()
+        while True:
+            with self._lock:
+                idle = not self._waiting
+            if idle:
+                self._kick.wait()
+            self._kick.clear()
+            latest = wait_runs_changed(version, self._TICK)
+            if latest != version:
+                version = latest
+                try:
+                    self.dispatch()
+                except sqlite3.Error as exc:
+                    print(f"[WARN] dispatch failed: {exc}", flush=True)
+
+
+dispatcher = Dispatcher()
+
+
+def claim_next(device_id: str, timeout: float = CLAIM_WAIT_MAX_SEC
+               ) -> Tuple[Optional[Dict], float]:
+    """
+    Claim the next run for station *device_id* (long-poll) → ``(run or
+    None, seconds the station should wait before asking again)``.
+    """
+    run, parked = dispatcher.claim(device_id, min(timeout, CLAIM_WAIT_MAX_SEC))
+    return run, 0 if parked or run is not None else CLAIM_RETRY_SEC
+
+
+__all__ = ["CLAIM_WAIT_MAX_SEC", "CLAIM_RETRY_SEC", "register", "issue_token", "remove",
+           "authenticate", "devices", "ingest", "Dispatcher", "dispatcher",
+           "claim_next"]
@@ -15,13 +15,25 @@ Behaviour switches automatically, but you can force mock mode via
     $ export TBAG_GPIO_MOCK=1
 
 before starting the app.
+
+For the LED outputs there is also ``output_bank()``: one long-lived
+driver per process.  When ``gpiod`` is available it requests *all*
+output lines in one bulk request and drives every LED with a single
+``set_values()`` call; otherwise it keeps a pool of ``LED`` handles
+open.  Either way switching an LED is a state change, never a pin
+setup / teardown.
 """
 from __future__ import annotations
 
+import atexit
 import os
 import sys
+import threading
+from typing import Iterable, Optional, Sequence
 
-__all__ = ["LED", "Button", "is_real", "using_mock"]
+__all__ = [
+    "LED", "Button", "LineBank", "LEDPool", "output_bank", "is_real", "using_mock",
+]
 
 
 # ---------------------------------------------------------------------------
@@ -104,3 +116,163 @@ else:
 def is_real() -> bool:
     """Return *True* when the real GPIO driver is active (not mocked)."""
     return not using_mock
+
+
+# ---------------------------------------------------------------------------
+# bulk LED outputs (gpiod)
+# ---------------------------------------------------------------------------
+
+class LineBank:
+    """
+    Every LED output as one held gpiod line request.
+
+    ``only(pin)`` / ``all_off()`` each translate into one atomic
+    ``set_values()`` – no per-pin request / release, no sleeps.
+    Works with both the libgpiod 1.x and 2.x Python bindings.
+    """
+
+    def __init__(self, pins: Iterable[int], chip: str = "gpiochip0",
+                 consumer: str = "tbag-leds") -> None:
+        import gpiod                                      # type: ignore
+
+        self.pins: Sequence[int] = tuple(pins)
+        self._lock = threading.Lock()
+        self._state: Optional[list] = [0] * len(self.pins)
+
+        if hasattr(gpiod, "request_lines"):               # libgpiod ≥ 2
+            from gpiod.line import Direction, Value       # type: ignore
+
+            req = gpiod.request_lines(
+                f"/dev/{chip}",
+                consumer=consumer,
+                config={self.pins: gpiod.LineSettings(
+                    direction=Direction.OUTPUT, output_value=Value.INACTIVE)},
+            )
+            levels = (Value.INACTIVE, Value.ACTIVE)
+            self._write = lambda vals: req.set_values(
+                {p: levels[v] for p, v in zip(self.pins, vals)})
+            self._release = req.release
+        else:                                             # libgpiod 1.x
+            chip_h = gpiod.Chip(chip)
+            lines = chip_h.get_lines(list(self.pins))
+            lines.request(consumer=consumer, type=gpiod.LINE_REQ_DIR_OUT,
+                          default_vals=[0] * len(self.pins))
+            self._write = lines.set_values
+            self._release = lambda: (lines.release(), chip_h.close())
+
+    def _set(self, vals: list) -> None:
+        """Write *vals*; a failed write is a warning and is retried next time."""
+        try:
+            self._write(vals)
+        except OSError as exc:
+            print(f"[WARN] cannot set LED outputs: {exc}", flush=True)
+            self._state = None                            # unknown → rewrite
+        else:
+            self._state = vals
+
+    def only(self, pin: Optional[int]) -> None:
+        """Light *pin* (None → nothing) and switch every other LED off."""
+        vals = [int(p == pin) for p in self.pins]
+        with self._lock:
+            if vals != self._state:
+                self._set(vals)
+
+    def all_off(self) -> None:
+        """Force every output low (written even if we think it already is)."""
+        with self._lock:
+            self._set([0] * len(self.pins))
+
+    def close(self) -> None:
+        with self._lock:
+            try:
+                self._write([0] * len(self.pins))
+            finally:
+                self._release()
+
+
+class LEDPool:
+    """
+    Same interface as `LineBank`, backed by one ``LED`` handle per pin
+    that stays open until `close()`.  Used when gpiod isn't available
+    (and in mock mode, where the handles are no-ops).
+    """
+
+    def __init__(self, pins: Iterable[int]) -> None:
+        self.pins: Sequence[int] = tuple(pins)
+        self._lock = threading.Lock()
+        self._current: Optional[int] = None
+        self._leds: dict = {}
+        for pin in self.pins:
+            try:
+                self._leds[pin] = LED(pin)
+            except Exception as exc:                      # busy / reserved pin
+                print(f"[WARN] cannot open LED on GPIO {pin}: {exc}", flush=True)
+
+    def only(self, pin: Optional[int]) -> None:
+        """Light *pin* (None → nothing); only the two affected pins change."""
+        with self._lock:
+            if pin == self._current:
+                return
+            try:
+                if self._current in self._leds:
+                    self._leds[self._current].off()
+                self._current = None
+                if pin is not None:
+                    if pin not in self._leds:
+                        print(f"[WARN] cannot switch LED on GPIO {pin}: not available",
+                              flush=True)
+                        return
+                    self._leds[pin].on()
+                    self._current = pin
+            except Exception as exc:
+                print(f"[WARN] cannot switch LED on GPIO {pin}: {exc}", flush=True)
+
+    def all_off(self) -> None:
+        with self._lock:
+            for led in self._leds.values():
+                try:
+                    led.off()
+                except Exception:
+                    pass
+            self._current = None
+
+    def close(self) -> None:
+        with self._lock:
+            for led in self._leds.values():
+                try:
+                    led.off()
+                    led.close()
+                except Exception:
+                    pass
+            self._leds.clear()
+            self._current = None
+
+
+_bank: Optional[LineBank | LEDPool] = None
+_bank_pid: Optional[int] = None
+_bank_lock = threading.Lock()
+
+
+def output_bank(pins: Iterable[int]) -> LineBank | LEDPool:
+    """
+    Process-wide LED driver for *pins*, created on the first call and
+    closed at exit: a `LineBank` when gpiod can claim the lines, else a
+    `LEDPool`.  Thread-safe; a forked worker builds its own.
+    """
+    global _bank, _bank_pid
+    with _bank_lock:
+        if _bank is not None and _bank_pid == os.getpid():
+            return _bank
+        pins = tuple(pins)
+        _bank = None
+        if not using_mock:
+            try:
+                _bank = LineBank(pins)
+            except Exception as exc:                      # no gpiod / busy / perms
+                print(f"[WARN] bulk GPIO request failed, using LED pool: {exc}",
+                      flush=True)
+        if _bank is None:
+            _bank = LEDPool(pins)
+        _bank_pid = os.getpid()
+        atexit.register(_bank.close)
+        return _bank
@@ -0,0 +1,84 @@
+"""
+tbag.helpers.catalog
+────────────────────
+In-memory cache of the on-disk libraries (`projects/`, `components/`).
+
+Both libraries share one layout – ``<root>/<id>/config.json`` – so one
+small class serves both:
+
+• the folder list is re-read only when the root directory's mtime moves
+  (a folder was added / removed)
+• each parsed config is kept until its own file's mtime / size moves
+
+At steady state a listing therefore costs a handful of ``stat()`` calls
+and no reads or JSON parsing.  Cached dicts are shared: treat them as
+read-only (the ``load_*`` helpers hand out private copies).
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+class Catalog:
+    """Parsed ``<root>/<id>/config.json`` files, invalidated by mtime."""
+
+    def __init__(self, root: pathlib.Path) -> None:
+        self.root = root
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._ids_stamp: Optional[int] = None
+        self._entries: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+
+    # ── lookups ──────────────────────────────────────────────────────
+    def ids(self) -> List[str]:
+        """Every entry folder, sorted A → Z (case-insensitive)."""
+        stamp = self.root.stat().st_mtime_ns
+        with self._lock:
+            if stamp != self._ids_stamp:
+                self._ids = sorted(
+                    (d.name for d in self.root.iterdir() if d.is_dir()),
+                    key=str.lower,
+                )
+                self._ids_stamp = stamp
+                self._entries = {k: v for k, v in self._entries.items()
+                                 if k in self._ids}
+            return list(self._ids)
+
+    def get(self, eid: str) -> Optional[Dict]:
+        """Parsed config of *eid* (shared, read-only) or None if missing."""
+        path = self.root / eid / "config.json"
+        try:
+            st = path.stat()
+        except OSError:
+            with self._lock:
+                self._entries.pop(eid, None)
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._entries.get(eid)
+            if hit and hit[0] == stamp:
+                return hit[1]
+            with path.open() as f:
+                cfg = json.load(f)
+            self._entries[eid] = (stamp, cfg)
+            return cfg
+
+    def items(self) -> List[Tuple[str, Dict]]:
+        """``(id, config)`` for every folder that has a config, A → Z."""
+        return [(eid, cfg) for eid in self.ids() if (cfg := self.get(eid))]
+
+    # ── explicit invalidation (after our own writes) ─────────────────
+    def invalidate(self, eid: Optional[str] = None) -> None:
+        with self._lock:
+            self._ids_stamp = None
+            if eid is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(eid, None)
+
+
+__all__ = ["Catalog"]
@@ -15,17 +15,22 @@ This version introduces:
 
 from __future__ import annotations
 
+import copy
 import json
 import pathlib
 import re
 import uuid
 from typing import Dict, List, Optional
 
+from .catalog import Catalog
+
 # ────────────────────────── constants ────────────────────────────
 BASE_DIR = pathlib.Path(__file__).resolve().parent.parent          # …/tbag
 COMPONENTS = BASE_DIR / "components"
 COMPONENTS.mkdir(exist_ok=True)
 
+catalog = Catalog(COMPONENTS)          # parsed configs, mtime-checked
+
 # 23 plain output pins exposed to the user (ordered L1 → L23)
 ALLOWED_GPIO_PINS: List[int] = [
     2,   # L1
@@ -68,9 +73,9 @@ def components_list() -> List[pathlib.Path]:
 
 
 def load_component(cid: str) -> Optional[Dict]:
-    """Read `<COMPONENTS>/<cid>/config.json`; return None if missing."""
-    cfg = COMPONENTS / cid / "config.json"
-    return json.load(cfg.open()) if cfg.exists() else None
+    """`<COMPONENTS>/<cid>/config.json` as a private copy; None if missing."""
+    cfg = catalog.get(cid)
+    return copy.deepcopy(cfg) if cfg is not None else None
 
 
 def save_component(cid: str, data: Dict) -> None:
@@ -81,6 +86,7 @@ def save_component(cid: str, data: Dict) -> None:
     (root / "images").mkdir(parents=True, exist_ok=True)
     with (root / "config.json").open("w") as f:
         json.dump(data, f, indent=2)
+    catalog.invalidate(cid)
 
 
 def new_component_slug(name: str) -> str:
@@ -92,6 +98,7 @@ def new_component_slug(name: str) -> str:
 # ────────────────────────── exports ──────────────────────────────
 __all__ = [
     "COMPONENTS",
+    "catalog",
     "ALLOWED_GPIO_PINS",
     "GPIO_LABELS",
     "components_list",
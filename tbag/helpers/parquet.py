@@ -0,0 +1,94 @@
+"""
+tbag.helpers.parquet
+────────────────────
+Streamed Parquet writer for the analytics dumps (`tbag.bulk`).
+
+Rows are cut into row groups of `GROUP_ROWS`; each group is converted to
+Arrow columns, written, and the bytes produced so far are handed out
+before the next group is read – memory is bounded by one row group.
+
+Column types (the *schema* entries of `write()`):
+
+• ``str`` – UTF-8 string, dictionary encoded by the Parquet writer
+• ``i64`` – 64-bit int
+• ``ts``  – epoch seconds → ``timestamp[s, tz=UTC]``
+
+Needs *pyarrow* (optional dependency): `available()` tells whether it
+can be imported, `write()` raises ImportError if not.
+"""
+from __future__ import annotations
+
+import itertools
+from typing import Iterable, Iterator, List, Sequence, Tuple
+
+GROUP_ROWS = 65536
+MIME = "application/vnd.apache.parquet"
+
+
+def available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _Sink:
+    """Write-only file object collecting what the writer emits."""
+
+    closed = False
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        b = bytes(data)
+        self._parts.append(b)
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def write(schema: Sequence[Tuple[str, str]],
+          rows: Iterable[Sequence]) -> Iterator[bytes]:
+    """*rows* (tuples in *schema* order) as Parquet file chunks."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"str": pa.string(), "i64": pa.int64(),
+             "ts": pa.timestamp("s", tz="UTC")}
+    arrow_schema = pa.schema([(name, types[kind]) for name, kind in schema])
+    sink = _Sink()
+
+    def chunks() -> Iterator[bytes]:
+        with pq.ParquetWriter(sink, arrow_schema, compression="zstd") as out:
+            it = iter(rows)
+            while True:
+                group = list(itertools.islice(it, GROUP_ROWS))
+                if not group:
+                    break
+                cols = list(zip(*group))
+                out.write_table(pa.Table.from_arrays(
+                    [pa.array(col, type=f.type) for col, f in zip(cols, arrow_schema)],
+                    schema=arrow_schema))
+                yield sink.drain()
+        yield sink.drain()                        # footer
+
+    return chunks()
+
+
+__all__ = ["GROUP_ROWS", "MIME", "available", "write"]
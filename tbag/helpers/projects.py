@@ -10,9 +10,11 @@ Canonical helper layer for project “recipes”.
 """
 
 from __future__ import annotations
-import json, pathlib, uuid
+import copy, json, pathlib, uuid
 from typing import Dict, List, Optional
 
+from .catalog import Catalog
+
 # ── decide which folder to use ───────────────────────────────────────────
 _PKG_ROOT   = pathlib.Path(__file__).resolve().parent.parent      # …/tbag
 _BASE_ROOT  = _PKG_ROOT.parent                                    # repo root
@@ -35,6 +37,8 @@ def _choose_projects_dir() -> pathlib.Path:
 PROJECTS: pathlib.Path = _choose_projects_dir()
 PROJECTS.mkdir(exist_ok=True)                     # ensure it exists
 
+catalog = Catalog(PROJECTS)                       # parsed configs, mtime-checked
+
 # ── helper functions (NO Flask imports here) ─────────────────────────────
 def projects_list() -> List[pathlib.Path]:
     """Return every project folder, sorted A->Z (case-insensitive)."""
@@ -45,9 +49,9 @@ def projects_list() -> List[pathlib.Path]:
 
 
 def load_config(pid: str) -> Optional[Dict]:
-    """Read <PROJECTS>/<pid>/config.json or return None."""
-    cfg = PROJECTS / pid / "config.json"
-    return json.load(cfg.open()) if cfg.exists() else None
+    """<PROJECTS>/<pid>/config.json (a private, mutable copy) or None."""
+    cfg = catalog.get(pid)
+    return copy.deepcopy(cfg) if cfg is not None else None
 
 
 def save_config(pid: str, data: Dict) -> None:
@@ -56,6 +60,7 @@ def save_config(pid: str, data: Dict) -> None:
     (root / "images").mkdir(parents=True, exist_ok=True)
     with (root / "config.json").open("w") as f:
         json.dump(data, f, indent=2)
+    catalog.invalidate(pid)
 
 
 def new_project_slug(name: str) -> str:
@@ -66,6 +71,7 @@ def new_project_slug(name: str) -> str:
 
 __all__ = [
     "PROJECTS",
+    "catalog",
     "projects_list",
     "load_config",
     "save_config",
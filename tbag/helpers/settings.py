@@ -1,6 +1,20 @@
+"""
+tbag.helpers.settings
+─────────────────────
+Robot teachpoints + teachpoint → LED wiring (`data/settings.json`).
 
+The file is parsed once and re-parsed only when its mtime / size moves;
+`led_pin()` answers from a precomputed map so the kiosk's per-step LED
+lookup is a dict hit.  Saves go through a temp file + rename so a crash
+mid-write never leaves a truncated settings file behind.
+"""
+import copy
 import json
 import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
 from ..config import DATA_DIR
 
 SETTINGS_FILE = DATA_DIR / "settings.json"
@@ -27,38 +41,90 @@ DEFAULT_SETTINGS = {
     }
 }
 
-def load_settings():
-    if not SETTINGS_FILE.exists():
-        save_settings(DEFAULT_SETTINGS)
-        return DEFAULT_SETTINGS
-    
+_lock = threading.Lock()
+_stamp = None              # (mtime_ns, size) of the parsed file
+_merged: Dict = {}
+_pins: Dict[str, int] = {}
+
+
+def _merge(data):
+    """DEFAULT_SETTINGS deep-merged with *data* (defaults never mutated)."""
+    merged = copy.deepcopy(DEFAULT_SETTINGS)
+    merged.update({k: v for k, v in data.items()
+                   if k not in ("teachpoints", "led_mapping")})
+
+    # Deep merge teachpoints / led_mapping
+    for section in ("teachpoints", "led_mapping"):
+        merged[section].update(data.get(section) or {})
+    return merged
+
+
+def _pin_map(merged):
+    pins = {}
+    for tp, pin in merged["led_mapping"].items():
+        try:
+            pins[tp.upper()] = int(pin)
+        except (TypeError, ValueError):
+            print(f"[WARN] invalid LED pin for position {tp}: {pin}", flush=True)
+    return pins
+
+
+def _current():
+    """Return the cached merged settings, re-parsing only on file change."""
+    global _stamp, _merged, _pins
     try:
-        with open(SETTINGS_FILE, "r") as f:
-            data = json.load(f)
-            # Merge with defaults
-            merged = DEFAULT_SETTINGS.copy()
-            merged.update(data)
-            
-            # Deep merge teachpoints
-            if "teachpoints" in data:
-                 for k, v in data["teachpoints"].items():
-                     if k in merged["teachpoints"]:
-                         merged["teachpoints"][k] = v
-            
-            # Deep merge led_mapping
-            if "led_mapping" in data:
-                for k, v in data["led_mapping"].items():
-                    if k in merged["led_mapping"]:
-                        merged["led_mapping"][k] = v
-            
-            return merged
-    except (json.JSONDecodeError, OSError):
-        return DEFAULT_SETTINGS
+        st = SETTINGS_FILE.stat()
+    except FileNotFoundError:
+        save_settings(DEFAULT_SETTINGS)            # first boot
+        try:
+            st = SETTINGS_FILE.stat()
+        except OSError:
+            st = None                              # read-only disk: defaults
+    stamp = (st.st_mtime_ns, st.st_size) if st else None
+    with _lock:
+        if stamp is None or stamp != _stamp:
+            try:
+                with open(SETTINGS_FILE, "r") as f:
+                    data = json.load(f)
+            except (json.JSONDecodeError, OSError):
+                data = {}
+            _merged = _merge(data)
+            _pins = _pin_map(_merged)
+            _stamp = stamp
+        return _merged
+
+
+def load_settings():
+    """Merged settings as a private, mutable copy."""
+    return copy.deepcopy(_current())
+
+
+def led_pin(position: str) -> Optional[int]:
+    """BCM pin wired to teachpoint *position* (e.g. 'p3'), or None."""
+    _current()
+    return _pins.get(position.upper())
+
 
 def save_settings(data):
+    """Atomically replace `settings.json` (temp file + rename)."""
+    global _stamp, _merged, _pins
     try:
-        with open(SETTINGS_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-        return True
+        fd, tmp = tempfile.mkstemp(dir=SETTINGS_FILE.parent,
+                                   prefix=".settings-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)             # mkstemp creates 0600
+            os.replace(tmp, SETTINGS_FILE)
+        except BaseException:
+            os.unlink(tmp)
+            raise
     except OSError:
         return False
+    with _lock:
+        _merged = _merge(data)
+        _pins = _pin_map(_merged)
+        _stamp = None            # next read re-stats (cheap) and confirms
+    return True
@@ -0,0 +1,235 @@
+"""
+tbag.helpers.xlsx
+─────────────────
+Minimal streaming ``.xlsx`` writer for the log exports.
+
+openpyxl builds the whole workbook before the first byte can be sent.
+Here every sheet is a row *iterator*: rows are turned into SpreadsheetML
+and deflated into a zip that is written to an unseekable sink, so the
+caller can hand `stream()` straight to a Flask ``Response`` and memory
+stays flat however many rows there are.
+
+Strings are written inline (no shared-string table) and styling is a
+fixed palette of named cell styles (see `STYLES`) – enough for the
+exports, nothing more.
+"""
+from __future__ import annotations
+
+import datetime as _dt
+import io
+import re
+import zipfile
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Sequence
+from xml.sax.saxutils import escape, quoteattr
+
+CHUNK = 16 << 10                  # flush compressed output in ~16 KiB pieces
+
+# name → index into <cellXfs> of `_STYLES_XML`
+STYLES = {
+    None:       0,
+    "bold":     1,
+    "title":    2,                # 14 pt bold, grey fill, centred
+    "header":   3,                # bold, light fill, boxed, centred
+    "cell":     4,                # left + right border
+    "cell_dt":  5,
+    "last":     6,                # left + right + bottom border
+    "last_dt":  7,
+    "datetime": 8,                # yyyy-mm-dd hh:mm:ss
+    "duration": 9,                # [m]:ss
+}
+
+
+class Cell(NamedTuple):
+    value: Any
+    style: Optional[str] = None
+
+
+class Sheet(NamedTuple):
+    title: str
+    rows: Iterable[Sequence[Any]]         # values or `Cell`s; [] = blank row
+    widths: Sequence[float] = ()
+    freeze: Optional[str] = None          # first scrolling cell, e.g. "A4"
+    autofilter: Optional[int] = None      # header row; runs to the last row
+    merge: Sequence[str] = ()             # e.g. ("A1:G1",)
+
+
+# ─────────────────────────────────────────── cell encoding
+_EPOCH = _dt.datetime(1899, 12, 30)
+_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_REF = re.compile(r"([A-Z]+)(\d+)")
+
+
+def col_letter(n: int) -> str:
+    """1 → A, 27 → AA."""
+    s = ""
+    while n:
+        n, r = divmod(n - 1, 26)
+        s = chr(65 + r) + s
+    return s
+
+
+def _cell(ref: str, value: Any, style: int) -> str:
+    s = f' s="{style}"' if style else ""
+    if value is None or value == "":
+        return f'<c r="{ref}"{s}/>' if style else ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{s}><v>{value!r}</v></c>'
+    if isinstance(value, _dt.datetime):
+        serial = (value.replace(tzinfo=None) - _EPOCH).total_seconds() / 86400
+        return f'<c r="{ref}"{s}><v>{serial!r}</v></c>'
+    text = escape(_ILLEGAL.sub("", str(value)))
+    return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _sheet_xml(sheet: Sheet) -> Iterator[str]:
+    yield ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+           '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">')
+    if sheet.freeze:
+        col, row = _REF.fullmatch(sheet.freeze).groups()
+        xs = sum((ord(ch) - 64) * 26 ** i for i, ch in enumerate(reversed(col))) - 1
+        ys = int(row) - 1
+        split = (f' xSplit="{xs}"' if xs else "") + (f' ySplit="{ys}"' if ys else "")
+        pane = ("bottom" if ys else "top") + ("Right" if xs else "Left")
+        yield (f'<sheetViews><sheetView workbookViewId="0"><pane{split} '
+               f'topLeftCell="{sheet.freeze}" activePane="{pane}" state="frozen"/>'
+               '</sheetView></sheetViews>')
+    if sheet.widths:
+        yield "<cols>" + "".join(
+            f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+            for i, w in enumerate(sheet.widths, 1)) + "</cols>"
+    yield "<sheetData>"
+    r = ncols = 0
+    for r, row in enumerate(sheet.rows, 1):
+        if not row:
+            continue
+        ncols = max(ncols, len(row))
+        cells = []
+        for c, v in enumerate(row, 1):
+            v, st = (v.value, STYLES[v.style]) if isinstance(v, Cell) else (v, 0)
+            cells.append(_cell(f"{col_letter(c)}{r}", v, st))
+        yield f'<row r="{r}">{"".join(cells)}</row>'
+    yield "</sheetData>"
+    if sheet.autofilter and r > sheet.autofilter and ncols:
+        yield f'<autoFilter ref="A{sheet.autofilter}:{col_letter(ncols)}{r}"/>'
+    if sheet.merge:
+        yield (f'<mergeCells count="{len(sheet.merge)}">'
+               + "".join(f'<mergeCell ref="{m}"/>' for m in sheet.merge)
+               + "</mergeCells>")
+    yield "</worksheet>"
+
+
+# ─────────────────────────────────────────── package parts
+_NS = "http://schemas.openxmlformats.org"
+
+_STYLES_XML = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{_NS}/spreadsheetml/2006/main">
+<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd hh:mm:ss"/><numFmt numFmtId="165" formatCode="[m]:ss"/></numFmts>
+<fonts count="3"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="14"/><name val="Calibri"/></font></fonts>
+<fills count="4"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill><fill><patternFill patternType="solid"><fgColor rgb="FFDDDDDD"/></patternFill></fill><fill><patternFill patternType="solid"><fgColor rgb="FFF2F2F2"/></patternFill></fill></fills>
+<borders count="4"><border/><border><left style="thin"/><right style="thin"/><top style="thin"/><bottom style="thin"/></border><border><left style="thin"/><right style="thin"/></border><border><left style="thin"/><right style="thin"/><bottom style="thin"/></border></borders>
+<cellStyleXfs count="1"><xf/></cellStyleXfs>
+<cellXfs count="10">
+<xf/>
+<xf fontId="1" applyFont="1"/>
+<xf fontId="2" fillId="2" applyFont="1" applyFill="1" applyAlignment="1"><alignment horizontal="center" vertical="center"/></xf>
+<xf fontId="1" fillId="3" borderId="1" applyFont="1" applyFill="1" applyBorder="1" applyAlignment="1"><alignment horizontal="center"/></xf>
+<xf borderId="2" applyBorder="1"/>
+<xf numFmtId="164" borderId="2" applyNumberFormat="1" applyBorder="1"/>
+<xf borderId="3" applyBorder="1"/>
+<xf numFmtId="164" borderId="3" applyNumberFormat="1" applyBorder="1"/>
+<xf numFmtId="164" applyNumberFormat="1"/>
+<xf numFmtId="165" applyNumberFormat="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+_ROOT_RELS = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="{_NS}/package/2006/relationships"><Relationship Id="rId1" Type="{_NS}/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/></Relationships>"""
+
+
+def _workbook_parts(titles: List[str]) -> Iterator[tuple]:
+    n = len(titles)
+    sheets = "".join(f'<sheet name={quoteattr(t[:31])} sheetId="{i}" r:id="rId{i}"/>'
+                     for i, t in enumerate(titles, 1))
+    yield "xl/workbook.xml", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<workbook xmlns="{_NS}/spreadsheetml/2006/main" '
+        f'xmlns:r="{_NS}/officeDocument/2006/relationships">'
+        f"<sheets>{sheets}</sheets></workbook>")
+    rels = "".join(f'<Relationship Id="rId{i}" Type="{_NS}/officeDocument/2006/'
+                   f'relationships/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                   for i in range(1, n + 1))
+    rels += (f'<Relationship Id="rId{n + 1}" Type="{_NS}/officeDocument/2006/'
+             'relationships/styles" Target="styles.xml"/>')
+    yield "xl/_rels/workbook.xml.rels", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Relationships xmlns="{_NS}/package/2006/relationships">{rels}</Relationships>')
+    yield "xl/styles.xml", _STYLES_XML
+    yield "_rels/.rels", _ROOT_RELS
+    ct = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+    overrides = "".join(f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                        f'ContentType="{ct}.worksheet+xml"/>' for i in range(1, n + 1))
+    yield "[Content_Types].xml", (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<Types xmlns="{_NS}/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        f'<Override PartName="/xl/workbook.xml" ContentType="{ct}.sheet.main+xml"/>'
+        f'<Override PartName="/xl/styles.xml" ContentType="{ct}.styles+xml"/>'
+        f"{overrides}</Types>")
+
+
+# ─────────────────────────────────────────── streaming
+class _Sink(io.RawIOBase):
+    """Unseekable write target: zipfile falls back to data descriptors."""
+
+    def __init__(self) -> None:
+        self._parts: List[bytes] = []
+        self.pending = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        self.pending += len(b)
+        return len(b)
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        self.pending = 0
+        return out
+
+
+def stream(sheets: Iterable[Sheet]) -> Iterator[bytes]:
+    """
+    Yield the ``.xlsx`` file for *sheets* in compressed chunks.  *sheets*
+    may itself be lazy – a sheet built from stats gathered while an
+    earlier one streamed is fine.
+    """
+    sink = _Sink()
+    titles: List[str] = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as zf:
+        for n, sheet in enumerate(sheets, 1):
+            titles.append(sheet.title)
+            with zf.open(f"xl/worksheets/sheet{n}.xml", "w") as f:
+                buf: List[str] = []
+                size = 0
+                for piece in _sheet_xml(sheet):
+                    buf.append(piece)
+                    size += len(piece)
+                    if size >= CHUNK:
+                        f.write("".join(buf).encode())
+                        buf, size = [], 0
+                        if sink.pending >= CHUNK:
+                            yield sink.drain()
+                f.write("".join(buf).encode())
+        for name, xml in _workbook_parts(titles):
+            zf.writestr(name, xml)
+    yield sink.drain()
+
+
+__all__ = ["Cell", "Sheet", "STYLES", "col_letter", "stream"]
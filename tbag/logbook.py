@@ -1,226 +1,264 @@
 """
 Shared log/timeline helpers + XLSX export.
+
+Exports are generators of file chunks (`tbag.helpers.xlsx.stream`): rows
+are read from a live cursor and written as they arrive.
 """
-import json, hashlib, io
-import sqlite3
-from typing import List, Dict
-from openpyxl import Workbook
-from openpyxl.utils import get_column_letter
-from .db import connect
+import csv, functools, hashlib, io, itertools, json
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from .db import connect, flush
+from .helpers import xlsx
+from .helpers.xlsx import Cell, Sheet, col_letter
 from .projects_helpers import load as load_project
 
+# ── sessions overview: one filtered, cursor-paginated query ────────────
+OVERVIEW_PAGE = 50
+OVERVIEW_FILTERS = ("project", "operator", "status", "date_from", "date_to")
+
+_OVERVIEW_COLS = ("SELECT ts_created, project, stack_id, operator, status, "
+                  "       interrupted_at, session_id, m.total_s "
+                  "FROM runs LEFT JOIN session_metrics m USING(session_id)")
+
+@functools.lru_cache(maxsize=512)
 def _hue(name:str)->int:
     return int(hashlib.md5(name.encode()).hexdigest()[:2],16)*360//255
 
-def overview_rows() -> list[dict]:
+def overview_where(filters:Dict[str,str])->Tuple[List[str],List]:
+    """
+    WHERE terms for *filters* (blank / malformed values are ignored).
+    Each equality filter has a ``(col, ts_created, session_id)`` index.
+    """
+    where, args = [], []
+    for col in ("project", "status"):
+        if filters.get(col):
+            where.append(f"{col} = ?"); args.append(filters[col])
+    if filters.get("operator"):
+        where.append("operator = ? COLLATE NOCASE"); args.append(filters["operator"])
+    for key, op, shift in (("date_from", ">=", 0), ("date_to", "<", 1)):
+        try:                                       # date_to is inclusive
+            day = date.fromisoformat(filters.get(key) or "")
+        except ValueError:
+            continue
+        where.append(f"ts_created {op} ?")
+        args.append((day + timedelta(days=shift)).isoformat())
+    return where, args
+
+def _overview_cursor(filters:Dict[str,str], before:str="", limit:Optional[int]=None):
+    """Live cursor over the matching runs, newest first, from *before* on."""
+    where, args = overview_where(filters)
+    if before:
+        ts, _, sid = before.partition("|")
+        where.append("(ts_created < ? OR (ts_created = ? AND session_id < ?))")
+        args += [ts, ts, sid]
+    sql = _OVERVIEW_COLS
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY ts_created DESC, session_id DESC"
+    if limit is not None:
+        sql += " LIMIT ?"; args.append(limit)
+    return connect().execute(sql, args)
+
+def overview_page(filters:Dict[str,str], before:str="",
+                  limit:int=OVERVIEW_PAGE)->Tuple[List[Dict],Optional[str]]:
     """
-    One dict per run, newest first.
-    Data comes directly from the `runs` table, not from the events table.
+    One page of runs for the /logs table → ``(rows, next_cursor)``.
+    *before* is the ``"<ts_created>|<session_id>"`` cursor of the previous
+    page's last row; ``next_cursor`` is None on the last page.
     """
-    rows: list[dict] = []
-    with connect() as c:
-        c.row_factory = sqlite3.Row
-        for r in c.execute(
-            "SELECT ts_created, project, stack_id, operator, status, "
-            "       interrupted_at, session_id "
-            "FROM runs ORDER BY ts_created DESC"
-        ).fetchall():
-
-            # map DB → fields expected by the template
-            kind = "end" if r["status"] == "finished" else "abort"
-            rows.append({
-                "ts":        r["ts_created"],
-                "project":   r["project"],
-                "stack_id":  r["stack_id"],
-                "operator":  r["operator"],
-                "kind":      kind,
-                "step":      r["interrupted_at"],
-                "session_id":r["session_id"],
-                "hue":       _hue(r["project"]),
-            })
-    return rows
+    found = _overview_cursor(filters, before, limit + 1).fetchall()
+    rows = [{
+        "ts":         r["ts_created"],
+        "project":    r["project"],
+        "stack_id":   r["stack_id"],
+        "operator":   r["operator"],
+        "status":     r["status"],
+        "step":       r["interrupted_at"],
+        "session_id": r["session_id"],
+        "duration_s": r["total_s"],
+        "hue":        _hue(r["project"]),
+    } for r in found[:limit]]
+    nxt = None
+    if len(found) > limit:
+        nxt = f"{rows[-1]['ts']}|{rows[-1]['session_id']}"
+    return rows, nxt
+
+def overview_projects()->List[str]:
+    """Projects that have runs (filter drop-down; index-only scan)."""
+    return [r[0] for r in connect().execute(
+        "SELECT DISTINCT project FROM runs ORDER BY project")]
+
+def overview_rows(filters:Optional[Dict[str,str]]=None)->Iterator[Dict]:
+    """Every matching run, newest first, read lazily from the cursor."""
+    for r in _overview_cursor(filters or {}):
+        yield dict(r)
+
+def iter_timeline(sid:str)->Iterator[Dict]:
+    """All events of one session, oldest first (index `events_session_ts`)."""
+    flush()                                   # include still-queued events
+    cur=connect().execute("SELECT ts,kind,payload FROM events "
+                          "WHERE session_id=? ORDER BY ts,rowid",(sid,))
+    for ts,k,p in cur:
+        yield {"ts":ts,"kind":k,"payload":json.loads(p) if p else {}}
 
 def timeline(sid:str)->List[Dict]:
-    with connect() as c:
-        cur=c.execute("SELECT ts,event FROM events WHERE event LIKE ? ORDER BY ts",(f"%{sid}%",))
-        data=[]
-        for ts,raw in cur.fetchall():
-            if "::" in raw:
-                k,p=raw.split("::",1); p=json.loads(p)
-            else: k,p=raw,{}
-            data.append({"ts":ts,"kind":k,"payload":p})
-        return data
-
-def _sheet(wb:Workbook,title,header,rows):
-    ws=wb.create_sheet(title); ws.append(header)
-    for r in rows: ws.append(r)
-    for col in range(1,len(header)+1):
-        ws.column_dimensions[get_column_letter(col)].width=16
-
-def export_overview()->io.BytesIO:
-    wb=Workbook(); wb.remove(wb.active)
-    dat=overview_rows()
-    _sheet(wb,"sessions",
-           ["Started","Project","Stack","Operator","Status","Step","Session"],
-           [[r["ts"],r["project"],r["stack"],r["operator"],
-             r["kind"],(r["step"]+1) if r["step"] else "",r["session"]] for r in dat])
-    buf=io.BytesIO(); wb.save(buf); buf.seek(0); return buf
-
-def export_detail(sid: str) -> io.BytesIO:
+    return list(iter_timeline(sid))
+
+# ── exports (streamed, see tbag.helpers.xlsx) ───────────────────────────
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CSV_MIME  = "text/csv"
+EXPORT_FORMATS = ("xlsx", "csv")
+
+OVERVIEW_HEADER = ["Started","Project","Stack","Operator","Status","Step","Session","Duration (s)"]
+
+def overview_count(filters:Optional[Dict[str,str]]=None)->int:
+    where, args = overview_where(filters or {})
+    sql = "SELECT COUNT(*) FROM runs" + (" WHERE " + " AND ".join(where) if where else "")
+    return connect().execute(sql, args).fetchone()[0]
+
+def _overview_table(filters, progress:Optional[Callable[[int],None]]):
+    n = 0
+    for r in overview_rows(filters):
+        step = r["interrupted_at"]
+        yield [r["ts_created"], r["project"], r["stack_id"], r["operator"],
+               r["status"], int(step)+1 if str(step or "").isdigit() else "",
+               r["session_id"], r["total_s"]]
+        n += 1
+        if progress and n % 500 == 0:
+            progress(n)
+    if progress:
+        progress(n)
+
+def csv_stream(header:list, rows:Iterable[Sequence], size:int=16 << 10,
+               bom:bool=True)->Iterator[bytes]:
+    """*header* + *rows* as UTF-8 CSV, in chunks of ≈ *size* bytes."""
+    buf = io.StringIO()
+    out = csv.writer(buf)
+    if bom:
+        buf.write("\ufeff")                   # BOM → Excel picks UTF-8
+    out.writerow(header)
+    for row in rows:
+        out.writerow(row)
+        if buf.tell() >= size:
+            yield buf.getvalue().encode()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue().encode()
+
+def export_overview(filters:Optional[Dict[str,str]]=None, fmt:str="xlsx",
+                    progress:Optional[Callable[[int],None]]=None)->Iterator[bytes]:
+    """
+    Runs matching *filters*, newest first – rows go out while read.
+    *progress* (if given) is called with the running row count.
+    """
+    rows = _overview_table(filters, progress)
+    if fmt == "csv":
+        return csv_stream(OVERVIEW_HEADER, rows)
+    return xlsx.stream([Sheet("sessions", itertools.chain([OVERVIEW_HEADER], rows),
+                              widths=[16]*8)])
+
+# ── per-session cycle times (precomputed by the `events_metrics` trigger) ─
+METRIC_KINDS = ("next_pressed", "session_end", "session_abort")
+_XL_EPOCH_JD = 2415018.5                      # julianday() of Excel's day 0
+
+def session_metrics(sid:str)->Optional[Dict]:
+    """
+    `session_metrics` row of *sid* (durations decoded, ``*_xl`` = Excel
+    serial dates) or None if no step was ever logged.
+    """
+    flush()                                   # include still-queued events
+    row = connect().execute(
+        f"""SELECT *, julianday(ts_first) - {_XL_EPOCH_JD} AS first_xl,
+                      julianday(ts_last)  - {_XL_EPOCH_JD} AS last_xl
+              FROM session_metrics WHERE session_id=?""", (sid,)).fetchone()
+    if row is None:
+        return None
+    m = dict(row)
+    m["durations"] = json.loads(m["durations"])
+    m["avg_step_s"] = (sum(m["durations"]) / len(m["durations"])
+                       if m["durations"] else None)
+    return m
+
+def _mmss(secs:int)->str:
+    return f"{secs//60:02d}:{secs%60:02d}"
+
+def export_detail(sid: str) -> Iterator[bytes]:
     """
     Pretty, human‑readable XLSX timeline for a session:
       - Big title row with the session id
       - Columns: Step #, Time, Since Start, Delta (s), Event, Component, Session ID
       - Frozen header, AutoFilter, sensible column widths
-      - 'Summary' sheet with start/end, total steps, duration
+      - 'Summary' sheet with start/end, steps, duration, step min/avg/max
+    Deltas and the summary come from `session_metrics`; SQLite turns the
+    timestamps into Excel serials, so no row is parsed in Python.
     """
-    from openpyxl import Workbook
-    from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
-    from openpyxl.utils import get_column_letter
-    from datetime import datetime
-
-    # ── 1) Pull events (existing helper) and normalize ──────────────────────────
-    tl = timeline(sid)  # [{ "ts": "...", "kind": "...", "payload": {.../str} }, ...]
-
-    rows = []
-    for e in tl:
-        ts_raw = e.get("ts")
-        kind = e.get("kind", "")
-        payload = e.get("payload") or {}
-
-        # payload might be a JSON-encoded string — make it a dict safely
-        if isinstance(payload, str):
-            try:
-                payload = json.loads(payload)
-            except Exception:
-                payload = {}
-
-        comp = payload.get("component")
-        sess = payload.get("session_id", sid)
-
-        # Try to parse TS to datetime (for Excel date formatting, deltas, etc)
-        ts_dt = None
-        if isinstance(ts_raw, str):
-            try:
-                ts_dt = datetime.fromisoformat(ts_raw)
-            except Exception:
-                ts_dt = None
-
-        rows.append({"ts_raw": ts_raw, "ts_dt": ts_dt, "kind": kind,
-                     "component": comp, "session_id": sess})
-
-    # Empty session safety: return a blank workbook
-    wb = Workbook()
-    wb.remove(wb.active)  # we'll create sheets ourselves
-
-    ws = wb.create_sheet("Timeline")
-
-    # Title
     cols = ["Step #", "Time", "Since Start (mm:ss)", "Delta (s)", "Event", "Component", "Session ID"]
-    ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=len(cols))
-    title_cell = ws.cell(row=1, column=1, value=f"TBAG Session Timeline — {sid}")
-    title_cell.font = Font(size=14, bold=True)
-    title_cell.alignment = Alignment(horizontal="center", vertical="center")
-    title_cell.fill = PatternFill("solid", fgColor="DDDDDD")
-
-    # Header
-    header_row = 3
-    thin = Side(style="thin")
-    for j, col in enumerate(cols, start=1):
-        c = ws.cell(row=header_row, column=j, value=col)
-        c.font = Font(bold=True)
-        c.alignment = Alignment(horizontal="center")
-        c.fill = PatternFill("solid", fgColor="F2F2F2")
-        c.border = Border(top=thin, left=thin, right=thin, bottom=thin)
-
-    # If there are no rows, still return the workbook (with title + header)
-    if not rows:
-        buf = io.BytesIO(); wb.save(buf); buf.seek(0); return buf
-
-    # ── 2) Compute step numbers, deltas, since‑start ────────────────────────────
-    # Use the first valid datetime as start; if none parse, we won't compute deltas
-    ts_dts = [r["ts_dt"] for r in rows if r["ts_dt"] is not None]
-    start_dt = ts_dts[0] if ts_dts else None
-
-    def fmt_since_start(d: datetime) -> str:
-        if start_dt is None or d is None:
-            return ""
-        secs = int((d - start_dt).total_seconds())
-        return f"{secs//60:02d}:{secs%60:02d}"
-
-    def delta_seconds(prev: datetime, cur: datetime):
-        if prev is None or cur is None:
-            return None
-        return int((cur - prev).total_seconds())
-
-    prev_dt = None
-    for i, r in enumerate(rows, start=1):
-        time_cell_value = r["ts_dt"] if r["ts_dt"] is not None else r["ts_raw"]
-        since_start = fmt_since_start(r["ts_dt"])
-        delta_s = delta_seconds(prev_dt, r["ts_dt"]) if i > 1 else None
-        prev_dt = r["ts_dt"]
-
-        values = [
-            i,                               # Step #
-            time_cell_value,                 # Time (datetime if parsed, else str)
-            since_start,                     # Since Start
-            delta_s,                         # Delta (s)
-            r["kind"],                       # Event
-            r["component"],                  # Component
-            r["session_id"],                 # Session ID
-        ]
-        for j, v in enumerate(values, start=1):
-            c = ws.cell(row=header_row + i, column=j, value=v)
-            # Formatting
-            if j == 2 and isinstance(v, datetime):
-                c.number_format = "yyyy-mm-dd hh:mm:ss"
-            if j == 4 and isinstance(v, int):
-                c.number_format = "0"
-            c.border = Border(left=thin, right=thin)
-
-    # Bottom border on last data row
-    last_row = header_row + len(rows)
-    for j in range(1, len(cols) + 1):
-        ws.cell(row=last_row, column=j).border = Border(bottom=thin, left=thin, right=thin)
-
-    # Column widths
-    widths = [8, 20, 16, 10, 16, 28, 16]
-    for idx, w in enumerate(widths, start=1):
-        ws.column_dimensions[get_column_letter(idx)].width = w
-
-    # Freeze panes & AutoFilter
-    ws.freeze_panes = ws["A4"]
-    ws.auto_filter.ref = f"A{header_row}:{get_column_letter(len(cols))}{last_row}"
-
-    # ── 3) Summary sheet ────────────────────────────────────────────────────────
-    ws2 = wb.create_sheet("Summary")
-    ws2["A1"], ws2["B1"] = "Session ID", sid
-
-    # Start/End/Durations only if we had valid datetimes
-    if ts_dts:
-        start = min(ts_dts); end = max(ts_dts)
-        duration_secs = int((end - start).total_seconds())
-
-        ws2["A2"], ws2["B2"] = "Start Time", start
-        ws2["A3"], ws2["B3"] = "End Time", end
-        ws2["A4"], ws2["B4"] = "Total Steps", len(rows)
-
-        # Excel time is a fraction of a day — store seconds/86400 and format as [m]:ss
-        ws2["A5"], ws2["B5"] = "Duration (mm:ss)", duration_secs / 86400.0
-        ws2["B2"].number_format = ws2["B3"].number_format = "yyyy-mm-dd hh:mm:ss"
-        ws2["B5"].number_format = "[m]:ss"
-    else:
-        ws2["A2"], ws2["B2"] = "Note", "Timestamps were not ISO-8601; summary timing unavailable."
-        ws2["A4"], ws2["B4"] = "Total Steps", len(rows)
-
-    ws2.column_dimensions["A"].width = 22
-    ws2.column_dimensions["B"].width = 32
-    for r in range(1, 6):
-        ws2[f"A{r}"].font = Font(bold=True)
-
-    # ── 4) Return as BytesIO ────────────────────────────────────────────────────
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf
-
+    metrics = session_metrics(sid)
+    durations = metrics["durations"] if metrics else []
+    n_rows = 0
+
+    def timeline_rows():
+        nonlocal n_rows
+        yield [Cell(f"TBAG Session Timeline — {sid}", "title")] + \
+              [Cell(None, "title")] * (len(cols) - 1)
+        yield []
+        yield [Cell(c, "header") for c in cols]
+
+        cur = connect().execute(
+            f"""SELECT ts, julianday(ts) - {_XL_EPOCH_JD} AS xl, kind, payload
+                  FROM events WHERE session_id=? ORDER BY ts, rowid""", (sid,))
+        k = -1                                # metric events seen so far - 1
+        since = 0
+        pending = None
+        for i, (ts, xl, kind, raw) in enumerate(cur, start=1):
+            payload = json.loads(raw) if raw else {}
+            if not isinstance(payload, dict):
+                payload = {}
+            delta = None
+            if kind in METRIC_KINDS:
+                if 0 <= k < len(durations):
+                    delta = durations[k]
+                    since += delta
+                k += 1
+            n_rows = i
+
+            if pending is not None:           # one row of look-ahead so the
+                yield _styled(pending, False) # last one gets a bottom border
+            pending = [i, xl if xl is not None else ts,
+                       _mmss(since) if k >= 0 else "", delta,
+                       kind, payload.get("component"),
+                       payload.get("session_id", sid)]
+        if pending is not None:
+            yield _styled(pending, True)
+
+    def summary_rows():
+        yield [Cell("Session ID", "bold"), sid]
+        if metrics is not None and metrics["first_xl"] is not None:
+            yield [Cell("Start Time", "bold"), Cell(metrics["first_xl"], "datetime")]
+            yield [Cell("End Time", "bold"), Cell(metrics["last_xl"], "datetime")]
+            yield [Cell("Steps", "bold"), metrics["steps"]]
+            # Excel time is a fraction of a day → [m]:ss
+            yield [Cell("Duration (mm:ss)", "bold"),
+                   Cell(metrics["total_s"] / 86400.0, "duration")]
+            yield [Cell("Fastest Step (s)", "bold"), metrics["min_step_s"]]
+            yield [Cell("Slowest Step (s)", "bold"), metrics["max_step_s"]]
+            if metrics["avg_step_s"] is not None:
+                yield [Cell("Average Step (s)", "bold"), round(metrics["avg_step_s"], 1)]
+        else:
+            yield [Cell("Note", "bold"),
+                   "No step events recorded; summary timing unavailable."]
+            yield []
+            yield [Cell("Events", "bold"), n_rows]
+
+    def sheets():
+        yield Sheet("Timeline", timeline_rows(),
+                    widths=[8, 20, 16, 10, 16, 28, 16], freeze="A4",
+                    autofilter=3, merge=[f"A1:{col_letter(len(cols))}1"])
+        if n_rows:                            # empty session → timeline only
+            yield Sheet("Summary", summary_rows(), widths=[22, 32])
+
+    return xlsx.stream(sheets())
+
+def _styled(values: list, last: bool) -> list:
+    base = "last" if last else "cell"
+    return [Cell(v, base + "_dt" if j == 1 and isinstance(v, float) else base)
+            for j, v in enumerate(values)]
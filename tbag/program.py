@@ -0,0 +1,614 @@
+"""
+tbag.program
+────────────
+Robot program (``.pg``) compiler – project recipe + teachpoints → lines.
+
+Pure Python (no Flask), so the download endpoint and any batch / CLI
+caller share one implementation.
+
+• Pick offsets come from a single reverse pass over the sequence with a
+  running thickness sum per source teachpoint – O(n) instead of O(n²).
+• `compile_program()` is a generator: callers join, stream or hash the
+  lines as they see fit.
+• `ProgramCache` keeps finished programs keyed by a hash of everything
+  they depend on (sequence + teachpoints + compiler version), so an
+  edit to either simply produces a new key – nothing to invalidate.
+• `encode_chunks()` + `ProgramCache.stream()` let a download go out in
+  ~16 KiB pieces while it is compiled (and cached), so memory stays flat
+  however tall the stack is.
+• `compile_many()` compiles a batch of recipes – each distinct one once –
+  in a small process pool, for multi-run downloads.
+• `program_archive` (opt-in, ``TBAG_PROGRAM_ARCHIVE``) keeps a copy of
+  every program handed out; written off the request thread.  It is None
+  when disabled, so the download path does no extra file I/O.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import pathlib
+import queue
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .config import DATA_DIR, PROGRAM_ARCHIVE, PROGRAM_ARCHIVE_KEEP
+
+HOME_TP    = "P22"            # home pose; its Z is the global clearance height
+DEST_TP    = "P21"            # stack build position
+DEFAULT_TP = "P1"             # source used when a step names none
+
+_ORIGIN = {"x": 0.0, "y": 0.0, "z": 0.0, "r": 0.0}
+
+COMPILER_VERSION = 1          # bump whenever the emitted program text changes
+
+
+def source_tp(step: Dict) -> str:
+    """Normalised source teachpoint of *step* (blank → `DEFAULT_TP`)."""
+    return (step.get("teachpoint") or DEFAULT_TP).strip().upper() or DEFAULT_TP
+
+
+def pick_offsets(sequence: List[Dict]) -> List[Tuple[str, float]]:
+    """
+    ``(source_tp, z_offset)`` per step.  A step's pick offset is the sum of
+    the thicknesses of all *later* steps picked from the same teachpoint
+    (they still sit on top of it).
+    """
+    out: List[Tuple[str, float]] = [("", 0.0)] * len(sequence)
+    above: Dict[str, float] = {}
+    for i in range(len(sequence) - 1, -1, -1):
+        tp = source_tp(sequence[i])
+        out[i] = (tp, above.get(tp, 0.0))
+        above[tp] = above.get(tp, 0.0) + float(sequence[i].get("thickness", 0.0))
+    return out
+
+
+def _pose(tps: Dict, name: str, fallback: Dict = _ORIGIN) -> Tuple[float, ...]:
+    t = tps.get(name, fallback)
+    return tuple(float(t.get(k, 0.0)) for k in ("x", "y", "z", "r"))
+
+
+def compile_program(sequence: List[Dict], teachpoints: Dict) -> Iterator[str]:
+    """Yield the ``.pg`` program for *sequence*, one line at a time."""
+    tps = teachpoints
+    offsets = pick_offsets(sequence)
+    per_tp: Dict[str, int] = {}
+    for tp, _ in offsets:
+        per_tp[tp] = per_tp.get(tp, 0) + 1
+
+    # Global clearance height is taken from P22 Z
+    clearance_z = float(tps.get(HOME_TP, {}).get("z", 39.0))
+    dx, dy, dest_base_z, dr = _pose(tps, DEST_TP)
+    cx = f"{clearance_z:g}"
+    dx, dy, dr = f"{dx:g}", f"{dy:g}", f"{dr:g}"
+    dbz = f"{dest_base_z:g}"
+
+    # ── Program header ───────────────────────────────────────────────────
+    yield from (
+        "Process Main",
+        "",
+        "int speed = 40",
+        "int acc = 40",
+        "int dec = 40",
+        "int cp = 0",
+        "",
+        "User(0)",
+        "Tool(0)",
+        "",
+        "",
+        "// --------------------------------------------------",
+        "// MOVE TO HOME POSITION (Pn22)",
+        "// --------------------------------------------------",
+        "MOVJ(Pn(22), speed, acc, dec, cp)",
+        "",
+        "",
+    )
+
+    dest_z_offset = 0.0   # accumulates target Z height per stacked layer
+    last = len(sequence)
+
+    for step_idx, (step, (src_tp, src_z_offset)) in enumerate(zip(sequence, offsets), 1):
+        thick_val = float(step.get("thickness", 0.0))
+        label     = step.get("label", f"Component {step_idx}").strip() or f"Component {step_idx}"
+
+        if step.get("manual", False):
+            yield from (
+                "// ==================================================",
+                f"// MANUAL COMPONENT {step_idx}: {label}",
+                "// Go to Home and Wait 10 seconds for human placement",
+                "// ==================================================",
+                "",
+                "MOVJ(Pn(22), speed, acc, dec, cp)",
+                "Delay(10000)",
+                "Open(2)",
+                "",
+                "",
+            )
+            dest_z_offset += thick_val
+            continue
+
+        src_x, src_y, src_base_z, src_r = _pose(tps, src_tp, tps.get(DEFAULT_TP, _ORIGIN))
+        sx, sy, sr = f"{src_x:g}", f"{src_y:g}", f"{src_r:g}"
+        sbz = f"{src_base_z:g}"
+        pz  = f"{src_base_z + src_z_offset:g}"
+        plz = f"{dest_base_z + dest_z_offset:g}"
+
+        above_src = f"MOVL(BuildPoint({sx},{sy},{cx},{sr},1), speed, acc, dec, cp)"
+        at_src    = f"MOVL(BuildPoint({sx},{sy},{pz},{sr},1), speed, acc, dec, cp)"
+        above_dst = f"MOVL(BuildPoint({dx},{dy},{cx},{dr},1), speed, acc, dec, cp)"
+        at_dst    = f"MOVL(BuildPoint({dx},{dy},{plz},{dr},1), speed, acc, dec, cp)"
+
+        yield "// =================================================="
+        if step_idx == 1:
+            yield f"// PICK {step_idx}  (Top component at {src_tp})"
+            yield f"// Base Z = {sbz}"
+            if per_tp[src_tp] > 1:
+                yield f"// {per_tp[src_tp]} components × {thick_val:g}mm"
+            yield f"// Top Z = {pz}"
+        elif step_idx == last:
+            yield f"// PICK {step_idx}  (Last component, base Z = {sbz})"
+        else:
+            yield f"// PICK {step_idx}  (Z = {pz})"
+        yield "// =================================================="
+        yield ""
+
+        # pick
+        if step_idx == 1:
+            yield from (
+                f"// Move above {src_tp} at global clearance height",
+                above_src,
+                "",
+                f"// Descend to top component ({pz})",
+                at_src,
+                "Open(0)",
+                "Open(2)",
+                "Delay(1000)",
+                "",
+                "// Retract vertically to clearance",
+                above_src,
+                "",
+                "",
+            )
+        else:
+            yield from (above_src, at_src, "Open(0)", "Open(2)", "Delay(1000)",
+                        above_src, "", "")
+
+        # place
+        if step_idx == 1:
+            yield f"// Place at {DEST_TP} level 1 (stack base = {dbz})"
+        else:
+            yield f"// Place level {step_idx} ({plz})"
+        yield from (above_dst, at_dst, "Close(0)", "Close(2)", "Delay(1000)",
+                    above_dst, "", "")
+
+        dest_z_offset += thick_val
+
+    # ── Return to home P22 ───────────────────────────────────────────────
+    yield from (
+        "// --------------------------------------------------",
+        "// RETURN TO HOME",
+        "// --------------------------------------------------",
+        "MOVJ(Pn(22), speed, acc, dec, cp)",
+        "",
+        "ProcessEnd",
+    )
+
+
+def encode_chunks(lines: Iterable[str], size: int = 16 << 10) -> Iterator[bytes]:
+    """CRLF-join *lines* (no trailing CRLF) into UTF-8 chunks of ≈ *size*."""
+    buf: List[str] = []
+    n = 0
+    sep = ""
+    for line in lines:
+        buf.append(sep)
+        buf.append(line)
+        sep = "\r\n"
+        n += len(line) + 2
+        if n >= size:
+            yield "".join(buf).encode()
+            buf, n = [], 0
+    if buf:
+        yield "".join(buf).encode()
+
+
+# ─────────────────────────────────────────── program cache
+def program_key(sequence: List[Dict], teachpoints: Dict) -> str:
+    """Content address of the program compiled from these inputs."""
+    blob = json.dumps([COMPILER_VERSION, sequence, teachpoints],
+                      sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(blob.encode()).hexdigest()[:32]
+
+
+class ProgramCache:
+    """
+    Two-level cache of encoded programs: an in-memory LRU in front of
+    ``<root>/<key>.pg`` files.  Both levels are size-bounded; the disk
+    level evicts least-recently-used files (mtime is bumped on hits).
+    """
+
+    def __init__(self, root: pathlib.Path, mem_bytes: int = 4 << 20,
+                 disk_bytes: int = 64 << 20) -> None:
+        self.root = root
+        self.mem_bytes = mem_bytes
+        self.disk_bytes = disk_bytes
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                return data
+        path = self.root / f"{key}.pg"
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def open(self, key: str, block: int = 64 << 10) -> Optional[Iterator[bytes]]:
+        """Cached program as a chunk iterator (disk hits are read lazily)."""
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+                return iter((data,))
+        path = self.root / f"{key}.pg"
+        try:
+            f = path.open("rb")
+            os.utime(path)
+        except OSError:
+            return None
+
+        def _read() -> Iterator[bytes]:
+            with f:
+                while chunk := f.read(block):
+                    yield chunk
+        return _read()
+
+    def stream(self, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Pass *chunks* through while teeing them into the cache.  The entry
+        only appears once the stream has been consumed completely; an
+        abandoned download leaves nothing behind.
+        """
+        keep: Optional[List[bytes]] = []      # memory copy while still small
+        size = 0
+        tmp = None
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            out = os.fdopen(fd, "wb")
+        except OSError as exc:
+            print(f"[WARN] program cache write failed: {exc}", flush=True)
+            out = None
+        done = False
+        try:
+            for chunk in chunks:
+                if out is not None:
+                    out.write(chunk)
+                if keep is not None:
+                    size += len(chunk)
+                    if size <= self._mem_item_max:
+                        keep.append(chunk)
+                    else:
+                        keep = None
+                yield chunk
+            done = True
+        finally:
+            if out is not None:
+                out.close()
+                try:
+                    if done:
+                        os.replace(tmp, self.root / f"{key}.pg")
+                        self._evict_disk()
+                    else:
+                        os.unlink(tmp)
+                except OSError as exc:
+                    print(f"[WARN] program cache write failed: {exc}", flush=True)
+            if done and keep is not None:
+                self._remember(key, b"".join(keep))
+
+    def put(self, key: str, data: bytes) -> None:
+        self._remember(key, data)
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.root / f"{key}.pg")
+            self._evict_disk()
+        except OSError as exc:                   # cache is best-effort
+            print(f"[WARN] program cache write failed: {exc}", flush=True)
+
+    @property
+    def _mem_item_max(self) -> int:
+        return self.mem_bytes // 8            # big programs live on disk only
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self._mem_item_max:
+            return
+        with self._lock:
+            old = self._mem.pop(key, None)
+            if old is not None:
+                self._mem_size -= len(old)
+            self._mem[key] = data
+            self._mem_size += len(data)
+            while self._mem_size > self.mem_bytes:
+                _, dropped = self._mem.popitem(last=False)
+                self._mem_size -= len(dropped)
+
+    def _evict_disk(self) -> None:
+        files = []
+        for p in self.root.glob("*.pg"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+        total = sum(size for _, size, _ in files)
+        for _, size, p in sorted(files, key=lambda f: f[0]):
+            if total <= self.disk_bytes:
+                break
+            p.unlink(missing_ok=True)
+            total -= size
+
+
+program_cache = ProgramCache(DATA_DIR / "program_cache")
+
+
+# ─────────────────────────────────────────── artifact archive (opt-in)
+class _Stream:
+    """One `ProgramArchive.tee` download on its way to the writer thread."""
+
+    __slots__ = ("name", "key", "dropped")
+
+    def __init__(self, name: str, key: str) -> None:
+        self.name, self.key = name, key
+        self.dropped = False            # queue was full – no copy of this one
+
+
+_END = object()                         # `tee` stream: sent completely
+_ABORT = object()                       # `tee` stream: download aborted
+
+
+class ProgramArchive:
+    """
+    ``<root>/<name>_<key>.pg`` for every program handed out.  A background
+    thread does the writing and keeps only the newest *keep* files; the
+    same program downloaded again just has its mtime refreshed.  A
+    streamed download (`tee`) hands its chunks to that thread through the
+    same bounded queue – the request thread does no file I/O, and the
+    archive never holds more than the queue's chunks in memory.  Only if
+    the card falls behind does a download wait (up to `_STALL` s per
+    chunk, then that copy is given up).
+    """
+
+    _QUEUE = 64                         # items – ≈ 1 MiB of 16 KiB chunks
+    _STALL = 2.0                        # s a download waits for a full queue
+
+    def __init__(self, root: pathlib.Path, keep: int = 200) -> None:
+        self.root = root
+        self.keep = keep
+        # (name, key, chunks) from `submit`, (stream, chunk | _END | _ABORT) from `tee`
+        self._q: "queue.Queue[tuple]" = queue.Queue(maxsize=self._QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._open: Dict[_Stream, Optional[Tuple[object, pathlib.Path]]] = {}
+
+    def submit(self, name: str, key: str, chunks: List[bytes]) -> None:
+        """Queue one program for writing; never blocks the caller."""
+        self._start()
+        try:
+            self._q.put_nowait((name, key, chunks))
+        except queue.Full:
+            print(f"[WARN] program archive busy – skipped {name}", flush=True)
+
+    def tee(self, name: str, key: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass *chunks* through, queueing a copy; archived once fully sent."""
+        self._start()
+        stream = _Stream(name, key)
+
+        def send(item) -> None:
+            if stream.dropped:
+                return
+            try:                                 # writer behind: brief back-pressure
+                self._q.put((stream, item), timeout=self._STALL)
+            except queue.Full:                   # archive is best-effort
+                stream.dropped = True
+                print(f"[WARN] program archive busy – skipped {name}", flush=True)
+
+        try:
+            for chunk in chunks:
+                send(chunk)
+                yield chunk
+        except BaseException:                    # aborted download: no copy
+            send(_ABORT)
+            raise
+        send(_END)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="program-archive", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._q.get()
+            try:
+                if isinstance(item[0], _Stream):
+                    self._stream(*item)
+                else:
+                    self._write(*item)
+            except OSError as exc:               # archive is best-effort
+                print(f"[WARN] program archive write failed: {exc}", flush=True)
+                if isinstance(item[0], _Stream):
+                    self._discard(item[0])
+                    item[0].dropped = True
+
+    def _path(self, name: str, key: str) -> pathlib.Path:
+        stem = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+        return self.root / f"{stem}_{key}.pg"
+
+    def _write(self, name: str, key: str, chunks: List[bytes]) -> None:
+        path = self._path(name, key)
+        if path.exists():
+            os.utime(path)
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.writelines(chunks)
+        os.replace(tmp, path)
+        self._rotate()
+
+    def _stream(self, stream: _Stream, item) -> None:
+        """One queued piece of a `tee` download → temp file → archive."""
+        if stream.dropped or item is _ABORT:
+            self._discard(stream)
+            return
+        if stream not in self._open:             # first piece
+            path = self._path(stream.name, stream.key)
+            if path.exists():                    # refresh its mtime, keep it
+                os.utime(path)
+                self._open[stream] = None
+            else:
+                self.root.mkdir(parents=True, exist_ok=True)
+                fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                self._open[stream] = (os.fdopen(fd, "wb"), pathlib.Path(tmp))
+        target = self._open[stream]
+        if item is _END:
+            del self._open[stream]
+            if target is not None:
+                f, tmp = target
+                f.close()
+                os.replace(tmp, self._path(stream.name, stream.key))
+                self._rotate()
+        elif target is not None:
+            target[0].write(item)
+
+    def _discard(self, stream: _Stream) -> None:
+        target = self._open.pop(stream, None)
+        if target is not None:
+            f, tmp = target
+            f.close()
+            tmp.unlink(missing_ok=True)
+
+    def _rotate(self) -> None:
+        files = []
+        for p in self.root.glob("*.pg"):
+            try:
+                files.append((p.stat().st_mtime, p))
+            except OSError:
+                continue
+        files.sort(key=lambda f: f[0], reverse=True)
+        for _, p in files[self.keep:]:
+            p.unlink(missing_ok=True)
+
+
+program_archive: Optional[ProgramArchive] = (
+    ProgramArchive(PROGRAM_ARCHIVE, PROGRAM_ARCHIVE_KEEP) if PROGRAM_ARCHIVE else None
+)
+
+
+# ─────────────────────────────────────────── batch compilation
+_pool: Optional[Executor] = None
+_pool_lock = threading.Lock()
+
+
+def _compile_bytes(sequence: List[Dict], teachpoints: Dict) -> bytes:
+    """Pool entry point (module-level so it pickles)."""
+    return b"".join(encode_chunks(compile_program(sequence, teachpoints)))
+
+
+def _executor() -> Executor:
+    # *spawn*, not fork: forking a threaded gunicorn worker can deadlock
+    # (workers re-import __main__ – app.py keeps its start-up behind a guard)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _drop_executor(pool: Executor) -> None:
+    """Forget *pool* after `BrokenProcessPool` (a worker died) – next call rebuilds."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def compile_many(recipes: Dict[str, List[Dict]],
+                 teachpoints: Dict) -> Dict[str, Tuple[str, bytes]]:
+    """
+    ``{name: sequence}`` → ``{name: (key, program)}``.
+
+    Teachpoints are resolved once for the whole batch, identical recipes
+    share one compile, cache hits skip the pool, and fresh results are
+    added to `program_cache`.
+    """
+    keys = {name: program_key(seq, teachpoints) for name, seq in recipes.items()}
+    done: Dict[str, bytes] = {}
+    todo: Dict[str, List[Dict]] = {}
+    for name, key in keys.items():
+        if key in done or key in todo:
+            continue
+        hit = program_cache.get(key)
+        if hit is not None:
+            done[key] = hit
+        else:
+            todo[key] = recipes[name]
+
+    for attempt in (1, 2):               # a killed worker breaks the pool once
+        if not todo:
+            break
+        pool = _executor()
+        try:
+            futures = {key: pool.submit(_compile_bytes, seq, teachpoints)
+                       for key, seq in todo.items()}
+            for key, fut in futures.items():
+                done[key] = fut.result()
+                program_cache.put(key, done[key])
+                del todo[key]
+        except BrokenProcessPool:
+            _drop_executor(pool)
+            if attempt == 2:
+                raise
+
+    return {name: (key, done[key]) for name, key in keys.items()}
+
+
+__all__ = [
+    "COMPILER_VERSION",
+    "program_key",
+    "ProgramCache",
+    "program_cache",
+    "ProgramArchive",
+    "program_archive",
+    "HOME_TP",
+    "DEST_TP",
+    "DEFAULT_TP",
+    "source_tp",
+    "pick_offsets",
+    "compile_program",
+    "encode_chunks",
+    "compile_many",
+]
@@ -0,0 +1,156 @@
+"""
+tbag.sync
+─────────
+Station side of fleet mode (`TBAG_CENTRAL_URL` + `TBAG_DEVICE_TOKEN`).
+
+The kiosk never waits on the network while a run is in progress:
+
+• progress is recorded locally – `tbag.db.log()` appends to `events`,
+  which on a station is the journal (per-session `seq_no`)
+• `Uploader` – one daemon thread – ships journal rows past the
+  ``counters.sync`` high-water mark (audit `seq`, which is never reused
+  – rowids are, once rows are deleted) to ``POST /api/fleet/sync`` in
+  batches of `BATCH`, and only moves the mark once the server answered.
+  The server keys rows by ``(session_id, seq_no)``, so re-sending a batch
+  after a lost reply stores nothing twice.  A dead link just means
+  retries with back-off; the journal keeps growing locally meanwhile.
+• `fetch_run()` – the only blocking call – asks the server for the next
+  run while the kiosk is idle (`/api/pending/wait`).
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from .config import CENTRAL_URL, DEVICE_TOKEN
+from .db import connect
+
+BATCH = 200              # journal rows per upload
+_INTERVAL = 2.0          # idle re-check of the journal
+_BACKOFF_MAX = 60.0      # seconds between retries while the link is down
+
+enabled = bool(CENTRAL_URL and DEVICE_TOKEN)
+
+
+def _post(path: str, body: Optional[dict], timeout: float):
+    req = urllib.request.Request(
+        f"{CENTRAL_URL}{path}",
+        data=json.dumps(body or {}).encode(),
+        headers={"Content-Type": "application/json",
+                 "Authorization": f"Bearer {DEVICE_TOKEN}"},
+        method="POST",
+    )
+    return urllib.request.urlopen(req, timeout=timeout)
+
+
+# ─────────────────────────────────────────── claim (idle kiosk only)
+def fetch_run(wait: float) -> Tuple[Optional[Dict], float]:
+    """
+    Long-poll the server for this station's next run → ``({"session",
+    "plan"}, 0)``, or ``(None, seconds to wait before asking again)``
+    when nothing came within *wait* (the server's ``Retry-After``).
+    Raises OSError (incl. `urllib.error.URLError`) when the server
+    cannot be reached.
+    """
+    with _post(f"/api/fleet/claim?wait={wait:g}", None, wait + 10) as resp:
+        if resp.status == 204:
+            try:
+                return None, float(resp.headers.get("Retry-After") or 0)
+            except ValueError:
+                return None, 0
+        return json.loads(resp.read()), 0
+
+
+# ─────────────────────────────────────────── journal upload
+def _mark(c) -> int:
+    row = c.execute("SELECT value FROM counters WHERE name='sync'").fetchone()
+    return row[0] if row else 0
+
+
+def pending() -> int:
+    """Journal rows not yet acknowledged by the server."""
+    c = connect()
+    return c.execute(
+        "SELECT count(*) FROM events WHERE seq > ? AND seq_no IS NOT NULL",
+        (_mark(c),)).fetchone()[0]
+
+
+def _batch(c) -> List[tuple]:
+    return c.execute(
+        """SELECT seq, ts, kind, session_id, payload, seq_no, ts_us FROM events
+            WHERE seq > ? AND seq_no IS NOT NULL
+            ORDER BY seq LIMIT ?""", (_mark(c), BATCH)).fetchall()
+
+
+def upload_once() -> int:
+    """Ship one batch; → rows sent (0 = journal drained).  Raises OSError."""
+    c = connect()
+    rows = _batch(c)
+    if not rows:
+        return 0
+    entries = [{"ts": ts, "kind": kind, "session_id": sid,
+                "payload": json.loads(p) if p else None, "seq_no": seq,
+                "ts_us": ts_us}
+               for _, ts, kind, sid, p, seq, ts_us in rows]
+    with _post("/api/fleet/sync", {"entries": entries}, 30) as resp:
+        result = json.loads(resp.read())
+    if result.get("rejected"):
+        print(f"[WARN] sync: server rejected {result['rejected']} journal rows "
+              "(sessions not assigned to this station)", flush=True)
+    with connect() as c:
+        c.execute("""INSERT INTO counters(name, value) VALUES('sync', ?)
+                     ON CONFLICT(name) DO UPDATE SET value = excluded.value""",
+                  (rows[-1][0],))
+    return len(rows)
+
+
+class Uploader:
+    """Daemon thread draining the journal to the server."""
+
+    def __init__(self) -> None:
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def kick(self) -> None:
+        """New journal rows – upload soon (no-op when not a station)."""
+        if not enabled:
+            return
+        self._ensure_running()
+        self._wake.set()
+
+    def _ensure_running(self) -> None:
+        with self._lock:
+            if (self._thread is not None and self._pid == os.getpid()
+                    and self._thread.is_alive()):
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name="tbag-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        delay = _INTERVAL
+        while True:
+            self._wake.wait(delay)
+            self._wake.clear()
+            try:
+                while upload_once() == BATCH:
+                    pass
+                delay = _INTERVAL
+            except (OSError, ValueError, sqlite3.Error) as exc:  # link down …
+                delay = min(max(delay, _INTERVAL) * 2, _BACKOFF_MAX)
+                print(f"[WARN] sync failed, retry in {delay:.0f}s: {exc}",
+                      flush=True)
+
+
+uploader = Uploader()
+
+__all__ = ["BATCH", "enabled", "fetch_run", "pending", "upload_once",
+           "Uploader", "uploader"]
@@ -0,0 +1,69 @@
+"""
+Shared fixtures: every test gets its own events.db under tmp_path.
+
+The pool and the background writer are process-wide, so the fixture
+drains the writer and hands back this thread's connection before the
+DB path moves – the writer thread starts afresh on the new file.
+"""
+from __future__ import annotations
+
+import os
+import pathlib
+import sys
+import tempfile
+
+os.environ.setdefault("TBAG_GPIO_MOCK", "1")          # no gpiod on CI
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import pytest  # noqa: E402
+
+from tbag import config  # noqa: E402
+
+# `tbag.db` initialises DB_FILE on import – not the repo's events.db
+config.DB_FILE = pathlib.Path(tempfile.mkdtemp(prefix="tbag-tests-")) / "events.db"
+
+from tbag import db  # noqa: E402
+
+
+def _detach() -> None:
+    db._writer.close()
+    db.release()
+
+
+@pytest.fixture
+def tbag_db(tmp_path, monkeypatch):
+    """`tbag.db`, pointed at a fresh, initialised DB."""
+    _detach()
+    monkeypatch.setattr(db, "DB_FILE", tmp_path / "events.db")
+    monkeypatch.setattr(db, "LOG_ARCHIVE", tmp_path / "log_archive")
+    monkeypatch.setattr(db, "_DEAD_LETTER", tmp_path / "events_rejected.jsonl")
+    db.init()
+    yield db
+    _detach()
+
+
+@pytest.fixture
+def client(tbag_db):
+    """Flask test client on the fresh DB."""
+    from app import create_app
+    return create_app().test_client()
+
+
+def add_run(sid: str, status: str = "pending", device: str | None = None,
+            ts_created: str = "2026-01-02T08:00:00",
+            ts_finished: str | None = None) -> None:
+    """Insert one `runs` row."""
+    with db.connect() as c:
+        c.execute(
+            """INSERT INTO runs(session_id, project, stack_id, operator,
+                                ts_created, ts_finished, status, device)
+               VALUES(?, 'demo', 'S1', 'op', ?, ?, ?, ?)""",
+            (sid, ts_created, ts_finished, status, device))
+    db.notify_runs_changed()
+
+
+def kinds(sid: str) -> list[str]:
+    """Event kinds of *sid* in write order."""
+    db.flush()
+    return [r[0] for r in db.connect().execute(
+        "SELECT kind FROM events WHERE session_id=? ORDER BY seq", (sid,))]
@@ -0,0 +1,108 @@
+"""Retention: monthly log archives and reading them back (`tbag.db.archive_old`)."""
+import pytest
+
+from conftest import add_run
+from tbag import audit
+
+
+@pytest.fixture
+def small_segments(tbag_db, monkeypatch):
+    """Checkpoint every 4 events, so a few rows close a segment."""
+    monkeypatch.setattr(tbag_db, "CHECKPOINT_EVERY", 4)
+    monkeypatch.setattr(audit, "CHECKPOINT_EVERY", 4)
+    return tbag_db
+
+
+def _old_run(db, sid, n, month="2026-01"):
+    add_run(sid, status="finished", ts_created=f"{month}-02T08:00:00",
+            ts_finished=f"{month}-02T09:00:00")
+    for _ in range(n):
+        db.log("next_pressed", {"session_id": sid})
+    db.flush()
+
+
+def _live(db, table, sid):
+    return db.connect().execute(
+        f"SELECT count(*) FROM {table} WHERE session_id=?", (sid,)).fetchone()[0]
+
+
+def test_old_runs_move_to_their_month_and_read_back(client, small_segments):
+    db = small_segments
+    _old_run(db, "old", 4)
+    assert db.archive_old(days=1) == {"2026-01": 1}
+
+    assert db.archive_months() == ["2026-01"]
+    assert _live(db, "runs", "old") == 0 and _live(db, "events", "old") == 0
+    with db.archive_reader("2026-01") as a:
+        assert a.execute("SELECT status FROM runs").fetchone()[0] == "finished"
+        assert a.execute("SELECT count(*) FROM events").fetchone()[0] == 4
+        assert a.execute("SELECT count(*) FROM session_metrics").fetchone()[0] == 1
+    assert db.connect().execute("SELECT count(*) FROM runs").fetchone()[0] == 0  # not leaked
+
+    r = client.get("/logs/old?archive=2026-01")
+    assert r.status_code == 200
+    assert client.get("/logs/old").status_code == 404
+    assert client.get("/logs?archive=2025-12").status_code == 404
+
+
+def test_archive_merges_into_an_existing_month(small_segments):
+    db = small_segments
+    _old_run(db, "a", 4)
+    db.archive_old(days=1)
+    _old_run(db, "b", 4)
+    assert db.archive_old(days=1) == {"2026-01": 1}
+    with db.archive_reader("2026-01") as a:
+        assert sorted(r[0] for r in a.execute("SELECT session_id FROM runs")) == ["a", "b"]
+
+
+def test_runs_past_the_last_checkpoint_stay(small_segments):
+    db = small_segments
+    _old_run(db, "old", 3)                 # segment not closed yet
+    assert db.archive_old(days=1) == {}
+    assert _live(db, "runs", "old") == 1
+
+
+def test_recent_and_active_runs_stay(small_segments):
+    db = small_segments
+    add_run("new", status="finished", ts_created="2099-01-02T08:00:00",
+            ts_finished="2099-01-02T09:00:00")
+    add_run("busy", status="active")
+    for sid in ("new", "busy", "new", "busy"):
+        db.log("next_pressed", {"session_id": sid})
+    db.flush()
+    assert db.archive_old(days=1) == {}
+
+
+def test_unsynced_station_journal_stays(small_segments, monkeypatch):
+    db = small_segments
+    monkeypatch.setattr(db, "CENTRAL_URL", "http://central")
+    _old_run(db, "old", 4)
+    assert db.archive_old(days=1) == {}
+    with db.connect() as c:                # the server acknowledged it all
+        c.execute("INSERT INTO counters(name, value) SELECT 'sync', max(seq) FROM events")
+    assert db.archive_old(days=1) == {"2026-01": 1}
+
+
+def test_work_file_left_by_a_crash_is_repacked(small_segments):
+    db = small_segments
+    _old_run(db, "a", 4)
+    db.archive_old(days=1)
+    work = db._work_path("2026-01")
+    work.write_bytes(db._unpack("2026-01").read_bytes())   # as if ③ never ran
+    db.archive_path("2026-01").unlink()
+
+    _old_run(db, "b", 4)
+    db.archive_old(days=1)
+    assert not work.exists()
+    with db.archive_reader("2026-01") as a:
+        assert sorted(r[0] for r in a.execute("SELECT session_id FROM runs")) == ["a", "b"]
+
+
+def test_new_events_keep_the_chain_after_archiving_its_head(small_segments):
+    db = small_segments
+    _old_run(db, "old", 4)
+    db.archive_old(days=1)
+    db.log("next_pressed", {"session_id": "later"})
+    db.flush()
+    assert db.connect().execute("SELECT seq FROM events").fetchone()[0] == 5
+    assert audit.verify_all(full=True)["ok"]
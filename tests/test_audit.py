@@ -0,0 +1,84 @@
+"""Hash-chain verification of the events table (`tbag.audit`)."""
+import pytest
+
+from conftest import add_run
+from tbag import audit
+
+
+@pytest.fixture
+def chain(tbag_db, monkeypatch):
+    """Checkpoint every 4 events; 10 events over sessions s1 / s2."""
+    monkeypatch.setattr(tbag_db, "CHECKPOINT_EVERY", 4)
+    monkeypatch.setattr(audit, "CHECKPOINT_EVERY", 4)
+    for i in range(10):
+        tbag_db.log("next_pressed", {"session_id": "s1" if i < 6 else "s2", "i": i})
+    tbag_db.flush()
+    return tbag_db
+
+
+def _tamper(db, sql, *args):
+    c = db.connect()
+    with c:
+        c.execute("DROP TRIGGER events_no_update")
+        c.execute("DROP TRIGGER events_no_delete")
+        c.execute(sql, args)
+
+
+def test_intact_chain_verifies(chain):
+    r = audit.verify_all()
+    assert r["ok"] and r["rows"] == 10 and r["segments"] == 3
+    assert audit.verify_all()["segments"] == 1       # only the open tail again
+    assert audit.verify_all(full=True)["segments"] == 3
+    assert audit.verify_session("s2")["ok"]
+    assert audit.verify_dates("2000-01-01", "2100-01-01")["rows"] == 10
+    assert audit.head()["seq"] == 8
+
+
+@pytest.mark.parametrize("sql, seq, error", [
+    ("UPDATE events SET payload = '{}' WHERE seq = 3", 3, "hash mismatch"),
+    ("DELETE FROM events WHERE seq = 3", 3, "row missing"),
+    ("UPDATE audit_checkpoints SET hash = x'00' WHERE seq_last = 4", 4,
+     "checkpoint mismatch"),
+])
+def test_tampering_is_found(chain, sql, seq, error):
+    _tamper(chain, sql)
+    r = audit.verify_session("s1")
+    assert not r["ok"]
+    assert {"seq": seq, "error": error} in r["problems"]
+    assert not audit.verify_all(full=True)["ok"]
+
+
+@pytest.fixture
+def archived(chain):
+    """s1 (seq 1-6) archived; s2 (seq 7-10) shares the 5-8 segment."""
+    with chain.connect() as c:
+        c.execute("""INSERT INTO runs(session_id, project, stack_id, operator,
+                                      ts_created, ts_finished, status)
+                     VALUES('s1', 'demo', 'S1', 'op', '2026-01-02T08:00:00',
+                            '2026-01-02T09:00:00', 'finished')""")
+    add_run("s2", status="active", ts_created="2026-01-03T08:00:00")
+    for _ in range(2):                     # close segment 9-12 so s1 can go
+        chain.log("next_pressed", {"session_id": "s2"})
+    chain.flush()
+    assert chain.archive_old(days=1) == {"2026-01": 1}
+    return chain
+
+
+def test_partly_archived_segment_is_rehashed(archived):
+    r = audit.verify_session("s2")
+    assert r["ok"] and r["archived"] == 1
+    assert r["rows"] == 8                  # seq 5-12, 5 and 6 from the archive
+    assert audit.verify_all(full=True)["rows"] == 12
+
+
+def test_tampered_live_row_in_archived_segment_is_found(archived):
+    _tamper(archived, "UPDATE events SET payload = '{}' WHERE seq = 7")
+    r = audit.verify_session("s2")
+    assert not r["ok"] and {"seq": 7, "error": "hash mismatch"} in r["problems"]
+
+
+def test_missing_archive_is_not_ok(archived):
+    archived.archive_path("2026-01").unlink()
+    r = audit.verify_session("s2")
+    assert not r["ok"]
+    assert r["problems"][0]["error"] == "archive 2026-01 missing"
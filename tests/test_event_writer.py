@@ -0,0 +1,91 @@
+"""Background event writer (`tbag.db.log`) and the kiosk's finish / abort."""
+import json
+import sqlite3
+
+import pytest
+
+from conftest import add_run, kinds
+
+
+def _row(db, sid, seq_no):
+    ts, kind, _, payload, _, ts_us = db.event_row("next_pressed", {"session_id": sid})
+    return ts, kind, sid, payload, seq_no, ts_us
+
+
+def test_log_is_written_in_order(tbag_db):
+    for i in range(100):
+        tbag_db.log("next_pressed", {"session_id": "s1", "i": i})
+    assert tbag_db.flush()
+    got = [json.loads(r[0])["i"] for r in tbag_db.connect().execute(
+        "SELECT payload FROM events ORDER BY seq")]
+    assert got == list(range(100))
+
+
+def test_sync_log_is_committed_before_it_returns(tbag_db):
+    tbag_db.log("next_pressed", {"session_id": "s1"})
+    assert tbag_db.log("session_end", {"session_id": "s1"}, sync=True)
+    # no flush(): the row travelled with its marker
+    assert [r[0] for r in tbag_db.connect().execute(
+        "SELECT kind FROM events ORDER BY seq")] == ["next_pressed", "session_end"]
+    assert tbag_db.connect().execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_refused_row_is_dead_lettered_not_blocking(tbag_db):
+    w = tbag_db._writer
+    w.put(_row(tbag_db, "s1", 1))
+    w.put(_row(tbag_db, "s1", 1))        # duplicate (session_id, seq_no)
+    w.put(_row(tbag_db, "s1", 2))
+    assert tbag_db.flush() is False       # one row did not make it
+
+    assert [r[0] for r in tbag_db.connect().execute(
+        "SELECT seq_no FROM events ORDER BY seq")] == [1, 2]
+    lines = tbag_db._DEAD_LETTER.read_text().splitlines()
+    assert len(lines) == 1 and "UNIQUE" in json.loads(lines[0])["error"]
+    assert tbag_db.flush() is True        # later flushes are clean again
+
+
+def test_finish_is_idempotent(client, tbag_db):
+    add_run("s1", status="active", device="local-pi")
+    for _ in range(3):                    # kiosk retry + summary page
+        r = client.post("/api/progress", json={"session_id": "s1", "action": "finish"})
+        assert r.status_code == 200
+    assert kinds("s1") == ["session_end"]
+    m = tbag_db.connect().execute(
+        "SELECT outcome FROM session_metrics WHERE session_id='s1'").fetchone()
+    assert m[0] == "finished"
+
+    r = client.post("/api/progress", json={"session_id": "s1", "action": "abort"})
+    assert r.status_code == 409
+
+
+def test_failed_finish_leaves_run_open_for_retry(client, tbag_db, monkeypatch):
+    from tbag.blueprints import kiosk
+    add_run("s1", status="active", device="local-pi")
+
+    append_events = kiosk.append_events
+
+    def locked(*a, **k):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(kiosk, "append_events", locked)
+    r = client.post("/api/progress", json={"session_id": "s1", "action": "abort", "step": 3})
+    assert r.status_code == 503
+    assert tbag_db.connect().execute(
+        "SELECT status FROM runs WHERE session_id='s1'").fetchone()[0] == "active"
+
+    monkeypatch.setattr(kiosk, "append_events", append_events)
+    r = client.post("/api/progress", json={"session_id": "s1", "action": "abort", "step": 3})
+    assert r.status_code == 200
+    assert kinds("s1") == ["session_abort"]
+    assert tbag_db.connect().execute(
+        "SELECT status, interrupted_at FROM runs").fetchone()[:] == ("aborted", 3)
+
+
+@pytest.mark.parametrize("body", [
+    {"action": "finish"},
+    {"session_id": "s1"},
+    {"session_id": "s1", "action": "bogus"},
+    ["s1"],
+])
+def test_malformed_progress_is_400(client, body):
+    add_run("s1", status="active", device="local-pi")
+    assert client.post("/api/progress", json=body).status_code == 400
@@ -0,0 +1,56 @@
+"""Versioned run feed of the admin sessions table (`/admin/sessions/json`)."""
+from conftest import add_run
+
+
+def _feed(client, **args):
+    return client.get("/admin/sessions/json", query_string=args)
+
+
+def test_unchanged_feed_is_304(client):
+    add_run("a")
+    v = _feed(client).json["version"]
+    assert _feed(client, since=v).status_code == 304
+    r = client.get("/admin/sessions/json", query_string={"since": 0},
+                   headers={"If-None-Match": f'"runs-{v}"'})
+    assert r.status_code == 304
+
+
+def test_delta_has_changed_rows_and_deletions(client, tbag_db):
+    add_run("a")
+    add_run("b")
+    v = _feed(client).json["version"]
+
+    add_run("c")
+    with tbag_db.connect() as c:
+        c.execute("UPDATE runs SET status='active' WHERE session_id='a'")
+    assert client.post("/admin/sessions/b/delete").status_code == 302
+
+    d = _feed(client, since=v).json
+    assert sorted(r["session_id"] for r in d["rows"]) == ["a", "c"]
+    assert d["deleted"] == ["b"] and not d["reset"]
+    assert d["version"] > v
+    assert _feed(client, since=d["version"]).status_code == 304
+
+
+def test_first_page_and_paging(client):
+    for i in range(5):
+        add_run(f"r{i}", ts_created=f"2026-01-02T08:00:0{i}")
+    p1 = _feed(client, limit=2).json
+    assert [r["session_id"] for r in p1["rows"]] == ["r4", "r3"]
+    p2 = _feed(client, limit=2, before=p1["next"]).json
+    assert [r["session_id"] for r in p2["rows"]] == ["r2", "r1"]
+    assert _feed(client, limit=10**6).json["next"] is None     # clamped, one page
+
+
+def test_pruned_tombstones_force_reset(client, tbag_db):
+    add_run("a")
+    add_run("b")
+    v = _feed(client).json["version"]
+    client.post("/admin/sessions/b/delete")
+    tbag_db.prune_tombstones()            # marks …
+    add_run("c")
+    tbag_db.prune_tombstones()            # … then drops b's tombstone
+
+    d = _feed(client, since=v).json
+    assert d["reset"] and d["deleted"] == []
+    assert sorted(r["session_id"] for r in d["rows"]) == ["a", "c"]
@@ -0,0 +1,70 @@
+"""Fleet mode: station tokens, run ownership and dispatch (`tbag.fleet`)."""
+import pytest
+
+from conftest import add_run, kinds
+from tbag import fleet
+
+
+@pytest.fixture
+def stations(client, monkeypatch):
+    """Two registered stations → {device_id: auth headers}."""
+    monkeypatch.setattr(fleet, "dispatcher", fleet.Dispatcher())
+    return {d: {"Authorization": f"Bearer {fleet.register(d)}"} for d in ("stA", "stB")}
+
+
+def test_unknown_or_replaced_token_is_401(client, stations):
+    assert client.post("/api/fleet/claim?wait=0").status_code == 401
+    assert client.post("/api/fleet/claim?wait=0",
+                       headers={"Authorization": "Bearer nope"}).status_code == 401
+    old = stations["stA"]
+    fleet.issue_token("stA")
+    assert client.post("/api/fleet/claim?wait=0", headers=old).status_code == 401
+
+
+def test_claim_hands_out_runs_and_204_when_idle(client, stations):
+    r = client.post("/api/fleet/claim?wait=0", headers=stations["stA"])
+    assert r.status_code == 204 and r.headers["Retry-After"] == "5"
+
+    add_run("s1", device="stB")
+    add_run("s2")                          # unassigned
+    r = client.post("/api/fleet/claim?wait=0", headers=stations["stB"])
+    assert r.json["session"]["session_id"] == "s1"
+    r = client.post("/api/fleet/claim?wait=0", headers=stations["stB"])
+    assert r.json["session"]["session_id"] == "s1"      # still its active run
+    r = client.post("/api/fleet/claim?wait=0", headers=stations["stA"])
+    assert r.json["session"]["session_id"] == "s2"
+
+
+def test_only_the_owner_reports_progress(client, stations, tbag_db):
+    add_run("s1", status="active", device="stA")
+    body = {"session_id": "s1", "action": "finish"}
+    assert client.post("/api/fleet/progress", json=body,
+                       headers=stations["stB"]).status_code == 409
+    for _ in range(2):                     # a lost reply is retried
+        assert client.post("/api/fleet/progress", json=body,
+                           headers=stations["stA"]).status_code == 200
+    assert kinds("s1") == ["session_end"]
+    assert client.post("/api/fleet/progress", json={"session_id": "s1"},
+                       headers=stations["stA"]).status_code == 400
+
+
+def test_targeted_runs_are_matched_before_unassigned(tbag_db):
+    add_run("any1", device="any", ts_created="2026-01-02T08:00:00")
+    add_run("forA", device="stA", ts_created="2026-01-02T08:00:01")
+    d = fleet.Dispatcher()
+    a, b = fleet._Waiter("stA"), fleet._Waiter("stB")
+    d._waiting = {"stA": a, "stB": b}
+    d._served = {"stA": 0.0, "stB": 1.0}   # stA waited longest
+    d.dispatch()
+    assert a.run["session_id"] == "forA"
+    assert b.run["session_id"] == "any1"
+
+
+def test_claims_beyond_the_park_limit_do_not_wait(tbag_db):
+    d = fleet.Dispatcher()
+    run, parked = d.claim("stA", timeout=5, park_max=0)
+    assert (run, parked) == (None, False)
+
+
+def test_target_list_has_only_token_holders(client, stations):
+    assert client.get("/admin/devices/json").json == ["any", "local-pi", "stA", "stB"]
@@ -0,0 +1,89 @@
+"""Schema migrations of DBs written by older releases (`tbag.db._migrate`)."""
+import sqlite3
+
+from tbag import audit, db
+
+LEGACY = [
+    ("2025-01-01T10:01:00",
+     'next_pressed::{"session_id": "s1", "component": "a", "position": "P1"}'),
+    ("2025-01-01T10:02:30",
+     'next_pressed::{"session_id": "s1", "component": "b", "position": "P2"}'),
+    ("2025-01-01T10:10:00", 'session_end::{"session_id": "s1"}'),
+    ("2025-01-01T10:10:00", "weird"),
+]
+
+
+def _legacy(path):
+    c = sqlite3.connect(path)
+    c.execute("CREATE TABLE events(ts TEXT, event TEXT)")
+    c.executemany("INSERT INTO events VALUES(?, ?)", LEGACY)
+    c.commit()
+    c.close()
+
+
+def _init(path, monkeypatch):
+    db._writer.close()
+    db.release()
+    monkeypatch.setattr(db, "DB_FILE", path)
+    db.init()
+    return db.connect()
+
+
+def test_legacy_events_are_split_and_chained(tmp_path, monkeypatch):
+    _legacy(tmp_path / "old.db")
+    c = _init(tmp_path / "old.db", monkeypatch)
+
+    assert c.execute("PRAGMA user_version").fetchone()[0] == db._SCHEMA_VERSION
+    rows = c.execute("SELECT kind, session_id, json_extract(payload, '$.position'), "
+                     "event, seq FROM events ORDER BY seq").fetchall()
+    assert [tuple(r) for r in rows] == [
+        ("next_pressed", "s1", "P1", None, 1),
+        ("next_pressed", "s1", "P2", None, 2),
+        ("session_end", "s1", None, None, 3),
+        ("weird", None, None, None, 4),
+    ]
+    m = c.execute("SELECT steps, total_s, outcome FROM session_metrics "
+                  "WHERE session_id='s1'").fetchone()
+    assert tuple(m) == (2, 540, "finished")
+    assert audit.verify_all(full=True)["ok"]
+
+
+def test_v10_clears_blob_left_by_older_v1(tmp_path, monkeypatch):
+    _legacy(tmp_path / "old.db")
+    c = _init(tmp_path / "old.db", monkeypatch)
+    with c:                               # as an older release left it
+        c.execute("DROP TRIGGER events_no_update")
+        c.execute("UPDATE events SET event = kind")
+        c.execute("PRAGMA user_version = 9")
+    c = _init(tmp_path / "old.db", monkeypatch)
+
+    assert c.execute("SELECT count(event) FROM events").fetchone()[0] == 0
+    try:                                  # append-only again
+        with c:
+            c.execute("UPDATE events SET kind='x'")
+    except sqlite3.IntegrityError:
+        pass
+    else:
+        raise AssertionError("events_no_update missing after v10")
+
+
+def test_v9_moves_sync_mark_from_rowid_to_seq(tmp_path, monkeypatch):
+    c = _init(tmp_path / "t.db", monkeypatch)
+    with c:
+        c.execute("DROP TRIGGER events_no_update")
+        db.append_events(c, [db.event_row("next_pressed", {"session_id": "s"})
+                             for _ in range(3)])
+        c.execute("UPDATE events SET seq = seq + 10")   # seq ≠ rowid
+        c.execute("INSERT INTO counters(name, value) VALUES('sync', 2)")
+        c.execute("PRAGMA user_version = 8")
+    c = _init(tmp_path / "t.db", monkeypatch)
+    assert c.execute("SELECT value FROM counters WHERE name='sync'").fetchone()[0] == 12
+
+
+def test_init_is_idempotent(tbag_db):
+    tbag_db.log("next_pressed", {"session_id": "s"})
+    tbag_db.flush()
+    tbag_db.init()
+    c = tbag_db.connect()
+    assert c.execute("SELECT count(*) FROM events").fetchone()[0] == 1
+    assert c.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
@@ -0,0 +1,96 @@
+"""Station journal upload (`tbag.sync`) and its server side (`fleet.ingest`)."""
+import io
+import json
+
+import pytest
+
+from conftest import add_run, kinds
+from tbag import fleet, sync
+
+
+def _entries(sid, n, end=False):
+    out = [{"session_id": sid, "seq_no": i, "ts": f"2026-01-02T08:00:0{i}",
+            "kind": "next_pressed", "payload": {"session_id": sid}}
+           for i in range(1, n + 1)]
+    if end:
+        out.append({"session_id": sid, "seq_no": n + 1, "ts": "2026-01-02T08:01:00",
+                    "kind": "session_end", "payload": {"session_id": sid}})
+    return out
+
+
+def test_ingest_is_idempotent_and_owner_only(tbag_db):
+    fleet.register("stA")
+    add_run("s1", status="active", device="stA")
+    add_run("s2", status="active", device="stB")
+
+    batch = _entries("s1", 3, end=True) + _entries("s2", 1)
+    assert fleet.ingest("stA", batch) == {"stored": 4, "rejected": 1}
+    assert fleet.ingest("stA", batch) == {"stored": 0, "rejected": 1}   # re-sent
+    assert kinds("s1") == ["next_pressed"] * 3 + ["session_end"]
+    assert kinds("s2") == []
+    assert tbag_db.connect().execute(
+        "SELECT status FROM runs WHERE session_id='s1'").fetchone()[0] == "finished"
+
+
+def test_sync_endpoint_rejects_malformed_batches(client):
+    h = {"Authorization": f"Bearer {fleet.register('stA')}"}
+    assert client.post("/api/fleet/sync", json={"entries": "x"}, headers=h).status_code == 400
+    assert client.post("/api/fleet/sync", json={"entries": [{"foo": 1}]},
+                       headers=h).status_code == 400
+
+
+class _Reply(io.BytesIO):
+    status = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def station(tbag_db, monkeypatch):
+    """Journal numbering on; `_post` captured → list of uploaded batches."""
+    monkeypatch.setattr(tbag_db, "CENTRAL_URL", "http://central")
+    sent = []
+
+    def post(path, body, timeout):
+        sent.append([(e["session_id"], e["seq_no"]) for e in body["entries"]])
+        return _Reply(json.dumps({"stored": len(body["entries"]), "rejected": 0}).encode())
+    monkeypatch.setattr(sync, "_post", post)
+    return sent
+
+
+def test_upload_moves_the_mark_only_when_acknowledged(tbag_db, station, monkeypatch):
+    for sid in ("s1", "s1", "s2"):
+        tbag_db.log("next_pressed", {"session_id": sid})
+    tbag_db.log("idle_tick")                   # no session: not journalled
+    tbag_db.flush()
+    assert sync.pending() == 3
+
+    def down(*a):
+        raise OSError("link down")
+    monkeypatch.setattr(sync, "_post", down)
+    with pytest.raises(OSError):
+        sync.upload_once()
+    assert sync.pending() == 3                 # nothing acknowledged
+
+    monkeypatch.setattr(sync, "_post", lambda *a: _Reply(b'{"stored": 3, "rejected": 0}'))
+    assert sync.upload_once() == 3
+    assert sync.pending() == 0 and sync.upload_once() == 0
+
+
+def test_upload_cursor_is_seq(tbag_db, station):
+    for _ in range(3):
+        tbag_db.log("next_pressed", {"session_id": "s1"})
+    tbag_db.flush()
+    sync.upload_once()
+    mark = tbag_db.connect().execute(
+        "SELECT value FROM counters WHERE name='sync'").fetchone()[0]
+    assert mark == tbag_db.connect().execute("SELECT max(seq) FROM events").fetchone()[0]
+
+    tbag_db.log("next_pressed", {"session_id": "s1"})
+    tbag_db.flush()
+    assert sync.upload_once() == 1
+    assert station == [[("s1", 1), ("s1", 2), ("s1", 3)], [("s1", 4)]]
@@ -1,2 +1,2 @@
-# tiny one-liner wrapper
-from app import app  # pragma: no cover
+# tiny one-liner wrapper – gunicorn entry point (gunicorn wsgi:app)
+from app import create_app; app = create_app()  # pragma: no cover